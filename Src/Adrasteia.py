@@ -19,10 +19,31 @@
     
     See changelog.txt in top level directory for latest bugs and changes
 """
+import sys
+import time
+from array import array
+from atexit import register
+from heapq import heappush,heapreplace
 from marshal import load,dump
 from math import floor
-from operator import itemgetter
+from mmap import mmap,ACCESS_READ
+from operator import attrgetter
+from os import remove,rename,stat
+from os.path import exists
+from random import Random
 from string import split
+from zlib import crc32
+#multiprocessing is only available from python 2.6, without
+#it indexing is always done in a single process
+try:
+    from multiprocessing import Pool,cpu_count
+except ImportError:
+    Pool = None
+#numpy is only needed for the numpy matching engine
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from agrepy import *
 from Align_score import *
@@ -31,6 +52,14 @@ from Bitwise import *
 #The maximum p-values to report (scores with p-values above this will
 #not be reported back to the user)
 PVAL_THRESHOLD = 0.05
+#The size of the blocks the database is read in when it is scanned
+#without an index
+SCAN_BLOCK_SIZE = 4194304
+#The number of compiled matchers that are kept for queries that are repeated
+MATCHER_CACHE_SIZE = 64
+#The number of random alignments scored for each length when the background
+#profile of a database is created
+PROFILE_SAMPLES = 1000
 
 #-----Class that holds information about a FASTA database-------------------#
 class FastaDatabase:
@@ -48,6 +77,8 @@ class FastaDatabase:
     p-value indicating how likely it is to not to be just a fluke. The results
     are ranked from most to least likely by p-value, and output to the user.
     """
+    #These three are the defaults for a new index, an index keeps the
+    #ones it was created with (see Statistics/Tuning.py to choose them)
     #Length of the code words
     WORD_WIDTH = 1024
     #Number of bits to set for the encoding of an attribute
@@ -55,24 +86,45 @@ class FastaDatabase:
     #Each line of the database will be broken into pieces of these sizes 
     #for preprocessing.
     PIECE_SIZES = [2,3]
-    #Table of piece sizes that most efficently fit each segment size
-    SEGMENTS = [[],[],[2],[3],[2,2],[3,2],[3,3],[3,2,2],[3,3,2],[3,3,3],\
-                [3,3,2,2],[3,3,3,2],[3,3,3,3],[3,3,3,2,2],[3,3,3,3,2],\
-                [3,3,3,3,3],[3,3,3,3,2,2],[3,3,3,3,3,2],[3,3,3,3,3,3],\
-                [3,3,3,3,3,2,2],[3,3,3,3,3,3,2],[3,3,3,3,3,3,3],\
-                [3,3,3,3,3,3,2,2],[3,3,3,3,3,3,3,2],[3,3,3,3,3,3,3,3],\
-                [3,3,3,3,3,3,3,2,2],[3,3,3,3,3,3,3,3,2],\
-                [3,3,3,3,3,3,3,3,3],[3,3,3,3,3,3,3,3,2,2],\
-                [3,3,3,3,3,3,3,3,3,2],[3,3,3,3,3,3,3,3,3,3]]
     #Length of a line of data in this database
     LINE_LENGTH = 60
-    #For efficency set a max bound on the size of any query protein
-    MAX_QUERY_LENGTH = 60
+    #When indexing with several processes the database is split into this
+    #many shards per process, so that the processes finish at similar times
+    SHARDS_PER_PROCESS = 4
+    #Version of the format of the index files, an index in
+    #any other format is recreated when the database is opened
+    INDEX_VERSION = 7
+    #Number of candidate records fetched from the bitwise module at a time
+    DROP_CHUNK_SIZE = 4096
+    #Engines that can be used to find the candidate records for a query
+    ENGINES = ["bitwise","numpy","qgram"]
+    #Ways the residues of each record can be kept in a sequence store
+    STORES = ["plain","packed"]
 
-    #---------------------------------------------------#
-    #Constructor. Sets the instance to the given database
-    #---------------------------------------------------#
-    def __init__(self,db_file_name):
+    #-----------------------------------------------------------------#
+    #Constructor. Sets the instance to the given database. If the database
+    #has to be indexed this is split between the given number of processes
+    #(all available cores if processes is None), as are any searches of the
+    #database that cannot use the index. The index is memory mapped
+    #and so is read from disk as it is used, unless prefetch is set in which
+    #case it is read in the background straight away. The engine is used to
+    #find the candidate records for queries, either the bitwise module,
+    #numpy working on arrays mapped over the slice files, or an inverted
+    #index of the positions of the pieces of every record (qgram) kept
+    #next to the index. If store is given the candidates are read from a
+    #sequence store kept next to the index, either as plain text or
+    #packed into 5 bits per residue. If cache_size
+    #is given the results of that many of the most recent queries are kept,
+    #and also kept in a .cache file next to the index if persist_cache is set.
+    #Matches are scored against the background profile of the database if
+    #it has one, which is created first if profile is set. The index is
+    #created with the word width, number of set bits and piece sizes of
+    #index_config if it is given, and otherwise with those of the existing
+    #index (or the defaults if there is none)
+    #-----------------------------------------------------------------#
+    def __init__(self,db_file_name,processes=1,prefetch=0,engine="bitwise",
+                 store=None,cache_size=0,persist_cache=0,profile=0,
+                 index_config=None):
         
         #-------------
         #1. Initialize
@@ -82,6 +134,24 @@ class FastaDatabase:
             error = "Error: Invalid type for database name"
             print error
             return error
+        self.engine = engine
+        #the number of processes to index and scan the database with
+        self.processes = processes
+        #the slice files as numpy arrays, when using the numpy engine
+        self.slice_arrays = None
+        #the sequence store the candidate records are read from, if any
+        self.store = None
+        #the inverted index of the pieces of the records, when using the
+        #qgram engine
+        self.grams = None
+        #the background profile the matches are scored against, if any
+        self.profile = None
+        #the results of recent queries, if they are kept
+        self.result_cache = None
+        #the piece sizes that fit each segment size, as they are needed
+        self.segment_pieces = {}
+        #the size, modification time and checksum of the indexed database
+        self.fingerprint = None
         #in memory index of the position of each record header
         self.header_index = {}
         #store the name of our database
@@ -90,31 +160,66 @@ class FastaDatabase:
         self.index_name = db_file_name[0:-6]+".idx"
         #the name of the additional slices file
         self.slice_file_name = db_file_name[0:-6]+".slices"
-        #initialise the bitwise module
-        initialize(self.WORD_WIDTH,self.NUM_SET_BITS)
+        #the index of this database in the bitwise module
+        self.db = None
+        if index_config is not None:
+            index_config = checkIndexConfig(index_config)
+        if engine not in self.ENGINES:
+            error = "Error: Unknown matching engine "+str(engine)
+            raise Exception(error)
+        if engine=="numpy" and numpy is None:
+            error = "Error: The numpy engine needs numpy to be installed"
+            raise Exception(error)
+        if engine=="qgram" and index_config is not None and \
+           index_config[2][-1]>GramIndex.MAX_GRAM_SIZE:
+            error = "Error: The qgram engine cannot index pieces longer than "+\
+                    str(GramIndex.MAX_GRAM_SIZE)
+            raise Exception(error)
+        if store is not None and store not in self.STORES:
+            error = "Error: Unknown sequence store "+str(store)
+            raise Exception(error)
         
         #---------------------------
         #2. Unmarshal data from disk
         #---------------------------
-        #check if there is a pre-existing index for
-        #this db, and if so use the data in there
+        #check if there is a pre-existing index for this db, and if
+        #it is still up to date (or can be brought up to date) use it
         try:
             file_index = load(open(self.index_name, "rb"))
-            #There is an index, so load data from it
-            #The data is in the format {record_segments,
-            #bit_string_elms,header_index}
-            setDBInfo(file_index[0],file_index[1])
-            self.header_index = file_index[2]
-            loadBitSlices(0,len(self.PIECE_SIZES)-1,len(self.slice_file_name),
-                                              self.slice_file_name+str(0))
-            print "Sucessfully loaded index for "+db_file_name
-            return None
+            file_index = self.checkIndex(file_index,index_config)
         except IOError:
+            file_index = None
             print "No pre-existing index, creating one now."
             print "Please be patient as this takes about one"
             print "minute per Mb. This creates .idx and .slices"
             print "files next to the database so that index"
             print "creation can be skipped for future sessions."
+        if index_config is not None:
+            self.setIndexConfig(index_config)
+        #initialise the index of this database in the bitwise module
+        self.db = initialize(self.WORD_WIDTH,self.NUM_SET_BITS,len(self.PIECE_SIZES))
+        if file_index is not None:
+            #The data is in the format {record_segments,bit_string_elms,
+            #header_index,index_version,fingerprint,index_config,byte_order}
+            setDBInfo(self.db,file_index[0],file_index[1])
+            self.header_index = file_index[2]
+            loadBitSlices(self.db,0,len(self.PIECE_SIZES)-1,len(self.slice_file_name),
+                                    self.slice_file_name+str(0),prefetch)
+            if engine=="numpy":
+                self.mapSliceArrays(file_index[0],file_index[1])
+            if engine=="qgram":
+                self.openGramIndex(file_index[4],prefetch)
+            if store is not None:
+                self.openStore(store,file_index[4])
+            self.fingerprint = file_index[4]
+            self.profile = openProfile(db_file_name,profile,processes=processes)
+            if cache_size>0:
+                self.openResultCache(cache_size,persist_cache)
+            print "Sucessfully loaded index for "+db_file_name
+            return None
+        #record what the database looks like before it is indexed, so
+        #that any later changes to it can be detected
+        fingerprint = fingerprintDatabase(db_file_name)
         try:
             db_file = open(db_file_name, 'r')
         except IOError:
@@ -124,57 +229,158 @@ class FastaDatabase:
         #-------------------
         #3. Process Database
         #-------------------
-        #put frequently accessed globals into local vars
-        header_index = self.header_index
-        bit_string_elms=0
-        #Number of different pieces we are going to encode
-        num_pieces = len(self.PIECE_SIZES)
-        for i in xrange(num_pieces):
-            piece_size = self.PIECE_SIZES[i]
-            #db index pointer
-            file_index_pointer=-1
-            db_file.seek(0)
-            #find the location of the beginning of the line
-            position = db_file.tell()
-            while 1: 
-                #read in each line individually, rather than the read ahead 
-                #in 'for line in db_file' - while this method is slower it 
-                #allows us to record the position of each record in an 
-                #index into the db
-                line=db_file.readline()
-                if not line:
-                    break
-                #if we have a database body section, index it, and break it 
-                #into pieces which are encoded and stored
-                if line[0] != '>': 
-                    length = len(line)-piece_size              
-                    for j in xrange(length):
-                        encodeDBPiece(line[j:j+piece_size])               
-                #Otherwise it is a header, so store its info
-                else:
-                    file_index_pointer +=1
-                    header_index[file_index_pointer] = position
-                    allocateRecord()
-                #before moving on to next line, get its starting position
-                position = db_file.tell()
-            #end db loop 
+        piece_sizes = self.PIECE_SIZES
+        if processes is None and Pool is not None:
+            processes = cpu_count()
+        if processes>1 and Pool is not None:
+            #find the records so they can be split between worker processes
+            header_positions = findRecordHeaders(db_file)
+            db_file.close()
+            bit_string_elms = len(header_positions)
+            record_segments = self.buildShards(header_positions,processes)
+            setDBInfo(self.db,record_segments,bit_string_elms)
+        else:
+            header_positions = encodeRecords(self.db,db_file,None,piece_sizes)
+            #Finished indexing so close db file
+            db_file.close()
             #do a final bit slice
-            bitSlice() 
+            bitSlice(self.db)
             #Marshal info about this run
-            print "    Writing index for run ",i
-            writeBitSlices(self.slice_file_name+str(i))
-            print "    Done"
-            #reset bitwise for next run if there is one
-            if i+1<num_pieces:
-                bit_string_elms=resetDBInfo()     
-        #Finished indexing so close db file
-        db_file.close()
+            print "    Writing slice files"
+            writeBitSlices(self.db,0,len(piece_sizes)-1,len(self.slice_file_name),
+                                              self.slice_file_name+str(0))
+            #set up Bitwise with correct info to begin matching
+            print "    Resetting Database Info"
+            bit_string_elms = len(header_positions)
+            record_segments = setDBInfo(self.db,0,bit_string_elms)
         #Marshal index to index file for this database
-        #set up Bitwise with correct info to begin matching
-        print "    Resetting Database Info"
-        record_segments = setDBInfo(0,bit_string_elms)
+        header_index = self.header_index
+        for i in xrange(bit_string_elms):
+            header_index[i] = header_positions[i]
+        self.writeIndex([record_segments,bit_string_elms,header_index,
+                         self.INDEX_VERSION,fingerprint,self.indexConfig(),
+                         sys.byteorder])
+        #Also load slices into memory
+        print "    Loading Slices into Memory"
+        loadBitSlices(self.db,0,len(self.PIECE_SIZES)-1,len(self.slice_file_name),
+                                self.slice_file_name+str(0),prefetch)
+        if engine=="numpy":
+            self.mapSliceArrays(record_segments,bit_string_elms)
+        if engine=="qgram":
+            self.openGramIndex(fingerprint,prefetch)
+        if store is not None:
+            self.openStore(store,fingerprint)
+        self.fingerprint = fingerprint
+        self.profile = openProfile(db_file_name,profile,processes=processes)
+        if cache_size>0:
+            self.openResultCache(cache_size,persist_cache)
+        print "Sucessfully created index for "+db_file_name
+
+    #--------------------------------------------------------------------#
+    #Checks that an index loaded from disk is in the current format and was
+    #created from the database as it is now, and with index_config if that
+    #is given. If records have been appended to the database since then the
+    #index is extended to cover them. Returns the index to use, or None if
+    #the index needs to be created again. The configuration of an index in
+    #the current format is kept even if it is created again. The slice files
+    #are in the byte order of the machine that created them, so an index from
+    #a machine with a different byte order cannot be used
+    #--------------------------------------------------------------------#
+    def checkIndex(self,file_index,index_config=None):
+        if len(file_index)<7 or file_index[3]!=self.INDEX_VERSION:
+            print "The pre-existing index is in an old format, recreating it now."
+            return None
+        if file_index[6]!=sys.byteorder:
+            error = "Error: The index was created on a "+file_index[6]+\
+                    " endian machine and cannot be used on this "+\
+                    sys.byteorder+" endian one, delete "+self.index_name+\
+                    " to recreate it"
+            raise Exception(error)
+        if index_config is not None and index_config!=file_index[5]:
+            print "The pre-existing index has a different configuration, recreating it now."
+            return None
+        self.setIndexConfig(file_index[5])
+        size,mtime,checksum = file_index[4]
+        try:
+            db_stat = stat(self.database_name)
+        except OSError:
+            error = "Error: Cannot open specified db file"
+            raise Exception(error)
+        if db_stat.st_size==size and db_stat.st_mtime==mtime:
+            return file_index
+        #the database has been touched, so check whether the part of it that
+        #was indexed is unchanged, in which case only the rest is indexed
+        if db_stat.st_size>=size:
+            try:
+                db_file = open(self.database_name, 'rb')
+            except IOError:
+                error = "Error: Cannot open specified db file"
+                raise Exception(error)
+            if checksumFile(db_file,size,0)==checksum:
+                checksum = checksumFile(db_file,None,checksum)
+                db_file.close()
+                fingerprint = [db_stat.st_size,db_stat.st_mtime,checksum]
+                if db_stat.st_size==size:
+                    file_index[4] = fingerprint
+                    self.writeIndex(file_index)
+                    return file_index
+                print "Records have been added to the database, updating index."
+                return self.appendToIndex(file_index,fingerprint)
+            db_file.close()
+        print "The database has changed since it was indexed, recreating index."
+        return None
+
+    #----------------------------------------------------------------------#
+    #Extends an index to cover records appended to the database since it was
+    #created. Only the new records are indexed, along with the records in the
+    #last (possibly partly full) record segment of the index, as the last of
+    #these may also have been extended. Returns the updated index
+    #----------------------------------------------------------------------#
+    def appendToIndex(self,file_index,fingerprint):
+        record_segments,bit_string_elms,header_index = file_index[0:3]
+        slice_word = array('I').itemsize*8
+        if bit_string_elms>0:
+            first = ((bit_string_elms-1)/slice_word)*slice_word
+            start = header_index[first]
+        else:
+            first = start = 0
+        tail_name = self.slice_file_name[0:-7]+".tail.slices"
+        tail_segments,header_positions = buildShard((self.database_name,start,
+                                None,tail_name,self.WORD_WIDTH,
+                                self.NUM_SET_BITS,self.PIECE_SIZES))
+        print "    Joining new records to slice files"
+        keep_segments = first/slice_word
+        self.joinSliceFiles([(self.slice_file_name,keep_segments,record_segments,0),
+                             (tail_name,tail_segments,tail_segments,1)])
+        for i in xrange(len(header_positions)):
+            header_index[first+i] = header_positions[i]
+        file_index = [keep_segments+tail_segments,first+len(header_positions),
+                      header_index,self.INDEX_VERSION,fingerprint,
+                      self.indexConfig(),sys.byteorder]
+        self.writeIndex(file_index)
+        return file_index
+
+    #-------------------------------------------------------------------#
+    #Returns the configuration of the index, as [word width, number of set
+    #bits, piece sizes]
+    #-------------------------------------------------------------------#
+    def indexConfig(self):
+        return [self.WORD_WIDTH,self.NUM_SET_BITS,self.PIECE_SIZES]
+
+    #----------------------------------------------------------------#
+    #Use the given configuration for the index of this database rather
+    #than the defaults of the class
+    #----------------------------------------------------------------#
+    def setIndexConfig(self,index_config):
+        self.WORD_WIDTH,self.NUM_SET_BITS,self.PIECE_SIZES = index_config
+        #the pieces that fit each segment size depend on the piece sizes
+        self.segment_pieces = {}
+
+    #--------------------------------#
+    #Marshal an index to the index file
+    #--------------------------------#
+    def writeIndex(self,file_index):
         print "    Writing Header Index file"
-        file_index = [record_segments,bit_string_elms,header_index]
         try:
             index_file = open(self.index_name,"wb")
             dump(file_index,index_file)  
@@ -182,16 +388,353 @@ class FastaDatabase:
         except IOError:
             error = "Error: Cannot save index to file"
             raise Exception(error) 
-        #Also load slices into memory
-        print "    Loading Slices into Memory"
-        loadBitSlices(0,len(self.PIECE_SIZES)-1,len(self.slice_file_name),
-                                              self.slice_file_name+str(0))
-        print "Sucessfully created index for "+db_file_name
+
+    #-----------------------------------------------------------------------#
+    #Split the records of the database between a number of worker processes,
+    #each of which indexes its share into separate slice files, then join
+    #these into the slice files for the database. Returns the number of
+    #record segments in the joined slice files
+    #-----------------------------------------------------------------------#
+    def buildShards(self,header_positions,processes):
+        num_records = len(header_positions)
+        #every shard must hold a whole number of slice words worth of records
+        #(except the last) so that the rows of the slice files can be joined
+        slice_word = array('I').itemsize*8
+        shard_size = (max(num_records,1)-1)/(processes*self.SHARDS_PER_PROCESS)+1
+        shard_size = ((shard_size-1)/slice_word+1)*slice_word
+        shards = []
+        shard_prefix = self.slice_file_name[0:-7]+".shard"
+        #the first shard starts at the beginning of the file as it would
+        #for a single process (this also covers an empty database)
+        start = 0
+        for first in xrange(0,max(num_records,1),shard_size):
+            last = first+shard_size
+            if last<num_records:
+                end = header_positions[last]
+            else:
+                end = None
+            shards.append((self.database_name,start,end,
+                           "%s%i.slices"%(shard_prefix,len(shards)),
+                           self.WORD_WIDTH,self.NUM_SET_BITS,self.PIECE_SIZES))
+            start = end
+        print "    Indexing %i shards using %i processes"%(len(shards),processes)
+        pool = Pool(processes)
+        shard_results = pool.map(buildShard,shards)
+        pool.close()
+        pool.join()
+        print "    Joining shard slice files"
+        parts = []
+        record_segments = 0
+        for i in xrange(len(shards)):
+            shard_segments = shard_results[i][0]
+            parts.append((shards[i][3],shard_segments,shard_segments,1))
+            record_segments += shard_segments
+        self.joinSliceFiles(parts)
+        return record_segments
+
+    #-----------------------------------------------------------------------#
+    #Join several sets of slice files into the slice files for the database.
+    #Each part is given as (slice file name, number of words to take from each
+    #row, number of words in each row, whether to delete the part's files).
+    #As the slice files are stored by bit, the rows of each part for every
+    #bit are joined together in turn
+    #-----------------------------------------------------------------------#
+    def joinSliceFiles(self,parts):
+        item_size = array('I').itemsize
+        for i in xrange(len(self.PIECE_SIZES)):
+            slice_file_name = self.slice_file_name+str(i)
+            try:
+                slice_file = open(slice_file_name+".tmp","wb")
+                part_files = []
+                for part in parts:
+                    part_files.append(open(part[0]+str(i),"rb"))
+                for j in xrange(self.WORD_WIDTH):
+                    for k in xrange(len(parts)):
+                        part_file_name,take,row,delete = parts[k]
+                        slice_file.write(part_files[k].read(take*item_size))
+                        if row>take:
+                            part_files[k].seek((row-take)*item_size,1)
+                slice_file.close()
+                for k in xrange(len(parts)):
+                    part_files[k].close()
+                    if parts[k][3]:
+                        remove(parts[k][0]+str(i))
+                #rename will not replace an existing file on all platforms
+                if exists(slice_file_name):
+                    remove(slice_file_name)
+                rename(slice_file_name+".tmp",slice_file_name)
+            except (IOError,OSError):
+                error = "Error: Cannot join slice files"
+                raise Exception(error)
+
+    #-----------------------------------------------------------------------#
+    #Open the sequence store for the database, creating it if it is missing
+    #or was created from a different version of the database. Packed stores
+    #are kept in their own file, so that handles asking for different stores
+    #do not replace each other's
+    #-----------------------------------------------------------------------#
+    def openStore(self,store,fingerprint):
+        if store=="packed":
+            self.store = SequenceStore(self.database_name[0:-6]+".packed.seq")
+        else:
+            self.store = SequenceStore(self.database_name[0:-6]+".seq")
+        if not self.store.load(store=="packed",fingerprint):
+            print "    Writing sequence store"
+            self.store.build(self.database_name,self.header_index,
+                             store=="packed",fingerprint)
+
+    #---------------------------------------------------------------------#
+    #Open the q-gram index of the database for the qgram engine, creating it
+    #if it is missing or was created from a different version of the
+    #database or with different piece sizes
+    #---------------------------------------------------------------------#
+    def openGramIndex(self,fingerprint,prefetch):
+        if self.PIECE_SIZES[-1]>GramIndex.MAX_GRAM_SIZE:
+            error = "Error: The qgram engine cannot index pieces longer than "+\
+                    str(GramIndex.MAX_GRAM_SIZE)
+            raise Exception(error)
+        self.grams = GramIndex(self.database_name[0:-6]+".grams")
+        if not self.grams.load(self.PIECE_SIZES,fingerprint,prefetch):
+            print "    Writing q-gram index"
+            self.grams.build(self.database_name,self.header_index,
+                             self.PIECE_SIZES,fingerprint,prefetch)
+
+    #--------------------------------------------------------------------#
+    #Set up the cache of query results, loading the results kept in the
+    #cache file if it is persisted and the database has not changed since
+    #--------------------------------------------------------------------#
+    def openResultCache(self,cache_size,persist_cache):
+        cache_file_name = None
+        if persist_cache:
+            cache_file_name = self.database_name[0:-6]+".cache"
+        self.result_cache = ResultCache(cache_size,cache_file_name)
+        self.result_cache.load(self.cacheFingerprint())
+
+    #--------------------------------------------------------------------#
+    #Returns what the results kept in the result cache depend on, the
+    #fingerprint of the database and the samples of its profile (if any)
+    #--------------------------------------------------------------------#
+    def cacheFingerprint(self):
+        if self.profile is None:
+            return self.fingerprint+[0]
+        return self.fingerprint+[self.profile.samples]
+
+    #--------------------------------------------------------------------#
+    #Create the background profile of the database from the given number
+    #of alignments for each length, replacing any it already has. Results
+    #kept in the result cache were scored without it, so are dropped
+    #--------------------------------------------------------------------#
+    def createProfile(self,samples=PROFILE_SAMPLES):
+        profile = BackgroundProfile(self.database_name[0:-6]+".prof")
+        profile.build(self.database_name,profileFingerprint(self.database_name),
+                      samples,self.processes)
+        self.profile = None
+        if profile.means:
+            self.profile = profile
+        if self.result_cache is not None:
+            self.result_cache.fingerprint = self.cacheFingerprint()
+            self.result_cache.clear()
+
+    #---------------------------------------------------------------------#
+    #Returns the title and sequence of a record, from the sequence store if
+    #there is one and otherwise from the open database file
+    #---------------------------------------------------------------------#
+    def getRecord(self,db_file,rec_num):
+        if self.store is not None:
+            return self.store.getRecord(rec_num)
+        return readRecord(db_file,self.header_index[rec_num])
+
+    #-------------------------------------------------------------------------#
+    #Break a query into a number of segments equal to the maximum number of
+    #errors for the query plus one, and each segment into pieces, giving each
+    #piece with the position of its size in the list of piece sizes. Returns
+    #None if the segments would be shorter than the smallest piece, or
+    #cannot be made up of pieces of the sizes indexed
+    #-------------------------------------------------------------------------#
+    def splitQuery(self,pattern,max_errors):
+        pattern_length = len(pattern)
+        num_segs = max_errors+1
+        segs_size=pattern_length/num_segs
+        if segs_size<self.PIECE_SIZES[0]:
+            return None
+        pattern_pieces = []
+        completed=0
+        for j in range(num_segs):
+            #on the last one make size the leftover
+            if j+1==num_segs:
+                segs_size = pattern_length-(segs_size*(num_segs-1))
+            segment_pieces = []
+            if self.segmentPieces(segs_size) is None:
+                return None
+            for elm in self.segmentPieces(segs_size):
+                segment_pieces.append((pattern[completed:completed+elm],
+                                       self.PIECE_SIZES.index(elm)))
+                completed+=elm
+            pattern_pieces.append(segment_pieces)
+        return pattern_pieces
+
+    #--------------------------------------------------------------------#
+    #Returns the piece sizes that most efficently fit a segment of the given
+    #size, the fewest pieces that add up to it with the largest first, or
+    #None if no pieces add up to it. For piece sizes [2,3] this is as many
+    #pieces of 3 as possible with the rest in pieces of 2
+    #--------------------------------------------------------------------#
+    def segmentPieces(self,segs_size):
+        if segs_size not in self.segment_pieces:
+            self.segment_pieces[segs_size] = fitPieces(segs_size,
+                                            self.PIECE_SIZES[-1],self.PIECE_SIZES,{})
+        return self.segment_pieces[segs_size]
+
+    #--------------------------------------------------------------------#
+    #Map the slice files as numpy arrays for the numpy engine. Like the slice
+    #files each array holds a row of record_segments words for every bit
+    #--------------------------------------------------------------------#
+    def mapSliceArrays(self,record_segments,bit_string_elms):
+        self.record_segments = record_segments
+        self.bit_string_elms = bit_string_elms
+        self.slice_arrays = []
+        shape = (self.WORD_WIDTH,record_segments)
+        for i in xrange(len(self.PIECE_SIZES)):
+            #an empty file cannot be mapped
+            if record_segments>0:
+                slices = numpy.memmap(self.slice_file_name+str(i),dtype=numpy.uintc,
+                                      mode='r',shape=shape)
+            else:
+                slices = numpy.zeros(shape,numpy.uintc)
+            self.slice_arrays.append(slices)
+
+    #-------------------------------------------------------------------------#
+    #Find the candidate records for the pieces of some queries using the
+    #bitwise module. The pieces of each query are given for each of its
+    #segments as (piece, position of the piece size in the list of sizes).
+    #Returns the query, from which the candidates are fetched using getDrops.
+    #The candidates at each step are counted into stats if it is given
+    #-------------------------------------------------------------------------#
+    def bitwiseQuery(self,query_pieces,groups,stats=None):
+        #each query keeps its own dropset in the bitwise module
+        query = createQuery(self.db)
+        for i in xrange(len(query_pieces)):
+            createSegments(query,len(query_pieces[i]))
+            for j in xrange(len(query_pieces[i])):
+                for piece,idx_num in query_pieces[i][j]:
+                    encodeQueryPiece(query,j,piece,idx_num)
+            if stats is not None:
+                segments = []
+                for j in xrange(len(query_pieces[i])):
+                    segments.append(countSegment(query,j))
+                    stats.index_bytes += len(query_pieces[i][j])*\
+                                         self.NUM_SET_BITS*self.rowBytes()
+                stats.addPattern(segments,countSegment(query,-1))
+            for elm in groups:
+                if i in elm:
+                    updateDropsetAnd(query)
+                    operation = "and"
+                else:
+                    updateDropsetOr(query)
+                    operation = "or"
+                if stats is not None:
+                    stats.addStep(operation,i,countDropset(query))
+        return query
+
+    #--------------------------------------------------------------------#
+    #Returns the number of bytes in a row of the slice files, which holds
+    #one bit of the code word of every record
+    #--------------------------------------------------------------------#
+    def rowBytes(self):
+        item_size = array('I').itemsize
+        slice_word = item_size*8
+        return ((len(self.header_index)+slice_word-1)/slice_word)*item_size
+
+    #-------------------------------------------------------------------------#
+    #As above but using numpy. All rows of the slices needed for a query are
+    #taken at once, and each segment of the query and then the query itself
+    #are found by reducing over these rows for every record segment together.
+    #Returns a list of all the candidate records
+    #-------------------------------------------------------------------------#
+    def numpyDrops(self,query_pieces,groups,stats=None):
+        record_segments = self.record_segments
+        slice_arrays = self.slice_arrays
+        dropset = None
+        for i in xrange(len(query_pieces)):
+            rows = []
+            offsets = []
+            for segment in query_pieces[i]:
+                offsets.append(len(rows))
+                for piece,idx_num in segment:
+                    for bit in getPieceBits(self.db,piece):
+                        rows.append(slice_arrays[idx_num][bit])
+            if len(rows)==0 or len(rows) in offsets:
+                #a segment without pieces does not rule out any records
+                matches = ~numpy.zeros(record_segments,numpy.uintc)
+                segments = None
+            else:
+                #records that have every piece of any one of the segments
+                segments = numpy.bitwise_and.reduceat(numpy.array(rows),offsets,0)
+                matches = numpy.bitwise_or.reduce(segments,0)
+            if stats is not None:
+                counts = []
+                for j in xrange(len(query_pieces[i])):
+                    if segments is None:
+                        counts.append(self.bit_string_elms)
+                    else:
+                        counts.append(len(dropsetRecords(segments[j],
+                                                         self.bit_string_elms)))
+                stats.index_bytes += len(rows)*self.rowBytes()
+                stats.addPattern(counts,len(dropsetRecords(matches,
+                                                           self.bit_string_elms)))
+            for elm in groups:
+                if i in elm:
+                    if dropset is None:
+                        dropset = ~numpy.zeros(record_segments,numpy.uintc)
+                    dropset &= matches
+                    operation = "and"
+                else:
+                    if dropset is None:
+                        dropset = numpy.zeros(record_segments,numpy.uintc)
+                    dropset |= matches
+                    operation = "or"
+                if stats is not None:
+                    stats.addStep(operation,i,len(dropsetRecords(dropset,
+                                                     self.bit_string_elms)))
+        return dropsetRecords(dropset,self.bit_string_elms)
+
+    #-------------------------------------------------------------------------#
+    #As above but using the q-gram index. Each segment of a query is found in
+    #the records that have all of its pieces, each at its place in the
+    #segment, by intersecting the postings of the pieces. Returns a list of
+    #all the candidate records
+    #-------------------------------------------------------------------------#
+    def gramDrops(self,query_pieces,groups,stats=None):
+        query = createGramQuery(self.grams.index)
+        for i in xrange(len(query_pieces)):
+            createGramSegments(query,len(query_pieces[i]))
+            for j in xrange(len(query_pieces[i])):
+                for piece,idx_num in query_pieces[i][j]:
+                    encodeGramPiece(query,j,piece,idx_num)
+            if stats is not None:
+                segments = []
+                for j in xrange(len(query_pieces[i])):
+                    segments.append(countGramSegment(query,j))
+                stats.addPattern(segments,countGramSegment(query,-1))
+            for elm in groups:
+                if i in elm:
+                    updateGramsAnd(query)
+                    operation = "and"
+                else:
+                    updateGramsOr(query)
+                    operation = "or"
+                if stats is not None:
+                    stats.addStep(operation,i,countGramDropset(query))
+        drops = getGramDrops(query,0,len(self.header_index))
+        if stats is not None:
+            stats.index_bytes += countGramBytes(query)
+        clearGramQuery(query)
+        return drops
 
     #----------------------------------------------------------------------#
     #Find matches in database within specified distance of the given pattern
     #----------------------------------------------------------------------# 
-    def match(self,patterns,max_errors):
+    def match(self,patterns,max_errors,output=0,top_k=None):
         """ Parameters:
             
             patterns - a string (i.e. "MKFL")
@@ -226,6 +769,20 @@ class FastaDatabase:
                     If a seperate error rate is desired for each pattern then
                     specify a list with 1 integer per pattern
 
+        output - if set the table of results is printed
+
+        top_k - the number of the most significant results to return,
+                    or None to return every significant result
+
+                    The results are returned as MatchResults, a list of a
+                    Hit for each significant record found, from the most
+                    significant. Each Hit holds the record number,
+                    accession, patterns found, span and text of the best
+                    match of each pattern, raw score and p-value.
+
+                    The QueryStats of the query are kept in the stats
+                    attribute of the results.
+
         """    
         #---------------------------
         #1. Check validity of inputs
@@ -267,7 +824,8 @@ class FastaDatabase:
             raise Exception(error)   
         #Now move on to checking max_errors    
         if type(max_errors) is type([]):
-            i=0
+            #the list given is left as it is, the changed errors are used
+            errors = []
             for elm in max_errors:
                 if elm>8:
                     print "An element of max errors is too high, changing it to 8"
@@ -275,7 +833,9 @@ class FastaDatabase:
                 if elm<1:
                     print "An element of max errors is too low, changing it to 1"
                     elm=1
-                i+=1
+                errors.append(elm)
+            max_errors = errors
+            i = len(max_errors)
             if i>num_patterns:
                 error = "Error:  More errors were specified than patterns given"
                 raise Exception(error)
@@ -298,58 +858,99 @@ class FastaDatabase:
                 error = "Error:  Invalid type for number of errors"
                 print error
                 return error 
+        checkTopK(top_k)
+        if self.result_cache is None:
+            results = self.findMatches(patterns,patterns_to_match,groups,
+                                       max_errors,top_k)
+        else:
+            results = self.cachedMatches(patterns,patterns_to_match,groups,
+                                         max_errors,top_k)
+        if output:
+            sys.stdout.write(results.format())
+        return results
+
+    #----------------------------------------------------------------------#
+    #Returns the results of a query from the result cache if they are there,
+    #otherwise finds them and keeps them in the cache. Nothing is kept if the
+    #database has changed since it was indexed, as the results may be wrong
+    #----------------------------------------------------------------------#
+    def cachedMatches(self,patterns,patterns_to_match,groups,max_errors,top_k):
+        start = time.time()
+        try:
+            db_stat = stat(self.database_name)
+            unchanged = [db_stat.st_size,db_stat.st_mtime]==self.fingerprint[0:2]
+        except OSError:
+            unchanged = 0
+        if not unchanged:
+            self.result_cache.clear()
+            return self.findMatches(patterns,patterns_to_match,groups,
+                                    max_errors,top_k)
+        key = resultKey(patterns_to_match,groups,max_errors,top_k)
+        results = self.result_cache.get(key)
+        if results is None:
+            results = self.findMatches(patterns,patterns_to_match,groups,
+                                       max_errors,top_k)
+            self.result_cache.add(key,results)
+            stats = results.stats
+        else:
+            stats = QueryStats(len(self.header_index),self.engine)
+            stats.cached = 1
+            stats.hits = results.matched
+            stats.times["rank"] = time.time()-start
+        #return a copy so that the caller cannot change the cached results
+        results = MatchResults(results.patterns,results.matched,results)
+        results.stats = stats
+        return results
+
+    #----------------------------------------------------------------------#
+    #Find matches in the database for the patterns of a query, once they
+    #have been checked and put into a list along with their groups and the
+    #maximum errors for each, and return the top_k of them (or all of them if
+    #top_k is None) as MatchResults, along with the QueryStats of the query
+    #----------------------------------------------------------------------#
+    def findMatches(self,patterns,patterns_to_match,groups,max_errors,top_k):
+        stats = QueryStats(len(self.header_index),self.engine)
+        times = stats.times
+        started = time.time()
 
         #------------------------
         #2. Encode Query Patterns
         #------------------------
-        matchers = []
         query_pieces = []
-        piece_sizes,segments = self.PIECE_SIZES,self.SEGMENTS
         i=0
         for pattern in patterns_to_match:
-            #create a pattern object for each query
-            matchers.append(compile(pattern,len(pattern),max_errors[i]))
-            #check the query length is within acceptable bounds
-            pattern_length = len(pattern)      
-            #if the pattern is too long simply abort, we don't want to deal
-            #with overflow issues and there are better tools out there anyway
-            if pattern_length>self.MAX_QUERY_LENGTH:
-                error = []
-                error.append("Error: This program currently cannot deal with ")
-                error.append("proteins longer than ")
-                error.append(str(self.MAX_QUERY_LENGTH))
-                error.append(" aa, sorry")
-                error = ''.join(error)
-                clearMatchInfo()
-                raise Exception(error)
-            #break the query into a number of segments equal to the 
-            #maximum number of errors for the query plus one
-            num_segs = max_errors[i]+1
-            segs_size=pattern_length/num_segs
+            pattern_pieces = self.splitQuery(pattern,max_errors[i])
             #if the pattern is too short then abort all 
             #preprocessed matching and give all input to direct
             #match to deal with and return to the user
-            if segs_size<piece_sizes[0]:
+            if pattern_pieces is None:
                 print "A query had too many errors for its size"
                 print "Using direct_match instead..."
-                clearMatchInfo()
-                return direct_match(self.database_name,patterns,max_errors)
-            #for each segment encode all pieces
-            createSegments(num_segs)
-            completed=0
-            for j in range(num_segs):
-                #on the last one make size the leftover
-                if j+1==num_segs:
-                    segs_size = pattern_length-(segs_size*(num_segs-1))
-                for elm in segments[segs_size]:
-                    encodeQueryPiece(j,pattern[completed:completed+elm],elm-2)
-                    completed+=elm
-            for elm in groups:
-                if i in elm:
-                    updateDropsetAnd()
-                else:
-                    updateDropsetOr()
+                results = direct_match(self.database_name,patterns,max_errors,
+                                       self.processes,0,top_k)
+                stats.direct = 1
+                stats.candidates = len(self.header_index)
+                stats.hits = results.matched
+                stats.record_bytes = self.fingerprint[0]
+                times["verify"] = time.time()-started
+                results.stats = stats
+                return results
+            query_pieces.append(pattern_pieces)
             i+=1
+        times["split"] = time.time()-started
+        #find the candidate records for the queries with the chosen engine
+        chunk = self.DROP_CHUNK_SIZE
+        started = time.time()
+        if self.engine=="numpy":
+            query = None
+            drops = self.numpyDrops(query_pieces,groups,stats)
+        elif self.engine=="qgram":
+            query = None
+            drops = self.gramDrops(query_pieces,groups,stats)
+        else:
+            query = self.bitwiseQuery(query_pieces,groups,stats)
+            drops = getDrops(query,0,chunk)
+        times["filter"] += time.time()-started
 
         #-------------------------
         #3. Set up database access
@@ -357,73 +958,1281 @@ class FastaDatabase:
         try:
             db_file = open(self.database_name, 'r')
         except IOError:
+            if query is not None:
+                clearMatchInfo(query)
             error = "Error: Cannot open specified db file"
             raise Exception(error)  
             
         #----------------------------------------------
         #4. Search dropped database records for matches
         #----------------------------------------------   
-        #storage for information about each match
-        #this allows for later calculation of p values and
-        #output of this information to the user
-        results_record_headers = []
-        results_surrounding_text = []
-        num_match_recs = 0
-        #handles for called functions
-        index = self.header_index
-        db_pos = db_file.seek
-        #start parsing dropfile
-        rec_num=nextDrop(1)
-        while(rec_num):  
-            db_pos(index[rec_num-1])
-            title =  db_file.readline().split()[1]
-            rec = []
-            line = db_file.readline()
-            while(line and line[0]!='>'):
-                rec.append(line[:-1])
-                line = db_file.readline()
-            record = ''.join(rec)
-            begin_rec = 0
-            for i in range(num_patterns):
-                matches = agrepy(patterns_to_match[i], len(patterns_to_match[i]),\
-                                 record,len(record),1,matchers[i])
-                if matches:
-                    if begin_rec==0:
-                        begin_rec = 1
-                        num_match_recs +=1
-                    results_record_headers.append(title)
-                    pattern_matches = []
-                    for elm in matches:
-                        start=0
-                        if elm[0]>0:
-                            start = elm[0]
-                        pattern_matches.append(record[start:elm[1]]) 
-                    results_surrounding_text.append(pattern_matches) 
-            rec_num=nextDrop(rec_num+1)
-        clearMatchInfo()      
+        #each record that matches is scored straight away, keeping
+        #only the ones that will be returned
+        ranking = Ranking(patterns_to_match,top_k,self.profile)
+        #all the patterns are searched for in a single pass of each record
+        matcher = compileMatcher(patterns_to_match,max_errors)
+        #start parsing dropset, fetching the candidate records from
+        #the bitwise module a chunk at a time. Only the reading of each
+        #record is timed, the time left over in each chunk is spent
+        #verifying the records (apart from ranking those that match)
+        clock = time.time
+        read_time = rank_time = 0.0
+        record_bytes = hits = 0
+        started = clock()
+        while drops:
+            stats.candidates += len(drops)
+            for rec_num in drops:
+                reading = clock()
+                title,record = self.getRecord(db_file,rec_num)
+                read_time += clock()-reading
+                record_bytes += len(title)+len(record)
+                #only the matches with the fewest errors need to be scored
+                found_patterns,found_spans,found_texts = \
+                    foundPatterns(matcher.match(record,1,1),record)
+                if found_patterns:
+                    hits += 1
+                    ranking_started = clock()
+                    ranking.add(rec_num,title,found_patterns,found_spans,
+                                found_texts)
+                    rank_time += clock()-ranking_started
+            fetching = clock()
+            times["verify"] += fetching-started
+            if query is None:
+                drops = []
+            else:
+                drops = getDrops(query,drops[-1]+1,chunk)
+            started = clock()
+            times["filter"] += started-fetching
+        if query is not None:
+            clearMatchInfo(query)
         db_file.close()
+        times["read"] = read_time
+        times["verify"] -= read_time+rank_time
+        stats.record_bytes = record_bytes
+        stats.hits = hits
         
         #--------------------
         #5. Deal with results
         #-------------------- 
-        outputResults(patterns_to_match,num_match_recs,results_record_headers,
-                      results_surrounding_text)
-        #Finally return result headers to the caller in case
-        #they wish to make use of them in some other way
-        return results_record_headers
+        #rank the records that matched
+        results = ranking.results()
+        times["rank"] = rank_time+clock()-started
+        results.stats = stats
+        return results
+
+    #-------------------------------------------------------------------------#
+    #Find matches in the database for many independent queries at once. The
+    #candidate records of all the queries are found first, then each record
+    #that is a candidate for any query is read once and searched for every
+    #query it is a candidate for
+    #-------------------------------------------------------------------------#
+    def match_many(self,queries,max_errors):
+        """ Parameters:
+
+            queries - a list of strings (i.e. ["MKFL","LILCLF"])
+
+                    Each query is searched for separately, as if match was
+                    called for each one in turn, but the database is only
+                    read once. Nothing is printed, instead a list is
+                    returned with the MatchResults of each query, in the
+                    same order as the queries. These are scored, ranked
+                    and cut off at PVAL_THRESHOLD as match does, so each
+                    holds the same hits match would return for the query.
+                    The QueryStats of each query are kept in the stats
+                    attribute of its results. A record that is a candidate
+                    for several queries is only read once, but the bytes
+                    and time taken to read it are counted for each of them.
+
+        max-errors - an integer
+                    - a list (i.e [2,3,1])
+
+                    A single integer value will be applied to ALL queries,
+                    otherwise 1 integer per query is given. Numbers of
+                    errors outside 1 to 8 are changed to the nearest of
+                    these, as match does.
+        """
+        #---------------------------
+        #1. Check validity of inputs
+        #---------------------------
+        if type(queries) is not type([]):
+            error = "Error:  Queries must be given as a list"
+            raise Exception(error)
+        num_queries = len(queries)
+        for query in queries:
+            if type(query) is not type("abc"):
+                error = "Error:  Invalid type of query data"
+                raise Exception(error)
+        if type(max_errors) is type(1):
+            max_errors = [max_errors]*num_queries
+        if type(max_errors) is not type([]) or len(max_errors)!=num_queries:
+            error = "Error:  One number of errors must be given for each query"
+            raise Exception(error)
+        errors = []
+        for elm in max_errors:
+            if elm>8:
+                print "An element of max errors is too high, changing it to 8"
+                elm=8
+            if elm<1:
+                print "An element of max errors is too low, changing it to 1"
+                elm=1
+            errors.append(elm)
+
+        #-----------------------------------------
+        #2. Find the candidate records of each query
+        #-----------------------------------------
+        matchers = []
+        all_stats = []
+        #queries that are candidates for each record
+        candidates = {}
+        #queries too short to be found with the index are
+        #searched for in every record
+        unindexed = []
+        for i in xrange(num_queries):
+            matchers.append(compileMatcher([queries[i]],[errors[i]]))
+            stats = QueryStats(len(self.header_index),self.engine)
+            all_stats.append(stats)
+            started = time.time()
+            query_pieces = self.splitQuery(queries[i],errors[i])
+            splitting = time.time()
+            stats.times["split"] = splitting-started
+            if query_pieces is None:
+                unindexed.append(i)
+                stats.direct = 1
+                stats.candidates = len(self.header_index)
+                continue
+            if self.engine=="numpy":
+                drops = self.numpyDrops([query_pieces],[[-1]],stats)
+            elif self.engine=="qgram":
+                drops = self.gramDrops([query_pieces],[[-1]],stats)
+            else:
+                query = self.bitwiseQuery([query_pieces],[[-1]],stats)
+                drops = getDrops(query,0,len(self.header_index))
+                clearMatchInfo(query)
+            stats.times["filter"] = time.time()-splitting
+            stats.candidates = len(drops)
+            for rec_num in drops:
+                candidates.setdefault(rec_num,[]).append(i)
+        if unindexed:
+            drops = range(len(self.header_index))
+        else:
+            drops = candidates.keys()
+            #read the records in the order they are in the database
+            drops.sort()
+
+        #------------------------------------------------
+        #3. Search each candidate record for its queries
+        #------------------------------------------------
+        try:
+            db_file = open(self.database_name, 'r')
+        except IOError:
+            error = "Error: Cannot open specified db file"
+            raise Exception(error)
+        #each query scores and ranks the records it matches as match does
+        rankings = []
+        for i in xrange(num_queries):
+            rankings.append(Ranking([queries[i]],None,self.profile))
+        clock = time.time
+        for rec_num in drops:
+            reading = clock()
+            title,record = self.getRecord(db_file,rec_num)
+            verifying = clock()
+            read_time = verifying-reading
+            record_bytes = len(title)+len(record)
+            for i in candidates.get(rec_num,[])+unindexed:
+                times = all_stats[i].times
+                times["read"] += read_time
+                all_stats[i].record_bytes += record_bytes
+                #only the matches with the fewest errors need to be scored
+                found_patterns,found_spans,found_texts = \
+                    foundPatterns(matchers[i].match(record,1,1),record)
+                ranking = clock()
+                times["verify"] += ranking-verifying
+                if found_patterns:
+                    rankings[i].add(rec_num,title,found_patterns,found_spans,
+                                    found_texts)
+                verifying = clock()
+                times["rank"] += verifying-ranking
+        db_file.close()
+        results = []
+        for i in xrange(num_queries):
+            ranking = clock()
+            query_results = rankings[i].results()
+            all_stats[i].hits = query_results.matched
+            all_stats[i].times["rank"] += clock()-ranking
+            query_results.stats = all_stats[i]
+            results.append(query_results)
+        return results
 
     #-----------------------
     # Free memory in Bitwise
     #----------------------- 
     def __del__(self):
-        clearDatabase()
+        if getattr(self,'db',None) is not None:
+            clearDatabase(self.db)
+
+#-----Class that holds the residues of every record of a database-----------#
+class SequenceStore:
+    """
+    This class holds the sequences of all the records of a FASTA database
+    joined together in a single file, along with the position of each one
+    in that file and the title of each record. Any record can then be read
+    straight from the store without searching for the end of the record or
+    joining its lines. The residues are either stored as they are, or
+    packed into 5 bits each by the Bitwise module (if a record has any
+    residue that cannot be packed the store is kept unpacked instead).
+    """
+    #Version of the format of the store, a store in any other
+    #format is recreated when the database is opened
+    STORE_VERSION = 2
+
+    #---------------------------------------------------------------#
+    #Constructor. The store is kept in the given file, and information
+    #about it in a second file with the same name ending in idx
+    #---------------------------------------------------------------#
+    def __init__(self,store_file_name):
+        self.store_file_name = store_file_name
+        self.info_file_name = store_file_name+"idx"
+        self.packed = 0
+        self.offsets = []
+        self.lengths = []
+        self.titles = []
+        self.data = ""
+
+    #-----------------------------------------------------------------------#
+    #Load the store, if it exists, is packed or not as asked for and was made
+    #from the database with the given fingerprint. Returns whether it loaded
+    #-----------------------------------------------------------------------#
+    def load(self,packed,fingerprint):
+        try:
+            info = load(open(self.info_file_name,"rb"))
+        except (IOError,EOFError,ValueError):
+            return 0
+        #info holds whether the store was asked to be packed as well as
+        #whether it is, as a store that could not be packed is unpacked
+        if info[0]!=self.STORE_VERSION or info[1]!=fingerprint or \
+           info[2]!=packed:
+            return 0
+        self.packed,self.offsets,self.lengths,self.titles = info[3:7]
+        try:
+            store_file = open(self.store_file_name,"rb")
+            if stat(self.store_file_name).st_size!=self.offsets[-1]:
+                store_file.close()
+                return 0
+            #an empty file cannot be mapped
+            if self.offsets[-1]>0:
+                self.data = mmap(store_file.fileno(),0,access=ACCESS_READ)
+            store_file.close()
+        except (IOError,OSError):
+            return 0
+        return 1
+
+    #--------------------------------------------------------------------#
+    #Create the store from the records of the database, whose headers are
+    #at the given positions, then load it. The files are written under
+    #temporary names and renamed into place, as other handles on the
+    #database may have the old store mapped
+    #--------------------------------------------------------------------#
+    def build(self,db_file_name,header_index,packed,fingerprint):
+        try:
+            info = self.writeRecords(db_file_name,header_index,packed)
+            if info is None:
+                print "    Not all residues can be packed, storing them unpacked"
+                info = self.writeRecords(db_file_name,header_index,0)
+            info_file = open(self.info_file_name+".tmp","wb")
+            dump([self.STORE_VERSION,fingerprint,packed]+info,info_file)
+            info_file.close()
+            #the information is replaced last so that a store
+            #that was only partly written is never loaded
+            for file_name in [self.store_file_name,self.info_file_name]:
+                #rename will not replace an existing file on all platforms
+                if exists(file_name):
+                    remove(file_name)
+                rename(file_name+".tmp",file_name)
+        except (IOError,OSError):
+            error = "Error: Cannot create sequence store"
+            raise Exception(error)
+        self.load(packed,fingerprint)
+
+    #----------------------------------------------------------------------#
+    #Write the residues of each record to a temporary store file, packed if
+    #asked. Returns whether they were packed, the offset of each record in the file
+    #(and the end of the file), the length of each record and its title, or
+    #None if the records had to be packed but could not be
+    #----------------------------------------------------------------------#
+    def writeRecords(self,db_file_name,header_index,packed):
+        offsets = [0]
+        lengths = []
+        titles = []
+        db_file = open(db_file_name,'r')
+        store_file = open(self.store_file_name+".tmp","wb")
+        for i in xrange(len(header_index)):
+            title,data = readRecord(db_file,header_index[i])
+            lengths.append(len(data))
+            titles.append(title)
+            if packed:
+                data = packResidues(data,len(data))
+                if data is None:
+                    store_file.close()
+                    db_file.close()
+                    return None
+            store_file.write(data)
+            offsets.append(offsets[-1]+len(data))
+        store_file.close()
+        db_file.close()
+        return [packed,offsets,lengths,titles]
+
+    #---------------------------------------------------------#
+    #Returns the title and sequence of a record in the store
+    #---------------------------------------------------------#
+    def getRecord(self,rec_num):
+        data = self.data[self.offsets[rec_num]:self.offsets[rec_num+1]]
+        if self.packed:
+            data = unpackResidues(data,self.lengths[rec_num])
+        return self.titles[rec_num],data
+
+#-----Class that holds the inverted index of the pieces of a database-------#
+class GramIndex:
+    """
+    This class holds an inverted index of the pieces of the records of a
+    FASTA database, for the qgram engine. For every piece of each of the
+    piece sizes of the database index it lists the records the piece is
+    in and its positions in each of them, compressed by the Bitwise
+    module. Unlike the code words of the slice files this does not fill
+    up as records get longer, and the pieces of a segment of a query are
+    only matched where they follow on from each other, so a record is only
+    a candidate if it has a whole segment. The index is kept in a .grams
+    file next to the database, and information about it in a .gramsidx file.
+    """
+    #Version of the format of the index, an index in any other
+    #format is recreated when the database is opened
+    GRAM_VERSION = 3
+    #The longest pieces that can be indexed
+    MAX_GRAM_SIZE = MAX_GRAM_RESIDUES
+
+    #---------------------------------------------------------------#
+    #Constructor. The index is kept in the given file, and information
+    #about it in a second file with the same name ending in idx
+    #---------------------------------------------------------------#
+    def __init__(self,gram_file_name):
+        self.gram_file_name = gram_file_name
+        self.info_file_name = gram_file_name+"idx"
+        self.index = None
+
+    #----------------------------------------------------------------------#
+    #Load the index, if it exists and was made with the given piece sizes
+    #from the database with the given fingerprint, on a machine with the
+    #same byte order as this one. Returns whether it loaded
+    #----------------------------------------------------------------------#
+    def load(self,piece_sizes,fingerprint,prefetch=0):
+        try:
+            info = load(open(self.info_file_name,"rb"))
+        except (IOError,EOFError,ValueError):
+            return 0
+        if info[0]!=self.GRAM_VERSION or info[1]!=fingerprint or \
+           info[2]!=piece_sizes or info[4]!=sys.byteorder:
+            return 0
+        try:
+            if stat(self.gram_file_name).st_size!=info[3]:
+                return 0
+        except OSError:
+            return 0
+        self.clear()
+        self.index = loadGramIndex(self.gram_file_name,prefetch)
+        return 1
+
+    #--------------------------------------------------------------------#
+    #Create the index from the records of the database, whose headers are
+    #at the given positions, then load it
+    #--------------------------------------------------------------------#
+    def build(self,db_file_name,header_index,piece_sizes,fingerprint,prefetch=0):
+        builder = createGramIndex(len(piece_sizes))
+        for i in xrange(len(piece_sizes)):
+            setGramSize(builder,i,piece_sizes[i])
+        try:
+            db_file = open(db_file_name,'r')
+            for i in xrange(len(header_index)):
+                title,data = readRecord(db_file,header_index[i])
+                addGramRecord(builder,data,len(data))
+            db_file.close()
+            writeGramIndex(builder,self.gram_file_name)
+            #the information is written last so that an index
+            #that was only partly written is never loaded
+            info_file = open(self.info_file_name,"wb")
+            dump([self.GRAM_VERSION,fingerprint,piece_sizes,
+                  stat(self.gram_file_name).st_size,sys.byteorder],info_file)
+            info_file.close()
+        except (IOError,OSError):
+            clearGramIndex(builder)
+            error = "Error: Cannot create q-gram index"
+            raise Exception(error)
+        clearGramIndex(builder)
+        self.load(piece_sizes,fingerprint,prefetch)
+
+    #--------------------------------------#
+    #Free the loaded index, if there is one
+    #--------------------------------------#
+    def clear(self):
+        if self.index is not None:
+            clearGramIndex(self.index)
+            self.index = None
+
+    def __del__(self):
+        self.clear()
+
+#-----Class that holds the background scores of a database-----------------#
+class BackgroundProfile:
+    """
+    This class holds the mean and standard deviation of the score of
+    aligning two unrelated segments of a database, for each length of
+    segment. It is created by scoring segments cut at random from a sample
+    of the records of the database, and is kept in a .prof file next to the
+    database along with the size and modification time of the database it
+    was made from. The p-values of matches in the database are then found
+    from the scores expected in it rather than from the means table below.
+    """
+    #Version of the format of the profile, a profile in any
+    #other format has to be created again
+    PROFILE_VERSION = 1
+    #The longest segments that are profiled, longer ones use the
+    #scores of this length
+    MAX_LENGTH = 100
+    #Number of records sampled from the database to cut segments from
+    SAMPLE_RECORDS = 1000
+    #The segments are chosen by a generator with a fixed seed, so the same
+    #database always gets the same profile
+    SEED = 2006
+
+    #---------------------------------------------------------#
+    #Constructor. The profile is kept in the given file
+    #---------------------------------------------------------#
+    def __init__(self,profile_file_name):
+        self.profile_file_name = profile_file_name
+        self.fingerprint = None
+        self.samples = 0
+        self.means = []
+        self.stdevs = []
+
+    #---------------------------------------------------------------------#
+    #Load the profile, if it exists and was made from the database with the
+    #given fingerprint (its size and modification time). Returns whether it
+    #loaded
+    #---------------------------------------------------------------------#
+    def load(self,fingerprint):
+        try:
+            info = load(open(self.profile_file_name,"rb"))
+        except (IOError,EOFError,ValueError):
+            return 0
+        if info[0]!=self.PROFILE_VERSION or info[1]!=fingerprint:
+            return 0
+        self.fingerprint,self.samples,self.means,self.stdevs = info[1:5]
+        return 1
+
+    #--------------------------------------------------------------------#
+    #Create the profile of a database with the given fingerprint from the
+    #given number of alignments for each length, split between a number
+    #of processes (all available cores if processes is None), and save it
+    #--------------------------------------------------------------------#
+    def build(self,db_file_name,fingerprint,samples=PROFILE_SAMPLES,processes=1):
+        try:
+            db_file = open(db_file_name,'r')
+        except IOError:
+            error = "Error: Cannot open specified db file"
+            raise Exception(error)
+        generator = Random(self.SEED)
+        records = sampleRecords(scanRecords(db_file),self.SAMPLE_RECORDS,
+                                generator)
+        db_file.close()
+        lengths = []
+        for record in records:
+            lengths.append(len(record))
+        tasks = []
+        for length in range(1,self.MAX_LENGTH+1):
+            #only the records at least this long can be cut from
+            long_records = []
+            for i in range(len(records)):
+                if lengths[i]>=length:
+                    long_records.append(records[i])
+            if not long_records:
+                break
+            tasks.append((cutSegments(long_records,length,samples,generator),
+                          cutSegments(long_records,length,samples,generator)))
+        if processes is None and Pool is not None:
+            processes = cpu_count()
+        if processes>1 and Pool is not None:
+            pool = Pool(processes)
+            #the longer segments take much longer to align, so the
+            #tasks are handed out one at a time to even out the work
+            stats = pool.map(scoreSegments,tasks,1)
+            pool.close()
+            pool.join()
+        else:
+            stats = map(scoreSegments,tasks)
+        self.fingerprint = fingerprint
+        self.samples = samples
+        self.means = []
+        self.stdevs = []
+        for mean,stdev in stats:
+            self.means.append(mean)
+            self.stdevs.append(stdev)
+        try:
+            profile_file = open(self.profile_file_name,"wb")
+            dump([self.PROFILE_VERSION,self.fingerprint,self.samples,
+                  self.means,self.stdevs],profile_file)
+            profile_file.close()
+        except IOError:
+            error = "Error: Cannot save background profile to file"
+            raise Exception(error)
+
+    #---------------------------------------------------------------------#
+    #Returns how many standard deviations a score is above the mean score of
+    #alignments of its length, or 0 if it is below the mean
+    #---------------------------------------------------------------------#
+    def standardise(self,score,length):
+        if length>len(self.means):
+            length = len(self.means)
+        deviation = score-self.means[length-1]
+        if deviation<0:
+            return 0
+        if self.stdevs[length-1]>0:
+            deviation /= self.stdevs[length-1]
+        return deviation
+
+#-----Class that holds several patterns compiled to be found at once--------#
+class MultiMatcher:
+    """
+    This class holds several patterns, each with its own number of errors,
+    compiled by the agrepy module to be searched for in a text in a single
+    pass, and frees them when it is no longer used.
+    """
+    #-------------------------------------------------------------------#
+    #Constructor. Compiles each pattern with its number of errors
+    #-------------------------------------------------------------------#
+    def __init__(self,patterns,errors):
+        self.patterns = patterns
+        self.errors = errors
+        self.params = multi_compile()
+        for i in range(len(patterns)):
+            multi_add(self.params,patterns[i],len(patterns[i]),errors[i])
+
+    #--------------------------------------------------------------------#
+    #Returns a list of the matches (or None) of each pattern in text, as
+    #(start,end) pairs or (start,end,errors) if with_errors is set. If
+    #fewest is set only the matches of each pattern with the fewest errors
+    #are returned
+    #--------------------------------------------------------------------#
+    def match(self,text,with_errors=0,fewest=0):
+        return agrepy_multi(self.params,text,len(text),1,with_errors,fewest)
+
+    #-----------------------
+    # Free memory in agrepy
+    #-----------------------
+    def __del__(self):
+        multi_free(self.params)
+
+#-----Class that keeps the most recently used matchers----------------------#
+class MatcherCache:
+    """
+    This class keeps the matchers that were most recently asked for, so that
+    a query that is repeated does not have to compile its patterns again.
+    Once more than size matchers are kept the least recently used one is
+    dropped, freeing its memory in the agrepy module.
+    """
+    #------------------------------------------------------------#
+    #Constructor. size is the number of matchers that are kept
+    #------------------------------------------------------------#
+    def __init__(self,size):
+        self.size = size
+        self.matchers = {}
+        #the keys of the matchers from least to most recently used
+        self.order = []
+
+    #--------------------------------------------------------------------#
+    #Returns the matcher for several patterns, each with its own number of
+    #errors, searched for at once
+    #--------------------------------------------------------------------#
+    def getMultiMatcher(self,patterns,errors):
+        key = (tuple(patterns),tuple(errors))
+        return self.fetch(key,MultiMatcher,list(patterns),list(errors))
+
+    #------------------------------------------------------------------#
+    #Returns the matcher kept for key, or creates one with the class and
+    #arguments given, keeps it and drops the least recently used matcher
+    #if there are too many
+    #------------------------------------------------------------------#
+    def fetch(self,key,matcher_class,*args):
+        matcher = self.matchers.get(key)
+        if matcher is not None:
+            if self.order[-1]!=key:
+                self.order.remove(key)
+                self.order.append(key)
+            return matcher
+        matcher = matcher_class(*args)
+        if self.size<1:
+            return matcher
+        self.matchers[key] = matcher
+        self.order.append(key)
+        while len(self.order)>self.size:
+            del self.matchers[self.order.pop(0)]
+        return matcher
+
+    #----------------------------------#
+    #Drop all the matchers that are kept
+    #----------------------------------#
+    def clear(self):
+        self.matchers = {}
+        self.order = []
+
+#The matchers for the most recent queries. They are dropped before the
+#interpreter exits, while the agrepy module is still there to free them
+matcher_cache = MatcherCache(MATCHER_CACHE_SIZE)
+register(matcher_cache.clear)
+
+#-----Class that keeps the results of the most recent queries---------------#
+class ResultCache:
+    """
+    This class keeps the results of the queries most recently matched in a
+    database, so that a query that is repeated is answered without searching
+    the database again. Once more than size results are kept the least
+    recently used one is dropped. The results can also be kept in a file,
+    along with the fingerprint of the database they were found in, so that
+    they are kept between sessions for as long as the database is unchanged.
+    """
+    #Version of the format of the cache file, a cache file in
+    #any other format is ignored
+    CACHE_VERSION = 3
+
+    #------------------------------------------------------------------#
+    #Constructor. size is the number of results that are kept, and if a
+    #file name is given they are also kept in that file
+    #------------------------------------------------------------------#
+    def __init__(self,size,cache_file_name=None):
+        self.size = size
+        self.cache_file_name = cache_file_name
+        self.fingerprint = None
+        self.results = {}
+        #the keys of the results from least to most recently used
+        self.order = []
+
+    #-----------------------------------------------------------------------#
+    #Load the results kept in the cache file, if there is one and they were
+    #found in the database with the given fingerprint. Returns whether it did
+    #-----------------------------------------------------------------------#
+    def load(self,fingerprint):
+        self.fingerprint = fingerprint
+        if self.cache_file_name is None:
+            return 0
+        try:
+            cache_file = open(self.cache_file_name,"rb")
+            info = load(cache_file)
+            cache_file.close()
+        except (IOError,EOFError,ValueError):
+            return 0
+        if info[0]!=self.CACHE_VERSION or info[1]!=fingerprint:
+            return 0
+        self.order = info[2]
+        while len(self.order)>self.size:
+            del info[3][self.order.pop(0)]
+        for key in self.order:
+            self.results[key] = loadMatchResults(info[3][key])
+        return 1
+
+    #--------------------------------------------------------------#
+    #Returns the result kept for a query, or None if there is none
+    #--------------------------------------------------------------#
+    def get(self,key):
+        result = self.results.get(key)
+        if result is not None and self.order[-1]!=key:
+            self.order.remove(key)
+            self.order.append(key)
+        return result
+
+    #--------------------------------------------------------------------#
+    #Keep the result of a query, dropping the least recently used result
+    #if there are too many, and write the results to the cache file
+    #--------------------------------------------------------------------#
+    def add(self,key,result):
+        if self.size<1:
+            return
+        if key in self.results:
+            self.order.remove(key)
+        self.results[key] = result
+        self.order.append(key)
+        while len(self.order)>self.size:
+            del self.results[self.order.pop(0)]
+        self.save()
+
+    #--------------------------------------------------------------------#
+    #Write the results to the cache file, if there is one. The file is
+    #written under another name first so that it is never left partly
+    #written, and failing to write it only means the results are not kept
+    #--------------------------------------------------------------------#
+    def save(self):
+        if self.cache_file_name is None:
+            return
+        states = {}
+        for key in self.order:
+            states[key] = self.results[key].getState()
+        try:
+            cache_file = open(self.cache_file_name+".tmp","wb")
+            dump([self.CACHE_VERSION,self.fingerprint,self.order,states],
+                 cache_file)
+            cache_file.close()
+            rename(self.cache_file_name+".tmp",self.cache_file_name)
+        except (IOError,OSError):
+            print "Could not save result cache to "+self.cache_file_name
+
+    #--------------------------------#
+    #Drop all the results that are kept
+    #--------------------------------#
+    def clear(self):
+        self.results = {}
+        self.order = []
+        self.save()
+
+#-----Class that holds a record found by a query----------------------------#
+class Hit(object):
+    """
+    This class holds a record that was found to match a query: its number in
+    the database, its accession, the patterns of the query found in it (by
+    their position in the query) and for each of them the span of the record
+    and the text that best matched it, with the number of errors (edits)
+    agrepy found in that match (or -1 if it could not count them). The
+    raw score of the record is the sum of the scores of these matches, and
+    the p-value is the chance of a record scoring as well as this by
+    accident.
+    """
+    __slots__ = ["record","accession","patterns","spans","texts","errors","score",
+                 "pvalue"]
+
+    #------------------------------------------------#
+    #Constructor. Sets all the information of the hit
+    #------------------------------------------------#
+    def __init__(self,record,accession,patterns,spans,texts,errors,score,pvalue):
+        self.record = record
+        self.accession = accession
+        self.patterns = patterns
+        self.spans = spans
+        self.texts = texts
+        self.errors = errors
+        self.score = score
+        self.pvalue = pvalue
+
+    #-------------------------------------------------------------#
+    #Returns the information of the hit as a tuple of simple types
+    #-------------------------------------------------------------#
+    def getState(self):
+        return (self.record,self.accession,self.patterns,self.spans,
+                self.texts,self.errors,self.score,self.pvalue)
+
+#-----Class that holds the results of a query-------------------------------#
+class MatchResults(list):
+    """
+    This class is a list of the hits found for a query, ordered from the most
+    to the least significant, leaving out any with a p-value above the
+    threshold. It also holds the patterns of the query and the number of
+    records that matched before the hits were filtered by their p-values,
+    and the statistics of the query if it was answered by match.
+    Nothing is printed when the results are found, but format gives the
+    table of results that used to be printed.
+    """
+    #-------------------------------------------------------------------#
+    #Constructor. Sets the patterns of the query, the number of records
+    #that matched and the significant hits
+    #-------------------------------------------------------------------#
+    def __init__(self,patterns,matched,hits):
+        list.__init__(self,hits)
+        self.patterns = patterns
+        self.matched = matched
+        #the QueryStats of the query, if it was answered by match
+        self.stats = None
+
+    #-----------------------------------------------------------#
+    #Returns the results as a list of simple types, to be saved
+    #-----------------------------------------------------------#
+    def getState(self):
+        hits = []
+        for hit in self:
+            hits.append(hit.getState())
+        return [self.patterns,self.matched,hits]
+
+    #-------------------------------------------------------------#
+    #Returns the headers of the hits, from the most significant
+    #-------------------------------------------------------------#
+    def accessions(self):
+        accessions = []
+        for hit in self:
+            accessions.append(hit.accession)
+        return accessions
+
+    #--------------------------------------------------------------------#
+    #Returns a table of the hits, showing for each one its accession, the
+    #text that matched each pattern, its raw score and its p-value
+    #--------------------------------------------------------------------#
+    def format(self):
+        if self.matched==0:
+            return "Sorry, could not find any results matching %s\n\n"%(self.patterns)
+        lines = []
+        if len(self)==1:
+            lines.append("One match was "+self.describe())
+        else:
+            lines.append("In order of significance, these are the %i matches"%(len(self)))
+            lines.append(self.describe())
+        lines.append("|  Record  |      In Text       |  Raw Score  |    P-Value    |")
+        lines.append("|----------|--------------------|-------------|---------------|")
+        for hit in self:
+            #some databases enclose headers in braces so remove these
+            header = hit.accession.strip('(').strip(')')
+            sur_text = ' and '.join(hit.texts)
+            len_sur_text = len(sur_text)
+            num_lines = (len_sur_text/20)+1
+            middle_line = int(floor((num_lines+1)/2.0))-1
+            for j in range(num_lines):
+                if j==middle_line:
+                    line = "|  %s  "%(header)
+                else:
+                    line = "|          "
+                if j==num_lines-1:
+                    chars = len_sur_text%20
+                    line += "|%s"%(sur_text[j*20:j*20+chars])+" "*(19-chars)+" |"
+                else:
+                    line += "|%s|"%(sur_text[j*20:(j+1)*20])
+                if j==middle_line:
+                    line += "      %.2i     |"%(hit.score)
+                    if hit.pvalue<9.999999e-99:
+                        line += "  %e|"%(hit.pvalue)
+                    else:
+                        line += "  %e |"%(hit.pvalue)
+                else:
+                    line += "             |               |"
+                lines.append(line)
+            lines.append("|----------|--------------------|-------------|---------------|")
+        return '\n'.join(lines)+"\n\n"
+
+    #-----------------------------------------------------#
+    #Returns the line of the table describing the query
+    #-----------------------------------------------------#
+    def describe(self):
+        if len(self.patterns)>1:
+            return "found containing the patterns in %s\n"%(self.patterns)
+        return "found for the pattern %s\n"%(self.patterns)
+
+#-----Class that holds the statistics of a query---------------------------#
+class QueryStats:
+    """
+    This class holds the statistics of a single query answered by match:
+    the number of records in the database, how many of them the index let
+    through for each segment and each pattern of the query and after each
+    AND or OR step of its groups, how many of these candidates were
+    verified and how many really matched, the bytes of the index and of
+    the records that were read, and the time taken by each stage. A
+    segment that lets through nearly every record shows that the code
+    words are saturated, and many more candidates than hits shows that a
+    query is unselective.
+    """
+    #The stages of a query: splitting the patterns into pieces, finding
+    #the candidates with the index, reading them, verifying them with
+    #agrepy and scoring and ranking the records that matched
+    STAGES = ["split","filter","read","verify","rank"]
+
+    #-------------------------------------------------------------------#
+    #Constructor. Sets the number of records in the database and the
+    #engine used to find the candidates, with nothing counted or timed
+    #-------------------------------------------------------------------#
+    def __init__(self,records,engine):
+        self.records = records
+        self.engine = engine
+        #the candidates of each segment of each pattern
+        self.segments = []
+        #the candidates of each pattern, that have any one of its segments
+        self.patterns = []
+        #the candidates after each step, as (operation, pattern, candidates)
+        self.steps = []
+        #the candidates that were verified and those that matched
+        self.candidates = 0
+        self.hits = 0
+        self.index_bytes = 0
+        self.record_bytes = 0
+        #set if the whole database was searched without the index, or
+        #the results came from the result cache
+        self.direct = 0
+        self.cached = 0
+        #the time in seconds taken by each stage
+        self.times = {}
+        for stage in self.STAGES:
+            self.times[stage] = 0.0
+
+    #--------------------------------------------------------------#
+    #Add the candidates of each segment of the next pattern and of
+    #the pattern as a whole
+    #--------------------------------------------------------------#
+    def addPattern(self,segments,candidates):
+        self.segments.append(segments)
+        self.patterns.append(candidates)
+
+    #--------------------------------------------------------------#
+    #Add the candidates left after the given operation ("and" or
+    #"or") combined a pattern with the candidates so far
+    #--------------------------------------------------------------#
+    def addStep(self,operation,pattern,candidates):
+        self.steps.append((operation,pattern,candidates))
+
+    #---------------------------------------------#
+    #Returns the total time taken by the query
+    #---------------------------------------------#
+    def totalTime(self):
+        total = 0.0
+        for stage in self.STAGES:
+            total += self.times[stage]
+        return total
+
+    #--------------------------------------------------------------------#
+    #Returns a report of the statistics, one line for each of them
+    #--------------------------------------------------------------------#
+    def format(self):
+        lines = []
+        lines.append("Records in database:  %i"%(self.records))
+        if self.cached:
+            lines.append("Answered from the result cache")
+        if self.direct:
+            lines.append("Searched without the index")
+        for i in xrange(len(self.patterns)):
+            lines.append("Pattern %i candidates: %i (segments %s)"%(i,
+                         self.patterns[i],self.segments[i]))
+        for operation,pattern,candidates in self.steps:
+            lines.append("After %-3s pattern %i: %i"%(operation,pattern,candidates))
+        lines.append("Candidates verified:  %i"%(self.candidates))
+        lines.append("Records matched:      %i"%(self.hits))
+        lines.append("Bytes read:           %i index, %i records"%(self.index_bytes,
+                     self.record_bytes))
+        times = []
+        for stage in self.STAGES:
+            times.append("%s %.3f"%(stage,self.times[stage]*1000.0))
+        lines.append("Time (ms):            "+", ".join(times))
+        return '\n'.join(lines)+"\n"
+
+#-----Class that ranks the records found by a query-------------------------#
+class Ranking:
+    """
+    This class scores each record found by a query as it is found, keeping
+    only the hits that are significant, and gives them as MatchResults once
+    all the records have been found. If top_k is given only the top_k most
+    significant hits are kept, in a heap with the least significant of them
+    at the top so that it can be replaced as soon as a better hit is found.
+    Hits with the same p-value are ranked in the order they were found.
+    """
+    #---------------------------------------------------------------#
+    #Constructor. Sets the patterns of the query, the number of hits
+    #to keep (or None to keep every significant hit) and the background
+    #profile of the database, if it has one
+    #---------------------------------------------------------------#
+    def __init__(self,patterns_to_match,top_k=None,profile=None):
+        self.patterns_to_match = patterns_to_match
+        self.top_k = top_k
+        self.profile = profile
+        #the number of records that matched, significant or not
+        self.matched = 0
+        #the number of hits that have been kept, which orders hits
+        #with the same p-value
+        self.num_hits = 0
+        self.hits = []
+
+    #--------------------------------------------------------------------#
+    #Score a record that matched, given its number and title, the patterns
+    #found in it and the spans and texts of their matches, and keep it if
+    #it is significant
+    #--------------------------------------------------------------------#
+    def add(self,rec_num,title,found_patterns,found_spans,found_texts):
+        self.matched += 1
+        hit = scoreRecord(self.patterns_to_match,rec_num,title,found_patterns,
+                          found_spans,found_texts,self.profile)
+        if hit.pvalue<=PVAL_THRESHOLD:
+            self.addHit(hit)
+
+    #----------------------------------------------------------------#
+    #Keep a significant hit, if it is one of the top_k found so far
+    #----------------------------------------------------------------#
+    def addHit(self,hit):
+        self.num_hits += 1
+        if self.top_k is None:
+            self.hits.append(hit)
+            return
+        #the least significant hit kept, and of those the last
+        #one found, is the smallest item and so is at the top
+        item = (-hit.pvalue,-self.num_hits,hit)
+        if len(self.hits)<self.top_k:
+            heappush(self.hits,item)
+        elif item>self.hits[0]:
+            heapreplace(self.hits,item)
+
+    #------------------------------------------------------------------#
+    #Returns the MatchResults of the hits kept, from the most significant
+    #------------------------------------------------------------------#
+    def results(self):
+        if self.top_k is None:
+            hits = self.hits[:]
+        else:
+            items = self.hits[:]
+            items.sort()
+            items.reverse()
+            hits = []
+            for item in items:
+                hits.append(item[2])
+        #the sort is stable so hits with the same p-value stay in order
+        hits.sort(key=attrgetter("pvalue"))
+        return MatchResults(list(self.patterns_to_match),self.matched,hits)
+
+#-------------------------------------------------------------------------#
+#Returns the results of a query saved with MatchResults.getState
+#-------------------------------------------------------------------------#
+def loadMatchResults(state):
+    hits = []
+    for hit in state[2]:
+        hits.append(Hit(*hit))
+    return MatchResults(state[0],state[1],hits)
+
+#-----------------------------------------------------------------------------#
+#Encode each record in db_file, from its current position up to the byte offset
+#end (or the end of the file if end is None), into the Bitwise module. Returns
+#a list of the position of each record header that was encoded
+#-----------------------------------------------------------------------------#
+def encodeRecords(db,db_file,end,piece_sizes):
+    #put frequently accessed globals into local vars
+    header_positions = []
+    add_header = header_positions.append
+    encode = encodeRecord
+    readline = db_file.readline
+    #every piece of each size is encoded by the Bitwise module in a
+    #single pass through the sequence of each record
+    for i in range(len(piece_sizes)):
+        setPieceSize(db,i,piece_sizes[i])
+    #the lines of the sequence of the current record, None before the
+    #first header
+    sequence = None
+    #find the location of the beginning of the line
+    position = db_file.tell()
+    while end is None or position<end: 
+        #read in each line individually, rather than the read ahead 
+        #in 'for line in db_file' - while this method is slower it 
+        #allows us to record the position of each record in an 
+        #index into the db
+        line=readline()
+        if not line:
+            break
+        #if we have a database body section, keep it until the
+        #whole sequence of the record has been read
+        if line[0] != '>': 
+            if sequence is not None:
+                sequence.append(line.rstrip('\n'))
+        #Otherwise it is a header, so encode the record before it and
+        #store its info
+        else:
+            if sequence:
+                residues = ''.join(sequence)
+                encode(db,residues,len(residues))
+            add_header(position)
+            allocateRecord(db)
+            sequence = []
+        #before moving on to next line, get its starting position
+        position = db_file.tell()
+    if sequence:
+        residues = ''.join(sequence)
+        encode(db,residues,len(residues))
+    return header_positions
+
+#---------------------------------------------------------------------------#
+#Returns the fewest pieces of the given sizes, none larger than largest, that
+#add up to size, with the largest pieces first (of several ways to do this the
+#one with the largest pieces earliest is chosen), or None if there are none.
+#Ways already found for each size and largest piece are kept in fitted
+#---------------------------------------------------------------------------#
+def fitPieces(size,largest,piece_sizes,fitted):
+    if size==0:
+        return []
+    key = (size,largest)
+    if key in fitted:
+        return fitted[key]
+    best = None
+    for i in xrange(len(piece_sizes)-1,-1,-1):
+        piece_size = piece_sizes[i]
+        if piece_size>largest or piece_size>size:
+            continue
+        rest = fitPieces(size-piece_size,piece_size,piece_sizes,fitted)
+        if rest is not None and (best is None or len(rest)+1<len(best)):
+            best = [piece_size]+rest
+    fitted[key] = best
+    return best
+
+#------------------------------------------------------------------------#
+#Returns an index configuration of [word width, number of set bits, piece
+#sizes] given as a list or tuple, with the piece sizes in increasing order
+#------------------------------------------------------------------------#
+def checkIndexConfig(index_config):
+    try:
+        word_width,num_set_bits,piece_sizes = index_config
+        piece_sizes = list(piece_sizes)
+        piece_sizes.sort()
+        valid = 0<num_set_bits<=word_width and piece_sizes and piece_sizes[0]>0
+        for i in xrange(1,len(piece_sizes)):
+            if piece_sizes[i]==piece_sizes[i-1]:
+                valid = 0
+    except (TypeError,ValueError):
+        valid = 0
+    if not valid:
+        error = "Error: An index configuration must be given as [word width, "
+        error += "number of set bits, piece sizes]"
+        raise Exception(error)
+    return [int(word_width),int(num_set_bits),[int(x) for x in piece_sizes]]
+
+#----------------------------------------------------------#
+#Returns a list of the position of every record header in a
+#database, without doing any indexing
+#----------------------------------------------------------#
+def findRecordHeaders(db_file):
+    header_positions = []
+    add_header = header_positions.append
+    readline = db_file.readline
+    position = db_file.tell()
+    while 1:
+        line=readline()
+        if not line:
+            break
+        if line[0] == '>':
+            add_header(position)
+        position = db_file.tell()
+    return header_positions
+
+#-------------------------------------------------------------------------#
+#Returns the size, modification time and checksum of a database, which are
+#stored in its index so that changes to the database can be detected
+#-------------------------------------------------------------------------#
+def fingerprintDatabase(db_file_name):
+    try:
+        db_stat = stat(db_file_name)
+        db_file = open(db_file_name, 'rb')
+    except (IOError,OSError):
+        error = "Error: Cannot open specified db file"
+        raise Exception(error)
+    checksum = checksumFile(db_file,None,0)
+    db_file.close()
+    return [db_stat.st_size,db_stat.st_mtime,checksum]
+
+#--------------------------------------------------------------------------#
+#Continues the checksum crc over the next length bytes of a file (or the rest
+#of the file if length is None) and returns it
+#--------------------------------------------------------------------------#
+def checksumFile(db_file,length,crc):
+    block_size = 1<<20
+    while length is None or length>0:
+        if length is not None and length<block_size:
+            block_size = length
+        block = db_file.read(block_size)
+        if not block:
+            break
+        crc = crc32(block,crc)
+        if length is not None:
+            length -= len(block)
+    return crc
+
+#-----------------------------------------------------------------------------#
+#Index a single shard of a database, usually in a worker process, writing its
+#slices to the shard slice files. Returns the number of record segments in
+#those files and the positions of the record headers in the shard
+#-----------------------------------------------------------------------------#
+def buildShard(shard):
+    db_file_name,start,end,shard_name,word_width,num_set_bits,piece_sizes = shard
+    db = initialize(word_width,num_set_bits,len(piece_sizes))
+    db_file = open(db_file_name,'r')
+    db_file.seek(start)
+    header_positions = encodeRecords(db,db_file,end,piece_sizes)
+    db_file.close()
+    bitSlice(db)
+    writeBitSlices(db,0,len(piece_sizes)-1,len(shard_name),shard_name+str(0))
+    record_segments = setDBInfo(db,0,len(header_positions))
+    clearDatabase(db)
+    return record_segments,header_positions
+
+#----------------------------------------------------------------------#
+#Read the record with its header at the given position in the database,
+#returning the title of the record and its sequence joined into one line
+#----------------------------------------------------------------------#
+def readRecord(db_file,position):
+    db_file.seek(position)
+    title = db_file.readline().split()[1]
+    rec = []
+    line = db_file.readline()
+    while(line and line[0]!='>'):
+        rec.append(line.rstrip('\n'))
+        line = db_file.readline()
+    return title,''.join(rec)
+
+#--------------------------------------------------------------------------#
+#Returns a list of the records in a dropset held as a numpy array of words,
+#ignoring the bits of the last word past the last record. Only the words
+#that are not zero are unpacked into bits, as little endian words so that
+#the bits of each word can be put in order whatever the machine
+#--------------------------------------------------------------------------#
+def dropsetRecords(dropset,num_records):
+    word_size = dropset.dtype.itemsize
+    word_length = word_size*8
+    words = numpy.flatnonzero(dropset)
+    little_endian = dropset[words].astype('<u%i'%word_size)
+    bits = numpy.unpackbits(little_endian.view(numpy.uint8))
+    #unpackbits gives the highest bit of each byte first
+    order = [(bit/8)*8+7-bit%8 for bit in xrange(word_length)]
+    rows,bits = numpy.nonzero(bits.reshape(-1,word_length)[:,order])
+    records = words[rows]*word_length+bits
+    return records[records<num_records].tolist()
+
+#---------------------------------------------------------------------------#
+#Yield the header line and the sequence (with its lines joined) of each record
+#in db_file, from its current position up to the byte offset end (or the end
+#of the file if end is None). The file is read in large blocks and each block
+#is split into whole records at once, any text before the first record is
+#ignored
+#---------------------------------------------------------------------------#
+def scanRecords(db_file,end=None):
+    if end is not None:
+        remaining = end-db_file.tell()
+    #the data always starts at the beginning of a line
+    data = '\n'
+    while 1:
+        if end is None:
+            block = db_file.read(SCAN_BLOCK_SIZE)
+        else:
+            block = db_file.read(min(SCAN_BLOCK_SIZE,remaining))
+            remaining -= len(block)
+        if block:
+            data = data+block
+            #only the records before the last one in the data are complete
+            last = data.rfind('\n>')
+            if last<=0:
+                continue
+            text = data[:last]
+            data = data[last:]
+        else:
+            text = data
+        #the text before the first header is not part of a record
+        records = text.split('\n>')
+        for i in xrange(1,len(records)):
+            rec = records[i]
+            end_header = rec.find('\n')
+            if end_header<0:
+                yield '>'+rec,''
+            else:
+                yield '>'+rec[:end_header],rec[end_header+1:].replace('\n','')
+        if not block:
+            break
 
 #------------------------------------------------------------------------------#
 #Find matches in database within specified distance of the given pattern
 #This version does not require a preprocessed database, any file in FASTA
-#format can be specified as the database parameter.
+#format can be specified as the database parameter. The database can be split
+#between a number of processes (all available cores if processes is None).
+#Returns the top_k results (or all of them if top_k is None) as MatchResults,
+#and prints them if output is set
 #------------------------------------------------------------------------------#   
-def direct_match(db_file_name,patterns,max_errors):
+def direct_match(db_file_name,patterns,max_errors,processes=1,output=0,
+                 top_k=None):
     try:
         num_patterns = len(patterns)
     except TypeError:
@@ -456,7 +2265,6 @@ def direct_match(db_file_name,patterns,max_errors):
     if num_patterns<1:
         error = "Error: At least one pattern to find must be specified"
         raise Exception(error)
-    matchers = []
     #deal with a single query specified as a string rather than a list
     patterns_to_match = []
     if type(patterns)==type("abc"):
@@ -464,212 +2272,334 @@ def direct_match(db_file_name,patterns,max_errors):
         num_patterns=1
     else:
         patterns_to_match=patterns
-    #create a pattern object for each query
-    i=0
     for pattern in patterns_to_match:
-        #if the pattern is too long simply abort, we don't want to deal
-        #with overflow issues and there are better tools out there anyway
-        #similarly if it less than 2 aa then dont proceed
-        if not 1<len(pattern)<60:
+        #if it less than 2 aa then dont proceed
+        if not 1<len(pattern):
             error = "Error: A query protein had a length outside the range supported by this program"
             raise Exception(error)
-        matchers.append(compile(pattern,len(pattern),max_errors[i]))
-        i+=1
+    checkTopK(top_k)
     #open the specified database for reading    
     try:
         db_file = open(db_file_name, 'r')
     except IOError:
         error = "Error: Cannot open specified db file"
         raise Exception(error)     
-    #storage for database information 
-    rec = []
-    header = ''
-    #storage for information about each match
-    #this allows for later calculation of p values and
-    #output of this information to the user
-    results_record_headers = []
-    results_surrounding_text = []
-    num_match_recs = 0
+    #each record that matches is scored straight away, keeping
+    #only the ones that will be returned
+    ranking = Ranking(patterns_to_match,top_k,openProfile(db_file_name))
     #begin parsing database 
-    for line in db_file:           
-        #database body section
-        if line[0] != '>':
-            rec.append(line[:-1])               
-        #database header
-        else:  
-            #attempt to match with previous body section
-            record = ''.join(rec)
-            begin_rec = 0
-            for i in range(num_patterns):
-                matches = agrepy(patterns_to_match[i], len(patterns_to_match[i]),\
-                                 record,len(record),1,matchers[i])
-                if matches:
-                    if begin_rec==0:
-                        begin_rec = 1
-                        num_match_recs +=1
-                    results_record_headers.append(split(header)[1])
-                    pattern_matches = []
-                    for elm in matches:
-                        #for some large strings on 64 bit platforms sagrepy can return invalid
-                        #match data, so remove this here rather than risk problems later
-                        if elm[0]<elm[1]:
-                            pattern_matches.append(record[elm[0]:elm[1]]) 
-                    results_surrounding_text.append(pattern_matches)                  
-            rec = []
-            header = line
-    #attempt to match the final body section
-    record = ''.join(rec)
-    begin_rec = 0
-    for i in range(num_patterns):
-        matches = agrepy(patterns_to_match[i],\
-                    len(patterns_to_match[i]),record,len(record),1,matchers[i])
+    if processes is None and Pool is not None:
+        processes = cpu_count()
+    if processes>1 and Pool is not None:
+        #split the database at record boundaries into parts that
+        #are each searched by a worker process
+        parts = splitDatabase(db_file,processes*FastaDatabase.SHARDS_PER_PROCESS)
+        shards = []
+        for start,end in parts:
+            shards.append((db_file_name,start,end,patterns_to_match,max_errors,
+                           top_k))
+        pool = Pool(processes)
+        shard_results = pool.map(scanShard,shards)
+        pool.close()
+        pool.join()
+        #join the hits of the parts, which are in database order,
+        #numbering their records from the start of the database
+        first = 0
+        for matched,hits,num_records in shard_results:
+            ranking.matched += matched
+            for hit in hits:
+                hit = Hit(*hit)
+                hit.record += first
+                ranking.addHit(hit)
+            first += num_records
+    else:
+        matchRecords(scanRecords(db_file),patterns_to_match,max_errors,ranking)
+    #end parsing database
+    db_file.close()
+    #now output results to the user if asked
+    results = ranking.results()
+    if output:
+        sys.stdout.write(results.format())
+    return results
+  
+#--------------------------------------------------------------------------#
+#Returns the key a query is kept under in a result cache, the same for any
+#query that is matched in the same way. max_errors must already have been
+#changed to be between 1 and 8, as match does
+#--------------------------------------------------------------------------#
+def resultKey(patterns_to_match,groups,max_errors,top_k):
+    key_groups = []
+    for group in groups:
+        key_groups.append(tuple(group))
+    return (tuple(patterns_to_match),tuple(key_groups),tuple(max_errors),top_k)
+
+#--------------------------------------------------------------------------#
+#Check the number of results asked for is None or a positive number
+#--------------------------------------------------------------------------#
+def checkTopK(top_k):
+    if top_k is not None and (type(top_k) is not type(1) or top_k<1):
+        error = "Error:  The number of results must be a positive integer"
+        raise Exception(error)
+
+#--------------------------------------------------------------------------#
+#Returns a matcher for the patterns, each with its number of errors, that
+#searches a text for all of them at once, reusing one compiled recently
+#--------------------------------------------------------------------------#
+def compileMatcher(patterns_to_match,max_errors):
+    return matcher_cache.getMultiMatcher(patterns_to_match,max_errors)
+
+#---------------------------------------------------------------------------#
+#Returns the positions of the patterns found in a record, given the matches of
+#each pattern in it as (start,end,errors), along with the spans (starting no
+#earlier than the record) and texts of the matches of each of them
+#---------------------------------------------------------------------------#
+def foundPatterns(all_matches,record):
+    found_patterns = []
+    found_spans = []
+    found_texts = []
+    for i in xrange(len(all_matches)):
+        matches = all_matches[i]
         if matches:
-            if begin_rec==0:
-                begin_rec = 1
-                num_match_recs +=1
-            results_record_headers.append(split(header)[1])
-            pattern_matches = []
+            spans = []
+            texts = []
             for elm in matches:
+                start=0
+                if elm[0]>0:
+                    start = elm[0]
                 #for some large strings on 64 bit platforms sagrepy can return invalid
                 #match data, so remove this here rather than risk problems later
-                if elm[0]<elm[1]:
-                    pattern_matches.append(record[elm[0]:elm[1]])  
-            results_surrounding_text.append(pattern_matches)  
-    #end parsing database
-    #now calculate p values and output results to the user
-    outputResults(patterns_to_match,num_match_recs,results_record_headers,results_surrounding_text)
+                if start>=elm[1]:
+                    continue
+                spans.append((start,elm[1],elm[2]))
+                texts.append(record[start:elm[1]]) 
+            found_patterns.append(i)
+            found_spans.append(spans)
+            found_texts.append(texts)
+    return found_patterns,found_spans,found_texts
+
+#---------------------------------------------------------------------------#
+#Search each of the records given as (header, sequence) for the patterns with
+#the given numbers of errors, adding each record that matched to the ranking
+#(numbered from the first record given). Returns the number of records
+#---------------------------------------------------------------------------#
+def matchRecords(records,patterns_to_match,max_errors,ranking):
+    matcher = compileMatcher(patterns_to_match,max_errors)
+    rec_num = 0
+    for header,record in records:
+        #only the matches with the fewest errors need to be scored
+        found_patterns,found_spans,found_texts = \
+            foundPatterns(matcher.match(record,1,1),record)
+        if found_patterns:
+            ranking.add(rec_num,split(header)[1],found_patterns,found_spans,
+                        found_texts)
+        rec_num += 1
+    return rec_num
+
+#--------------------------------------------------------------------------#
+#Split a database into about the given number of parts, each starting at the
+#header of a record. Returns a list of the (start,end) offsets of the parts
+#--------------------------------------------------------------------------#
+def splitDatabase(db_file,parts):
+    db_file.seek(0,2)
+    size = db_file.tell()
+    starts = [0]
+    for i in xrange(1,parts):
+        #look for the first record header after the expected start
+        #of this part, which is after the start of the last part
+        position = max(size*i/parts,starts[-1]+1)-1
+        db_file.seek(position)
+        last_char = ''
+        start = None
+        while start is None:
+            block = db_file.read(65536)
+            if not block:
+                break
+            found = (last_char+block).find('\n>')
+            if found>=0:
+                start = position-len(last_char)+found+1
+            last_char = block[-1]
+            position += len(block)
+        if start is None:
+            break
+        starts.append(start)
+    db_file.seek(0)
+    parts = []
+    for i in xrange(len(starts)-1):
+        parts.append((starts[i],starts[i+1]))
+    parts.append((starts[-1],size))
+    return parts
+
+#--------------------------------------------------------------------------#
+#Search a single part of a database, usually in a worker process, for the
+#patterns. Returns the number of records in the part that matched, the state
+#of each hit that is kept (numbered from the start of the part) and the
+#number of records in the part
+#--------------------------------------------------------------------------#
+def scanShard(shard):
+    db_file_name,start,end,patterns_to_match,max_errors,top_k = shard
+    ranking = Ranking(patterns_to_match,top_k,openProfile(db_file_name))
+    db_file = open(db_file_name,'r')
+    db_file.seek(start)
+    num_records = matchRecords(scanRecords(db_file,end),patterns_to_match,
+                               max_errors,ranking)
     db_file.close()
-    #Finally return result headers to the caller in case
-    #they wish to make use of them in some other way
-    return results_record_headers  
-  
+    return ranking.matched,ranking.results().getState()[2],num_records
+
+#--------------------------------------------------------------------------#
+#Returns the background profile kept next to a database if there is one and
+#it was made from the database as it is now, otherwise None. If create is
+#set a missing or out of date profile is created from the given number of
+#samples, split between a number of processes
+#--------------------------------------------------------------------------#
+def openProfile(db_file_name,create=0,samples=PROFILE_SAMPLES,processes=1):
+    fingerprint = profileFingerprint(db_file_name)
+    profile = BackgroundProfile(db_file_name[0:-6]+".prof")
+    if not profile.load(fingerprint):
+        if not create:
+            return None
+        print "    Creating background profile"
+        profile.build(db_file_name,fingerprint,samples,processes)
+    #a database with no records has nothing to profile
+    if not profile.means:
+        return None
+    return profile
+
+#--------------------------------------------------------------------------#
+#Returns the size and modification time of a database, which a background
+#profile must have been made from to be used for it
+#--------------------------------------------------------------------------#
+def profileFingerprint(db_file_name):
+    try:
+        db_stat = stat(db_file_name)
+    except OSError:
+        error = "Error: Cannot open specified db file"
+        raise Exception(error)
+    return [db_stat.st_size,db_stat.st_mtime]
+
+#--------------------------------------------------------------------------#
+#Returns the sequences of a random sample of the records given as (header,
+#sequence), of up to the given size, chosen with the random generator
+#--------------------------------------------------------------------------#
+def sampleRecords(records,size,generator):
+    sample = []
+    seen = 0
+    for header,record in records:
+        seen += 1
+        #every record seen so far is in the sample with the same chance
+        if len(sample)<size:
+            sample.append(record)
+        else:
+            i = generator.randrange(seen)
+            if i<size:
+                sample[i] = record
+    return sample
+
+#--------------------------------------------------------------------------#
+#Returns the given number of segments of a length cut at random from the
+#records, which must be at least that long
+#--------------------------------------------------------------------------#
+def cutSegments(records,length,samples,generator):
+    segments = []
+    random = generator.random
+    num_records = len(records)
+    for i in xrange(samples):
+        record = records[int(random()*num_records)]
+        start = int(random()*(len(record)-length+1))
+        segments.append(record[start:start+length])
+    return segments
+
+#--------------------------------------------------------------------------#
+#Aligns each of a list of segments with the segment in the same position
+#of a second list, given together. Returns the mean and standard deviation
+#of the scores
+#--------------------------------------------------------------------------#
+def scoreSegments(task):
+    segments,texts = task
+    scores = score_batch(segments,texts)
+    total = 0
+    total_squares = 0
+    for this_score in scores:
+        total += this_score
+        total_squares += this_score*this_score
+    mean = float(total)/len(scores)
+    variance = float(total_squares)/len(scores)-mean*mean
+    if variance<0:
+        variance = 0
+    return mean,variance**0.5
+
 #------------------------------------------------------------------------------------------------------------------
 #Statistical data on the background 'noise' of a typical FASTA database, computed from multiple runs of a
 #a sample database (without filtering). These model the mean and standard deviation of the expected distribution #for each length query we could input for a match, from 1-79 inclusive. Note that the standard deviations are 
-#still very wonky and are not currently used. TODO - fix generateBackgroundProfile, hopefully to generate these 
-#on the fly for different databases. See generateBackgroundProfile for how these are computed.
+#still very wonky and are not currently used. These are only used for databases without a BackgroundProfile, 
+#which gives the means and standard deviations for a particular database (see openProfile).
 means = [0.0576, 0.2060, 0.4227, 0.6167, 0.7813, 0.9330, 1.0194, 1.1055, 1.1532, 1.2232, 1.2708, 1.3107, 1.3779, 1.4190, 1.4751, 1.5233, 1.5680, 1.6106, 1.6532, 1.6971, 1.7290, 1.7653, 1.7979, 1.8408, 1.8838, 1.9175, 1.9429, 1.9744, 2.0082, 2.0253, 2.0481, 2.0724, 2.1001, 2.1122, 2.1365, 2.1729, 2.1979, 2.2104, 2.2427, 2.2739, 2.2839, 2.3123, 2.3111, 2.3388, 2.3891, 2.3998, 2.4093, 2.4425, 2.4651, 2.5089, 2.5061, 2.5610, 2.5678, 2.6084, 2.5905, 2.6712, 2.6958, 2.7556, 2.7995, 2.7929, 2.7638, 2.7955, 2.8336, 2.8287, 2.9153, 2.9848, 2.9831, 3.0588, 3.1133, 2.9859, 3.1840, 3.1121, 3.1644, 3.2074, 3.2510, 3.3560, 3.3798, 3.4434, 3.3666]
 
-#---------------------------------------------------------------
-# For all matches calculate p-values and print results to screen
-#--------------------------------------------------------------- 
-def outputResults(patterns_to_match,num_match_recs,results_record_headers,results_surrounding_text):
-    total_pat = len(results_record_headers)
-    if(num_match_recs>0):
-        #score matches and generate p values
-        rslt_scores = []
-        pvalues = {}
-        pat_nums = []
-        max_elms = []
-        cum_pat_num = 0
-        i=0
-        j=0
-        while i<total_pat: 
-            scr = 0
-            pval = 1.0   
-            pat_num = 0
-            this_header=results_record_headers[i]
-            while i<total_pat and results_record_headers[i]==this_header:
-                #if there are multiple matches in this record for this pattern
-                #then find the most likely and use its score
-                max_score=0
-                max_elm=0
-                max_len=1
-                elmnt = 0
-                for elm in results_surrounding_text[i]:
-                    len_sur_text = len(elm)
-                    this_score = score(len_sur_text,patterns_to_match[pat_num],elm)   
-                    if this_score>max_score:
-                        max_score=this_score
-                        max_len = len_sur_text
-                        max_elm = elmnt
-                    elmnt += 1
-                max_elms.append(max_elm)
-                #Assume values for rslt_score can be modelled by random variable X, 
-                #having a normal distribution with mean M and standard deviation S. 
-                #We get values for M and S from precomputed statistical data for 
-                #this type of database and then we use them to normalize X 
-                #to the standard normal distribution, by using the conversion 
-                #Z = X - M / S, where Z is the random variable modelling the standard 
-                #normal distribution. Thus, we can convert any result score value in
-                #X to an equivalent value in Z, and this normalised value can be fed
-                #into the Gaussian function, which uses the erfc function to find the
-                #probability of X > rslt_score and X < -rslt_score, which is the
-                #p value for this score. 
-                #TODO use tables of means and standard deviations as follows:
-                #gaussian((rslt_score-means[min_len-1])/stdevs[min_len-1])
-                standardised_mean = max_score-means[max_len-1]
-                if standardised_mean<0:
-                    standardised_mean = 0
-                pval *= gaussian(standardised_mean)
-                scr += max_score
-                pat_num+=1
-                i+=1  
-            cum_pat_num+=pat_num
-            pat_nums.append(cum_pat_num) 
-            rslt_scores.append(scr)            
-            pvalues[j] =  pval
-            j+=1
-        #find ordering by pvals of results
-        ordered = {}
-        ordered = sorted(pvalues.items(),key=itemgetter(1))
-        ordering = []
-        cutoff = PVAL_THRESHOLD
-        for elm in ordered:
-            if elm[1]<=cutoff:
-                ordering.append(elm[0])
-            else:
-                num_match_recs-=1
-        #now print all this data, sorting according to p-values
-        if(num_match_recs==1):
-            print "One match was",
+#--------------------------------------------------------------------------#
+#Calculate the score and p-value of a record that matched, given its number
+#and title, the patterns found in it and the spans (with their errors) and
+#texts of their matches. The scores are compared with the background profile
+#of the database if one is given, otherwise with the means table above.
+#Returns a Hit with the best match of each pattern
+#--------------------------------------------------------------------------#
+def scoreRecord(patterns_to_match,rec_num,title,found_patterns,found_spans,
+                found_texts,profile=None):
+    scr = 0
+    pval = 1.0
+    best_spans = []
+    best_texts = []
+    best_errors = []
+    #align every text found against its pattern in a single call
+    segments = []
+    all_texts = []
+    for i in range(len(found_patterns)):
+        texts = found_texts[i]
+        segments.extend([patterns_to_match[found_patterns[i]]]*len(texts))
+        all_texts.extend(texts)
+    scores = score_batch(segments,all_texts)
+    next_score = 0
+    for i in range(len(found_patterns)):
+        #if there are multiple matches in this record for this pattern
+        #then find the most likely and use its score
+        max_score=0
+        max_elm=0
+        max_len=1
+        texts = found_texts[i]
+        elmnt = 0
+        for elm in texts:
+            this_score = scores[next_score]
+            next_score += 1
+            if this_score>max_score:
+                max_score=this_score
+                max_len = len(elm)
+                max_elm = elmnt
+            elmnt += 1
+        if texts:
+            best_spans.append(found_spans[i][max_elm][0:2])
+            best_texts.append(texts[max_elm])
+            best_errors.append(found_spans[i][max_elm][2])
         else:
-            print "In order of significance, these are the %i matches"%(num_match_recs)
-        if len(patterns_to_match)>1:
-            print "found containing the patterns in %s\n"%(patterns_to_match)
+            best_spans.append(None)
+            best_texts.append("")
+            best_errors.append(None)
+        #Assume values for rslt_score can be modelled by random variable X, 
+        #having a normal distribution with mean M and standard deviation S. 
+        #We get values for M and S from precomputed statistical data for 
+        #this type of database and then we use them to normalize X 
+        #to the standard normal distribution, by using the conversion 
+        #Z = X - M / S, where Z is the random variable modelling the standard 
+        #normal distribution. Thus, we can convert any result score value in
+        #X to an equivalent value in Z, and this normalised value can be fed
+        #into the Gaussian function, which uses the erfc function to find the
+        #probability of X > rslt_score and X < -rslt_score, which is the
+        #p value for this score. Without a profile of the database only the
+        #means are known, so the score is not divided by S
+        if profile is not None:
+            standardised_mean = profile.standardise(max_score,max_len)
         else:
-            print "found for the pattern %s\n"%(patterns_to_match)
-        print "|  Record  |      In Text       |  Raw Score  |    P-Value    |" 
-        print "|----------|--------------------|-------------|---------------|" 
-        for i in range(num_match_recs):
-            num = ordering[i]
-            surd_text = []
-            if num!=0:
-                lower = pat_nums[num-1]
-            else:
-                lower=0
-            header = results_record_headers[lower]
-            #some databases enclose headers in braces so remove these
-            header = header.strip('(').strip(')')
-            for j in range(lower,pat_nums[num]):
-                surd_text.append(results_surrounding_text[j][max_elms[j]])
-                surd_text.append(" and ")
-            sur_text = ''.join(surd_text[:-1])
-            len_sur_text = len(sur_text)
-            num_lines = (len_sur_text/20)+1
-            middle_line = int(floor((num_lines+1)/2.0))-1
-            for j in range(num_lines):
-                if j==middle_line: 
-                    print "|  %s "%(header),
-                else:
-                    print "|         ",
-                if j==num_lines-1:
-                    chars = len_sur_text%20
-                    print "|%s"%(sur_text[j*20:j*20+chars]),
-                    for k in range(19-chars):
-                        print "",
-                    print "|",
-                else:        
-                    print "|%s|"%(sur_text[j*20:(j+1)*20]),
-                if j==middle_line:
-                    print "     %.2i     |"%(rslt_scores[num]),
-                    if pvalues[num]<9.999999e-99:
-                        print " %e|"%(pvalues[num])
-                    else:
-                        print " %e |"%(pvalues[num])
-                else:
-                    print "            |               |"
-            print "|----------|--------------------|-------------|---------------|"
-    else:
-        print "Sorry, could not find any results matching %s"%(patterns_to_match)
-    print ""
\ No newline at end of file
+            standardised_mean = max_score-means[min(max_len,len(means))-1]
+            if standardised_mean<0:
+                standardised_mean = 0
+        pval *= gaussian(standardised_mean)
+        scr += max_score
+    return Hit(rec_num,title,found_patterns,best_spans,best_texts,best_errors,scr,
+               pval)
\ No newline at end of file
@@ -0,0 +1,17 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <math.h>
+
+/* The scores of a batch of alignments */
+typedef struct score_list
+{
+  int length;
+  int *scores;
+} score_list;
+
+extern double gaussian(double x);
+extern int local_score(char *seg1, int len1, char *seg2, int len2);
+extern int score(int len, char *seg1, char *seg2);
+extern score_list *score_batch(int num_segs1, char **segs1, int *lens1,
+                               int num_segs2, char **segs2, int *lens2);
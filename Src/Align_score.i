@@ -1,7 +1,62 @@
 %module Align_score
 %{
-extern double gaussian(double x);
-extern int score(int len, char *seg1, char *seg2);
+#include "Align_score.h"
 %}
+typedef struct score_list score_list;
+
+%typemap(python, out) score_list * {
+  score_list *slist = $1;
+  PyObject *retlist;
+  int i;
+
+  /* the result is set rather than returned, so that the
+     segment arrays are still freed by the freearg typemap */
+  if(slist == NULL) {
+    Py_INCREF(Py_None);
+    $result = Py_None;
+  }
+  else {
+    retlist = PyList_New(slist -> length);
+    for(i=0; i < slist -> length; i++)
+      PyList_SetItem(retlist, i, PyInt_FromLong(slist -> scores[i]));
+    free(slist -> scores);
+    free(slist);
+    $result = retlist;
+  }
+}
+
+%typemap(python, in) (int num_segs1, char **segs1, int *lens1),
+                     (int num_segs2, char **segs2, int *lens2) {
+  int i;
+  PyObject *seg;
+
+  if(!PyList_Check($input)) {
+    PyErr_SetString(PyExc_TypeError, "Expected a list of segments");
+    SWIG_fail;
+  }
+  $1 = (int) PyList_Size($input);
+  $2 = (char **) malloc(($1 + 1) * sizeof(char *));
+  $3 = (int *) malloc(($1 + 1) * sizeof(int));
+  for(i=0; i < $1; i++) {
+    seg = PyList_GetItem($input, i);
+    if(!PyString_Check(seg)) {
+      /* the arrays of both lists are freed by the freearg typemap */
+      PyErr_SetString(PyExc_TypeError, "Expected a list of segments");
+      SWIG_fail;
+    }
+    $2[i] = PyString_AsString(seg);
+    $3[i] = (int) PyString_Size(seg);
+  }
+}
+
+%typemap(python, freearg) (int num_segs1, char **segs1, int *lens1),
+                          (int num_segs2, char **segs2, int *lens2) {
+  free($2);
+  free($3);
+}
+
 extern double gaussian(double x);
+extern int local_score(char *seg1, int len1, char *seg2, int len2);
 extern int score(int len, char *seg1, char *seg2);
+extern score_list *score_batch(int num_segs1, char **segs1, int *lens1,
+                               int num_segs2, char **segs2, int *lens2);
@@ -15,91 +15,138 @@
     with this program; if not, write to the Free Software Foundation, Inc.,
     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 */
-#include <stdio.h>
-#include <stdlib.h>
-//the wordlength (in bits) used to store unsigned ints
-//(our bitword storage containers) on this machine
-int WORDLENGTH;
-//the actual wordlength of the strings in bit_strings
-//this will be rounded up to the nearest 32 bit 
-//word boundary for storage in bit_strings, the
-//extra padding is discarded when bit slicing
-int STRINGWORDLENGTH;
-//the number of bits in each word to set to 1
-int NUMSETBITS;
-//An array of ints, each one representing a bit string
-unsigned int *bit_strings;
-//the number of segments each string has to be broken into
-//due to it being larger than the wordlength
-int bit_string_segments;
-//the number of logical elements in the bit_string array
-int bit_string_elms;
-//the bits to set for the current code word
-unsigned int *result;
-//An array of horizontal slices of the bit_string array
-unsigned int *bit_slices;
-//the number of words needed to store a slice of all 
-//records for a bit string array
-int record_segments;
-//An array of records that sucessfully match some input
-unsigned int *dropset;
-//the records that match each query piece
-unsigned int *segments;
-//number of sections
-int sections;
-//Array of all bit slice arrays
-unsigned int **slices;
-//the size of this array
-int slice_size;
-
-//Set up parameters for this database
-void initialize(int word_len,int num_set_bits)
-{
-    WORDLENGTH = sizeof(unsigned int) * 8;
-    STRINGWORDLENGTH = word_len;
-    NUMSETBITS = num_set_bits;
-    bit_string_segments = ((word_len-1)/WORDLENGTH)+1;
-    if((result=malloc(sizeof(unsigned int)*bit_string_segments))==NULL)
+#include "Bitwise.h"
+//Where possible slice files are memory mapped rather than read into
+//memory, so that they load lazily and are shared between processes
+#if defined(unix) || defined(__unix__) || defined(__unix) || defined(__APPLE__)
+#define MAP_SLICES
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#endif
+
+static void buildPieceTable(bitwise_db *db);
+
+//Set up parameters for a new database and return it
+bitwise_db *initialize(int word_len,int num_set_bits,int num_pieces)
+{
+    int i;
+    bitwise_db *db;
+    if((db=malloc(sizeof(bitwise_db)))==NULL)
+    {
+        printf("Insufficent memory for creation of database\n");
+        exit(1); 
+    }
+    db->string_word_length = word_len;
+    db->num_set_bits = num_set_bits;
+    db->num_pieces = num_pieces;
+    db->bit_string_segments = ((word_len-1)/WORDLENGTH)+1;
+    if((db->result=malloc(sizeof(unsigned int)*db->bit_string_segments))==NULL ||
+       (db->piece_bits=malloc(sizeof(int)*num_set_bits))==NULL)
     {
         printf("Insufficent memory for creation of result array\n");
         exit(1); 
     }
-    bit_string_elms=0;
-    record_segments=0;
-    sections = 0;
-    slice_size=0;
+    if((db->bit_strings=malloc(sizeof(unsigned int *)*num_pieces))==NULL ||
+       (db->bit_slices=malloc(sizeof(unsigned int *)*num_pieces))==NULL ||
+       (db->piece_sizes=malloc(sizeof(int)*num_pieces))==NULL)
+    {
+        printf("Insufficent memory for creation of piece arrays\n");
+        exit(1); 
+    }
+    for(i=0;i<num_pieces;i++)
+    {
+        db->bit_strings[i]=NULL;
+        db->bit_slices[i]=NULL;
+        db->piece_sizes[i]=0;
+    }
+    db->bit_string_elms=0;
+    db->record_segments=0;
+    db->slices=NULL;
+    db->slice_size=0;
+    db->slice_bytes=0;
+    buildPieceTable(db);
+    return db;
 }
 
-//Writes the completed bit_slices array to the specified location
-void writeBitSlices(char *file_loc)
+//Writes the completed bit_slices arrays to disk, one slice file per
+//piece size. Uses the same file naming scheme as loadBitSlices. The
+//slices are held in memory by record segment but are written by bit,
+//so that matching only needs to touch the parts of the file it uses.
+//Each file is written under a temporary name and renamed into place, as
+//other processes may have the old file mapped
+void writeBitSlices(bitwise_db *db,int start_idx,int end_idx,
+                    int pos_to_replace,char *firstName)
 {
-    int num_ints = record_segments*STRINGWORDLENGTH;
+    int i;
+    int j;
+    int k;
+    int record_segments = db->record_segments;
+    int string_word_length = db->string_word_length;
+    unsigned int *row;
+    char *tmpName;
     FILE *fp;
-    if((fp=fopen(file_loc, "wb"))==NULL) 
+    if((row=malloc(sizeof(unsigned int)*record_segments))==NULL ||
+       (tmpName=malloc(strlen(firstName)+5))==NULL)
     {
-        printf("Cannot open a slices file for writing.\n");
-        exit(1);
+        printf("Insufficent memory for writing a slices file\n");
+        exit(1); 
     }
-    if(fwrite(bit_slices, sizeof(unsigned int), num_ints, fp) != num_ints) 
+    for(i=start_idx;i<=end_idx;i++)
     {
-        printf("Error writing to a slices file.\n");
-        exit(1);
+        firstName[pos_to_replace]=i + '0';
+        sprintf(tmpName,"%s.tmp",firstName);
+        if((fp=fopen(tmpName, "wb"))==NULL) 
+        {
+            printf("Cannot open a slices file for writing.\n");
+            exit(1);
+        }
+        for(k=0;k<string_word_length;k++)
+        {
+            for(j=0;j<record_segments;j++)
+                row[j]=db->bit_slices[i-start_idx][j*string_word_length+k];
+            if(fwrite(row, sizeof(unsigned int), record_segments, fp) != record_segments) 
+            {
+                printf("Error writing to a slices file.\n");
+                exit(1);
+            }
+        }
+        fclose(fp);
+        //rename will not replace an existing file on all platforms
+        remove(firstName);
+        if(rename(tmpName,firstName)!=0)
+        {
+            printf("Cannot replace a slices file.\n");
+            exit(1);
+        }
+        free(db->bit_slices[i-start_idx]);
+        db->bit_slices[i-start_idx]=NULL;
     }
-    fclose(fp);
-    free(bit_slices);
-    bit_slices=NULL;
+    free(tmpName);
+    free(row);
 }
 
-//Load all slice files from disk to slice array
+//Load all slice files from disk to slice array, memory mapping them
+//where this is supported. If prefetch is set the operating system is
+//asked to start reading the mapped files in the background
 //Assumes that the idx files are consecutive between start and end
 //and that they are all in the range 0 to 9
-void loadBitSlices(int start_idx,int end_idx,int pos_to_replace,char *firstName)
+void loadBitSlices(bitwise_db *db,int start_idx,int end_idx,
+                   int pos_to_replace,char *firstName,int prefetch)
 {
     int i;
-    int num_ints = record_segments*STRINGWORDLENGTH;
+    int num_ints = db->record_segments*db->string_word_length;
+    unsigned int **slices;
+#ifdef MAP_SLICES
+    int fd;
+    struct stat file_info;
+#else
     FILE *fp;
-    slice_size = (end_idx-start_idx)+1;
-    if ((slices=malloc(sizeof(unsigned int *)*slice_size))==NULL)
+#endif
+    db->slice_size = (end_idx-start_idx)+1;
+    db->slice_bytes = sizeof(unsigned int)*(size_t)num_ints;
+    if ((slices=db->slices=malloc(sizeof(unsigned int *)*db->slice_size))==NULL)
     {
         printf("Not enough memory for slice array\n");
         exit(1); 
@@ -107,12 +154,33 @@ void loadBitSlices(int start_idx,int end_idx,int pos_to_replace,char *firstName)
     for(i=start_idx;i<=end_idx;i++)
     {
         firstName[pos_to_replace]=i + '0';
+#ifdef MAP_SLICES
+        if((fd=open(firstName, O_RDONLY))==-1) 
+        {
+            printf("Cannot open slice file for reading.\n");
+            exit(1);
+        }
+        if(fstat(fd,&file_info)==-1 || file_info.st_size<db->slice_bytes)
+        {
+            printf("Premature end of slice file (possibly due to out of date index files)\n");
+            exit(1);
+        }
+        slices[i-start_idx]=mmap(NULL,db->slice_bytes,PROT_READ,MAP_SHARED,fd,0);
+        if(slices[i-start_idx]==MAP_FAILED)
+        {
+            printf("Cannot map slice file into memory\n");
+            exit(1); 
+        }
+        if(prefetch)
+            madvise(slices[i-start_idx],db->slice_bytes,MADV_WILLNEED);
+        close(fd);
+#else
         if((fp=fopen(firstName, "rb"))==NULL) 
         {
             printf("Cannot open slice file for reading.\n");
             exit(1);
         }
-        if ((slices[i-start_idx]=malloc(sizeof(unsigned int )*num_ints))==NULL)
+        if ((slices[i-start_idx]=malloc(db->slice_bytes))==NULL)
         {
             printf("Not enough memory for slice array row\n");
             exit(1); 
@@ -124,218 +192,668 @@ void loadBitSlices(int start_idx,int end_idx,int pos_to_replace,char *firstName)
             exit(1);
         }
         fclose(fp);
+#endif
     }
 }
 
-//Resets indexing information about the database
-//and returns the number of bit_string_elms
-int resetDBInfo()
-{
-    int tmp_bse = bit_string_elms;
-    record_segments=0;
-    bit_string_elms=0;
-    return tmp_bse;
-}
-
 //Sets indexing information for the database after processing
 //Returns the previous number of record_segments
 //if a 0 is given in the first parameter
-int setDBInfo(int rec_segs,int bselms)
+int setDBInfo(bitwise_db *db,int rec_segs,int bselms)
 {
     if(rec_segs!=0)
-        record_segments=rec_segs;
-    bit_string_elms=bselms;
-    return record_segments;
+        db->record_segments=rec_segs;
+    db->bit_string_elms=bselms;
+    return db->record_segments;
 }
 
-//Creates a new array of bit slices from the stored array of
-//bit strings, and then frees the memory in this old array
-void bitSlice()
+//Creates a new array of bit slices from each stored array of
+//bit strings, and then frees the memory in these old arrays
+void bitSlice(bitwise_db *db)
 {
     int j;
     int i;
-    int bit_word_elms=((bit_string_elms-1)%WORDLENGTH)+1;
-    if((bit_slices=realloc(bit_slices,sizeof(unsigned int)*
-                            ++record_segments*STRINGWORDLENGTH))==NULL)
+    int k;
+    int string_word_length = db->string_word_length;
+    int bit_string_segments = db->bit_string_segments;
+    int bit_word_elms=((db->bit_string_elms-1)%WORDLENGTH)+1;
+    unsigned int *cur_slices;
+    unsigned int *cur_strings;
+    ++db->record_segments;
+    for(k=0;k<db->num_pieces;k++)
     {
-        printf("bit_slices out of memory\n");
-        exit(1); 
-    } 
-    for (i=0;i<STRINGWORDLENGTH;i++)
-        bit_slices[(record_segments-1)*STRINGWORDLENGTH+i]=0;
-    for(i=0;i<STRINGWORDLENGTH;i++)
-        for(j=0;j<bit_word_elms;j++)
-            if((1<<(i%WORDLENGTH)) & 
-                    bit_strings[(j*bit_string_segments)+(i/WORDLENGTH)])
-                bit_slices[((record_segments-1)*STRINGWORDLENGTH)+i] |= 1<<j;
-    free(bit_strings);
+        if((db->bit_slices[k]=realloc(db->bit_slices[k],sizeof(unsigned int)*
+                            db->record_segments*string_word_length))==NULL)
+        {
+            printf("bit_slices out of memory\n");
+            exit(1); 
+        } 
+        cur_slices = db->bit_slices[k]+(db->record_segments-1)*string_word_length;
+        cur_strings = db->bit_strings[k];
+        for (i=0;i<string_word_length;i++)
+            cur_slices[i]=0;
+        for(i=0;i<string_word_length;i++)
+            for(j=0;j<bit_word_elms;j++)
+                if((1<<(i%WORDLENGTH)) & 
+                        cur_strings[(j*bit_string_segments)+(i/WORDLENGTH)])
+                    cur_slices[i] |= 1<<j;
+        free(db->bit_strings[k]);
+        db->bit_strings[k]=NULL;
+    }
 }
 
 //Allocates memory and stores information about a new record to be parsed
-void allocateRecord()
+void allocateRecord(bitwise_db *db)
 {
     int i;
+    int k;
     int alloc_size;
-    if(bit_string_elms%WORDLENGTH==0)
+    if(db->bit_string_elms%WORDLENGTH==0)
     {
-        if(bit_string_elms!=0)
+        if(db->bit_string_elms!=0)
         {
-            bitSlice();
+            bitSlice(db);
         }
-        alloc_size=bit_string_segments*WORDLENGTH;
-        if ((bit_strings=malloc(sizeof(unsigned int)*alloc_size))==NULL)
+        alloc_size=db->bit_string_segments*WORDLENGTH;
+        for(k=0;k<db->num_pieces;k++)
         {
-            printf("bit_strings out of memory\n");
-            exit(1); 
+            if ((db->bit_strings[k]=malloc(sizeof(unsigned int)*alloc_size))==NULL)
+            {
+                printf("bit_strings out of memory\n");
+                exit(1); 
+            }
+            for (i=0;i<alloc_size;i++)
+                db->bit_strings[k][i]=0;
         }
-        for (i=0;i<alloc_size;i++)
-            bit_strings[i]=0;
     }
-    bit_string_elms+=1;
+    db->bit_string_elms+=1;
 }
 
-//Encode and store a piece of the database using
-//the method of Superimposed Code Words
-void encodeDBPiece(char *piece)
+//Returns the code of a residue, as described for RESIDUE_BITS
+int residueCode(char residue)
+{
+    if(residue>='A' && residue<='Z')
+        return residue-'A';
+    if(residue>='a' && residue<='z')
+        return residue-'a';
+    if(residue=='*')
+        return 26;
+    if(residue=='-')
+        return 27;
+    return NUM_RESIDUE_CODES-1;
+}
+
+//Returns the next number from a splitmix64 generator with the given state.
+//The bits of each code word are drawn from a generator seeded by the
+//piece, so the same piece is given the same bits on every machine
+static unsigned long long nextPieceRandom(unsigned long long *state)
+{
+    unsigned long long z = (*state += 0x9E3779B97F4A7C15ULL);
+    z = (z^(z>>30))*0xBF58476D1CE4E5B9ULL;
+    z = (z^(z>>27))*0x94D049BB133111EBULL;
+    return z^(z>>31);
+}
+
+//Works out the bits of the code word for a piece given as the codes of
+//its residues, storing their positions in piece_bits
+static void generatePieceBits(bitwise_db *db,int *codes,int length,int *piece_bits)
+{
+    int cur_bit;
+    int i;
+    int j;
+    unsigned long long state = length;
+    for(i=0;i<length;i++)
+        state = state*NUM_RESIDUE_CODES+codes[i]+1;
+    for(i=0;i<db->num_set_bits;i++)
+    {
+        do
+        {
+            cur_bit = (int)(((nextPieceRandom(&state)>>32)*
+                             (unsigned long long)db->string_word_length)>>32);
+            for(j=0;j<i && piece_bits[j]!=cur_bit;j++);
+        }
+        while(j<i);
+        piece_bits[i] = cur_bit;
+    }
+}
+
+//Returns the position in the piece table of the first bit of a piece
+//with the given number of residues and code, its residue codes packed
+//together with the first residue highest
+static int pieceTableIndex(bitwise_db *db,int length,int code)
+{
+    int first = 0;
+    int i;
+    for(i=1;i<length;i++)
+        first += 1<<(i*RESIDUE_BITS);
+    return (first+code)*db->num_set_bits;
+}
+
+//Fills the piece table with the bits of every piece of up to
+//TABLE_RESIDUES residues
+static void buildPieceTable(bitwise_db *db)
+{
+    int codes[TABLE_RESIDUES];
+    int length;
+    int code;
+    int i;
+    int num_entries = 0;
+    for(length=1;length<=TABLE_RESIDUES;length++)
+        num_entries += 1<<(length*RESIDUE_BITS);
+    if((db->piece_table=malloc(sizeof(int)*num_entries*db->num_set_bits))==NULL)
+    {
+        printf("Insufficent memory for creation of piece table\n");
+        exit(1);
+    }
+    for(length=1;length<=TABLE_RESIDUES;length++)
+        for(code=0;code<1<<(length*RESIDUE_BITS);code++)
+        {
+            for(i=0;i<length;i++)
+                codes[i] = (code>>((length-1-i)*RESIDUE_BITS))&(NUM_RESIDUE_CODES-1);
+            generatePieceBits(db,codes,length,
+                              db->piece_table+pieceTableIndex(db,length,code));
+        }
+}
+
+//Chooses the bits of the code word to set for a piece, marking
+//them in result and storing their positions in piece_bits. Pieces
+//of up to TABLE_RESIDUES residues are looked up in the piece table
+static void choosePieceBits(bitwise_db *db,char *piece,unsigned int *result,int *piece_bits)
 {
     int cur_bit;
-    unsigned long hash = 5381;
+    int length = strlen(piece);
+    int code = 0;
+    int *codes;
+    int *table_bits;
     int i;
-    for (i=0;i<bit_string_segments;i++)
+    for (i=0;i<db->bit_string_segments;i++)
         result[i]=0;
-    while (i = *piece++)
-        hash = ((hash << 5) + hash) + i;   
-    srand(hash);
-    for(i=0;i<NUMSETBITS;i++)
-    {
-         cur_bit = STRINGWORDLENGTH * (rand() / (RAND_MAX + 1.0));
-         while((1<<(cur_bit%WORDLENGTH))&(result[cur_bit/WORDLENGTH]))
-            cur_bit = STRINGWORDLENGTH * (rand() / (RAND_MAX + 1.0));
+    if(length>0 && length<=TABLE_RESIDUES)
+    {
+        for(i=0;i<length;i++)
+            code = (code<<RESIDUE_BITS)|residueCode(piece[i]);
+        table_bits = db->piece_table+pieceTableIndex(db,length,code);
+        for(i=0;i<db->num_set_bits;i++)
+            piece_bits[i] = table_bits[i];
+    }
+    else
+    {
+        if((codes=malloc(sizeof(int)*(length+1)))==NULL)
+        {
+            printf("Insufficent memory for encoding piece\n");
+            exit(1);
+        }
+        for(i=0;i<length;i++)
+            codes[i] = residueCode(piece[i]);
+        generatePieceBits(db,codes,length,piece_bits);
+        free(codes);
+    }
+    for(i=0;i<db->num_set_bits;i++)
+    {
+         cur_bit = piece_bits[i];
          result[cur_bit/WORDLENGTH] |= (1<<(cur_bit%WORDLENGTH));
-         bit_strings[(((bit_string_elms-1)%WORDLENGTH)*bit_string_segments)
-                            +cur_bit/WORDLENGTH] |= result[cur_bit/WORDLENGTH];
-     }
+    }
+}
+
+//Encode and store a piece of the database using
+//the method of Superimposed Code Words. The idx_num
+//is the position of the piece size in the list of sizes
+void encodeDBPiece(bitwise_db *db,char *piece,int idx_num)
+{
+    int cur_bit;
+    int i;
+    unsigned int *bit_string = db->bit_strings[idx_num]+
+            ((db->bit_string_elms-1)%WORDLENGTH)*db->bit_string_segments;
+    choosePieceBits(db,piece,db->result,db->piece_bits);
+    for(i=0;i<db->num_set_bits;i++)
+    {
+         cur_bit = db->piece_bits[i];
+         bit_string[cur_bit/WORDLENGTH] |= (1<<(cur_bit%WORDLENGTH));
+    }
+}
+
+//Sets the number of residues in the pieces with the given idx_num
+//that are encoded by encodeRecord
+void setPieceSize(bitwise_db *db,int idx_num,int piece_size)
+{
+    db->piece_sizes[idx_num] = piece_size;
+}
+
+//Encode every piece of each size in the sequence of a record into the
+//code word of the last record allocated. The code of each piece of up
+//to TABLE_RESIDUES residues is rolled along the sequence, so its bits
+//are found in the piece table without looking at the piece again
+void encodeRecord(bitwise_db *db,char *residues,int num_residues)
+{
+    int *codes;
+    int *table_bits;
+    unsigned int *bit_string;
+    int idx_num;
+    int piece_size;
+    int code;
+    int mask;
+    int cur_bit;
+    int num_set_bits = db->num_set_bits;
+    int i;
+    int j;
+    if((codes=malloc(sizeof(int)*(num_residues+1)))==NULL)
+    {
+        printf("Insufficent memory for encoding record\n");
+        exit(1);
+    }
+    for(i=0;i<num_residues;i++)
+        codes[i] = residueCode(residues[i]);
+    for(idx_num=0;idx_num<db->num_pieces;idx_num++)
+    {
+        piece_size = db->piece_sizes[idx_num];
+        if(piece_size<1)
+            continue;
+        bit_string = db->bit_strings[idx_num]+
+            ((db->bit_string_elms-1)%WORDLENGTH)*db->bit_string_segments;
+        if(piece_size<=TABLE_RESIDUES)
+        {
+            table_bits = db->piece_table+pieceTableIndex(db,piece_size,0);
+            mask = (1<<(piece_size*RESIDUE_BITS))-1;
+            code = 0;
+            for(i=0;i<num_residues;i++)
+            {
+                code = ((code<<RESIDUE_BITS)|codes[i])&mask;
+                if(i<piece_size-1)
+                    continue;
+                for(j=0;j<num_set_bits;j++)
+                {
+                    cur_bit = table_bits[code*num_set_bits+j];
+                    bit_string[cur_bit/WORDLENGTH] |= (1<<(cur_bit%WORDLENGTH));
+                }
+            }
+        }
+        else
+        {
+            for(i=0;i+piece_size<=num_residues;i++)
+            {
+                generatePieceBits(db,codes+i,piece_size,db->piece_bits);
+                for(j=0;j<num_set_bits;j++)
+                {
+                    cur_bit = db->piece_bits[j];
+                    bit_string[cur_bit/WORDLENGTH] |= (1<<(cur_bit%WORDLENGTH));
+                }
+            }
+        }
+    }
+    free(codes);
+}
+
+//Returns the positions of the bits of the code word set for a piece, so
+//that the rows of the bit slices for the piece can be found by the caller
+int_list *getPieceBits(bitwise_db *db,char *piece)
+{
+    int_list *list;
+    unsigned int *result;
+    if((list=malloc(sizeof(int_list)))==NULL ||
+       (list->elms=malloc(sizeof(int)*db->num_set_bits))==NULL ||
+       (result=malloc(sizeof(unsigned int)*db->bit_string_segments))==NULL)
+    {
+        printf("Insufficent memory for creation of piece bit list\n");
+        exit(1);
+    }
+    choosePieceBits(db,piece,result,list->elms);
+    list->length = db->num_set_bits;
+    free(result);
+    return list;
+}
+
+//Creates a new query against the given database
+bitwise_query *createQuery(bitwise_db *db)
+{
+    bitwise_query *query;
+    if((query=malloc(sizeof(bitwise_query)))==NULL ||
+       (query->result=malloc(sizeof(unsigned int)*db->bit_string_segments))==NULL ||
+       (query->piece_bits=malloc(sizeof(int)*db->num_set_bits))==NULL)
+    {
+        printf("Insufficent memory for creation of query\n");
+        exit(1); 
+    }
+    query->db=db;
+    query->dropset=NULL;
+    query->segments=NULL;
+    query->sections=0;
+    return query;
 }
 
 //Encode and store a piece of a query using
 //the method of Superimposed Code Words
-void encodeQueryPiece(int seg_num,char *piece,int idx_num)
+void encodeQueryPiece(bitwise_query *query,int seg_num,char *piece,int idx_num)
 {
-    int cur_bit;
-    unsigned long hash = 5381;
     int i;
     int j;
-    int seg_pos = seg_num*record_segments;
-    while (i = *piece++)
-        hash = ((hash << 5) + hash) + i;
-    srand(hash);
-    for (i=0;i<bit_string_segments;i++)
-        result[i]=0;
-    for(i=0;i<NUMSETBITS;i++)
+    int record_segments = query->db->record_segments;
+    unsigned int *segment = query->segments+seg_num*record_segments;
+    unsigned int *slice;
+    choosePieceBits(query->db,piece,query->result,query->piece_bits);
+    for(i=0;i<query->db->num_set_bits;i++)
     {
-         cur_bit = STRINGWORDLENGTH * (rand() / (RAND_MAX + 1.0));
-         while((1<<(cur_bit%WORDLENGTH))&(result[cur_bit/WORDLENGTH]))
-            cur_bit = STRINGWORDLENGTH * (rand() / (RAND_MAX + 1.0));
-         result[cur_bit/WORDLENGTH] |= 1 << cur_bit%WORDLENGTH; 
+         slice = query->db->slices[idx_num]+(size_t)query->piece_bits[i]*record_segments;
          for(j=0;j<record_segments;j++)
-            segments[seg_pos+j] &= slices[idx_num][j*STRINGWORDLENGTH+cur_bit]; 
+            segment[j] &= slice[j]; 
     }
 }
 
-void createSegments(int secs)
+void createSegments(bitwise_query *query,int secs)
 {
     int i;
-    int section_size = record_segments*secs;
-    sections = secs;
-    if(segments!=NULL)free(segments);
-    if((segments = malloc(sizeof(unsigned int)*section_size))==NULL) 
+    int section_size = query->db->record_segments*secs;
+    query->sections = secs;
+    if(query->segments!=NULL)free(query->segments);
+    if((query->segments = malloc(sizeof(unsigned int)*section_size))==NULL) 
     {
         printf("Insufficent memory for creation of section array\n");
         exit(1); 
     } 
     for(i=0;i<section_size;i++)
-        segments[i]=-1;
+        query->segments[i]=-1;
 }
 
 //Creates a set of the records that match when all segments of this query
 //are or'ed with the previous dropset
-void updateDropsetOr()
+void updateDropsetOr(bitwise_query *query)
 {
     int i;
     int j;
-    int secs = record_segments*sections;
-    if(dropset==NULL)
+    int record_segments = query->db->record_segments;
+    int secs = record_segments*query->sections;
+    unsigned int *segments = query->segments;
+    if(query->dropset==NULL)
     {
-        if((dropset = malloc(sizeof(unsigned int)*record_segments))==NULL)
+        if((query->dropset = malloc(sizeof(unsigned int)*record_segments))==NULL)
         {
             printf("Insufficent memory for creation of dropset array\n");
             exit(1);
         }
         for(i=0;i<record_segments;i++)
-            dropset[i]=0;
+            query->dropset[i]=0;
     }
     for(i=0;i<record_segments;i++)
         for(j=0;j<secs;j+=record_segments)
-            dropset[i] |= segments[i+j];
+            query->dropset[i] |= segments[i+j];
 }
 
 //Creates a set of the records that match when all segments of this query
 //are and'ed with the previous dropset
-void updateDropsetAnd()
+void updateDropsetAnd(bitwise_query *query)
 {
     int i;
     int j;
-    int secs = record_segments*sections;
+    int record_segments = query->db->record_segments;
+    int secs = record_segments*query->sections;
+    unsigned int *segments = query->segments;
     unsigned int tmp;
-    if(dropset==NULL)
+    if(query->dropset==NULL)
     {
-        if((dropset = malloc(sizeof(unsigned int)*record_segments))==NULL)
+        if((query->dropset = malloc(sizeof(unsigned int)*record_segments))==NULL)
         {
             printf("Insufficent memory for creation of dropset array\n");
             exit(1);
         }
         for(i=0;i<record_segments;i++)
-            dropset[i]=-1;
+            query->dropset[i]=-1;
     }
     for(i=0;i<record_segments;i++)
     {
         tmp = 0;
         for(j=0;j<secs;j+=record_segments)
             tmp |= segments[i+j];
-        dropset[i] &= tmp;
+        query->dropset[i] &= tmp;
+    }
+}
+
+#ifndef __GNUC__
+//returns the position of the lowest set bit in a non zero word
+int lowestSetBit(unsigned int word)
+{
+    int bit = 0;
+    while(!(word&1))
+    {
+        word >>= 1;
+        bit++;
     }
+    return bit;
 }
+#endif
 
 //returns the position of the next drop, starting from the position
 //given in pos (counting from 1). Returns 0 if reached end of recs
-int nextDrop(int pos)
+int nextDrop(bitwise_query *query,int pos)
+{
+    int_list *next = getDrops(query,pos-1,1);
+    int drop = 0;
+    if(next->length)
+        drop = next->elms[0]+1;
+    free(next->elms);
+    free(next);
+    return drop;
+}
+
+//returns a list of up to max_drops records in the dropset, starting from
+//the record given in start (counting from 0). Whole words of the dropset
+//are skipped at a time where they do not contain any records
+int_list *getDrops(bitwise_query *query,int start,int max_drops)
 {
     int i;
-    for(i=pos-1;i<bit_string_elms;i++)
-        if((1<<(i%WORDLENGTH))&dropset[i/WORDLENGTH])return i+1;
-    return 0;
+    int rec;
+    int num_drops = 0;
+    int bit_string_elms = query->db->bit_string_elms;
+    int record_segments = query->db->record_segments;
+    unsigned int *dropset = query->dropset;
+    unsigned int word;
+    int_list *list;
+    if(max_drops>bit_string_elms-start)
+        max_drops = bit_string_elms-start;
+    if(max_drops<0)
+        max_drops = 0;
+    if((list=malloc(sizeof(int_list)))==NULL ||
+       (list->elms=malloc(sizeof(int)*(max_drops+1)))==NULL)
+    {
+        printf("Insufficent memory for creation of drop list\n");
+        exit(1);
+    }
+    if(dropset!=NULL && max_drops>0)
+    {
+        i = start/WORDLENGTH;
+        //ignore any records in the first word before the start
+        word = dropset[i] & (~0U << (start%WORDLENGTH));
+        while(num_drops<max_drops)
+        {
+            while(word==0)
+            {
+                if(++i>=record_segments)
+                    break;
+                word = dropset[i];
+            }
+            if(word==0)
+                break;
+            rec = i*WORDLENGTH+LOWEST_SET_BIT(word);
+            //the last word may have bits set past the last record
+            if(rec>=bit_string_elms)
+                break;
+            list->elms[num_drops++] = rec;
+            word &= word-1;
+        }
+    }
+    list->length = num_drops;
+    return list;
 }
 
-void clearMatchInfo()
+#ifndef __GNUC__
+//returns the number of set bits in a word
+int countSetBits(unsigned int word)
 {
-    if(dropset!=NULL)free(dropset);
-    dropset=NULL;
-    if(segments!=NULL)free(segments);
-    segments=NULL;
+    int count = 0;
+    for(;word;word&=word-1)
+        count++;
+    return count;
 }
+#endif
 
-void clearDatabase()
+//Returns the number of records set in an array of record_segments words,
+//ignoring the bits of the last word past the last record
+static int countRecords(bitwise_db *db,unsigned int *records)
 {
     int i;
-    if(slices!=NULL)
+    int count = 0;
+    int last = db->bit_string_elms/WORDLENGTH;
+    for(i=0;i<db->record_segments && i<last;i++)
+        count += COUNT_SET_BITS(records[i]);
+    if(last<db->record_segments && db->bit_string_elms%WORDLENGTH)
+        count += COUNT_SET_BITS(records[last]&
+                                ((1U<<(db->bit_string_elms%WORDLENGTH))-1));
+    return count;
+}
+
+//Returns the number of records that have every piece encoded into
+//the given segment of a query, or that have every piece of any one
+//of its segments if seg_num is -1
+int countSegment(bitwise_query *query,int seg_num)
+{
+    int i;
+    int j;
+    int count;
+    int record_segments = query->db->record_segments;
+    unsigned int *any;
+    if(seg_num>=0)
+        return countRecords(query->db,query->segments+seg_num*record_segments);
+    if((any=malloc(sizeof(unsigned int)*(record_segments+1)))==NULL)
+    {
+        printf("Insufficent memory for counting segments\n");
+        exit(1);
+    }
+    for(i=0;i<record_segments;i++)
+    {
+        any[i] = 0;
+        for(j=0;j<query->sections;j++)
+            any[i] |= query->segments[j*record_segments+i];
+    }
+    count = countRecords(query->db,any);
+    free(any);
+    return count;
+}
+
+//Returns the number of records in the dropset of a query
+int countDropset(bitwise_query *query)
+{
+    if(query->dropset==NULL)
+        return 0;
+    return countRecords(query->db,query->dropset);
+}
+
+//The residues that can be packed into 5 bits each, the
+//code for a residue being its position in this string
+static const char PACKED_RESIDUES[] = "ABCDEFGHIJKLMNOPQRSTUVWXYZ*-";
+
+//Packs a sequence of residues into 5 bits each, the bits of each residue
+//following on from those of the one before, starting from the lowest bit
+//of the first byte. Returns a length of -1 if a residue cannot be packed
+byte_string *packResidues(char *residues,int num_residues)
+{
+    int i;
+    int length = 0;
+    int num_bits = 0;
+    unsigned int bits = 0;
+    char *code;
+    byte_string *packed;
+    if((packed=malloc(sizeof(byte_string)))==NULL ||
+       (packed->bytes=malloc((num_residues*5+7)/8+1))==NULL)
+    {
+        printf("Insufficent memory for packing residues\n");
+        exit(1);
+    }
+    for(i=0;i<num_residues;i++)
     {
-        for(i=0;i<slice_size;i++)
-            free(slices[i]);
-        free(slices);
+        if(residues[i]=='\0' || (code=strchr(PACKED_RESIDUES,residues[i]))==NULL)
+        {
+            packed->length = -1;
+            return packed;
+        }
+        bits |= (unsigned int)(code-PACKED_RESIDUES)<<num_bits;
+        num_bits += 5;
+        while(num_bits>=8)
+        {
+            packed->bytes[length++] = bits&0xFF;
+            bits >>= 8;
+            num_bits -= 8;
+        }
     }
-    slices=NULL;
-    if(result!=NULL)free(result);
-    result=NULL;
+    if(num_bits>0)
+        packed->bytes[length++] = bits;
+    packed->length = length;
+    return packed;
+}
+
+//Unpacks a sequence of residues packed by packResidues
+char *unpackResidues(char *packed,int packed_len,int num_residues)
+{
+    int i;
+    int j = 0;
+    int num_bits = 0;
+    unsigned int bits = 0;
+    char *residues;
+    if((residues=malloc(num_residues+1))==NULL)
+    {
+        printf("Insufficent memory for unpacking residues\n");
+        exit(1);
+    }
+    for(i=0;i<num_residues;i++)
+    {
+        while(num_bits<5 && j<packed_len)
+        {
+            bits |= (unsigned int)(unsigned char)packed[j++]<<num_bits;
+            num_bits += 8;
+        }
+        if(num_bits<5 || (bits&31)>=sizeof(PACKED_RESIDUES)-1)
+            break;
+        residues[i] = PACKED_RESIDUES[bits&31];
+        bits >>= 5;
+        num_bits -= 5;
+    }
+    residues[i] = '\0';
+    return residues;
+}
+
+//Frees all memory used by a query
+void clearMatchInfo(bitwise_query *query)
+{
+    if(query->dropset!=NULL)free(query->dropset);
+    if(query->segments!=NULL)free(query->segments);
+    free(query->result);
+    free(query->piece_bits);
+    free(query);
+}
+
+//Frees all memory used by a database
+void clearDatabase(bitwise_db *db)
+{
+    int i;
+    if(db->slices!=NULL)
+    {
+        for(i=0;i<db->slice_size;i++)
+#ifdef MAP_SLICES
+            munmap(db->slices[i],db->slice_bytes);
+#else
+            free(db->slices[i]);
+#endif
+        free(db->slices);
+    }
+    for(i=0;i<db->num_pieces;i++)
+    {
+        if(db->bit_strings[i]!=NULL)free(db->bit_strings[i]);
+        if(db->bit_slices[i]!=NULL)free(db->bit_slices[i]);
+    }
+    free(db->bit_strings);
+    free(db->bit_slices);
+    free(db->result);
+    free(db->piece_bits);
+    free(db->piece_table);
+    free(db->piece_sizes);
+    free(db);
 }
 
 //Testing fucntion displaying an int as a binary string
@@ -352,4 +870,3 @@ void print_int_as_binary_string(unsigned int number)
     printf(binary_string);
 }
  
-
@@ -0,0 +1,244 @@
+/*  Performs bit level operations on words for the Adrasteia program
+    Copyright (C) 2006    Miles Hampson
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+*/
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+//the wordlength (in bits) used to store unsigned ints
+//(our bitword storage containers) on this machine
+#define WORDLENGTH ((int)(sizeof(unsigned int)*8))
+//the position of the lowest set bit in a non zero word
+#ifdef __GNUC__
+#define LOWEST_SET_BIT(word) __builtin_ctz(word)
+#else
+#define LOWEST_SET_BIT(word) lowestSetBit(word)
+#endif
+//the number of set bits in a word
+#ifdef __GNUC__
+#define COUNT_SET_BITS(word) __builtin_popcount(word)
+#else
+#define COUNT_SET_BITS(word) countSetBits(word)
+#endif
+
+//Each residue of a piece is given a code of this many bits when
+//choosing the bits of its code word, letters by their position in
+//the alphabet (ignoring case), * and - after them, and anything else
+//sharing the last code
+#define RESIDUE_BITS 5
+#define NUM_RESIDUE_CODES (1<<RESIDUE_BITS)
+//The bits of the code words of all pieces of up to this many residues
+//are worked out once, when the database is set up
+#define TABLE_RESIDUES 3
+
+//All information about the index of a single database. Each
+//database has its own, so several can be open at the same time
+typedef struct bitwise_db
+{
+    //the actual wordlength of the strings in bit_strings
+    //this will be rounded up to the nearest 32 bit 
+    //word boundary for storage in bit_strings, the
+    //extra padding is discarded when bit slicing
+    int string_word_length;
+    //the number of bits in each word to set to 1
+    int num_set_bits;
+    //the number of different piece sizes encoded for each record
+    int num_pieces;
+    //the number of residues in each of these pieces, for encoding
+    //whole records
+    int *piece_sizes;
+    //An array of bit string arrays, one for each piece size. Each
+    //element is an array of ints, each one representing a bit string
+    unsigned int **bit_strings;
+    //the number of segments each string has to be broken into
+    //due to it being larger than the wordlength
+    int bit_string_segments;
+    //the number of logical elements in the bit_string array
+    int bit_string_elms;
+    //the bits to set for the current code word while indexing
+    unsigned int *result;
+    //the positions of these bits
+    int *piece_bits;
+    //the positions of the bits of the code word of every piece of up to
+    //TABLE_RESIDUES residues, num_set_bits for each one
+    int *piece_table;
+    //An array of horizontal slices of each bit_string array
+    unsigned int **bit_slices;
+    //the number of words needed to store a slice of all 
+    //records for a bit string array
+    int record_segments;
+    //Array of all bit slice arrays. On disk (and so in this array) each one
+    //is stored by bit, with the record_segments words of each bit of the
+    //code words held together
+    unsigned int **slices;
+    //the size of this array
+    int slice_size;
+    //the number of bytes in each bit slice array
+    size_t slice_bytes;
+} bitwise_db;
+
+//All information about a single query against a database. The
+//database is only read while matching, so any number of queries
+//can be run against the same database at once
+typedef struct bitwise_query
+{
+    //the database being queried
+    bitwise_db *db;
+    //the bits to set for the current code word
+    unsigned int *result;
+    //the positions of these bits
+    int *piece_bits;
+    //An array of records that sucessfully match some input
+    unsigned int *dropset;
+    //the records that match each query piece
+    unsigned int *segments;
+    //number of sections
+    int sections;
+} bitwise_query;
+
+//A list of ints returned to the caller, such as the
+//records that are in the dropset of a query
+typedef struct int_list
+{
+    int length;
+    int *elms;
+} int_list;
+
+//A string of bytes returned to the caller, which may contain nulls
+typedef struct byte_string
+{
+    int length;
+    char *bytes;
+} byte_string;
+
+//The q-gram index holds the positions of pieces of up to this many
+//residues, each piece being looked up by its residue codes
+#define MAX_GRAM_RESIDUES 4
+
+//The postings of a single piece while a q-gram index is being built
+typedef struct gram_list
+{
+    unsigned char *bytes;
+    size_t length;
+    size_t capacity;
+    //the last record added, which the next record is stored after
+    int last_record;
+} gram_list;
+
+//An inverted index from each piece of each size to the records it is in,
+//and its positions in each of them. The postings of a piece are held as
+//the gap to each record from the one before (shifted up a bit, the
+//lowest bit being set if the number of positions in the record follows,
+//otherwise it has one) and the gap to each position from the one before,
+//all of them compressed into 7 bits per byte with the top bit of every
+//byte but the last of a number set
+typedef struct gram_index
+{
+    //the number of different piece sizes indexed
+    int num_sizes;
+    //the number of residues in each of these pieces
+    int *gram_sizes;
+    //the number of records indexed
+    int num_records;
+    //for each piece size the offset of the postings of each piece in
+    //postings, followed by the end of the postings of the last one
+    unsigned long long **offsets;
+    unsigned char **postings;
+    //the postings of each piece of each size while the index is built
+    gram_list **lists;
+    //the index file the index was loaded from, and its size
+    char *data;
+    size_t data_bytes;
+} gram_index;
+
+//A piece of a segment of a query against a q-gram index
+typedef struct gram_piece
+{
+    int seg_num;
+    int idx_num;
+    int code;
+    //the position of the piece in its segment
+    int offset;
+} gram_piece;
+
+//All information about a single query against a q-gram index. As with a
+//bitwise_query the pieces of each segment of a pattern are added in turn,
+//then the records of the pattern are combined with the dropset
+typedef struct gram_query
+{
+    //the index being queried
+    gram_index *index;
+    //the pieces of every segment of the current pattern
+    gram_piece *pieces;
+    int num_pieces;
+    int pieces_size;
+    //the length of each segment so far, the position of its next piece
+    int *seg_lengths;
+    //the records that have each segment, NULL until it is looked up
+    int_list **segments;
+    //number of sections
+    int sections;
+    //the records that match so far, NULL before the first pattern
+    int_list *dropset;
+    //the number of bytes of postings read
+    int bytes_read;
+} gram_query;
+
+extern bitwise_db *initialize(int word_len,int num_set_bits,int num_pieces);
+extern void writeBitSlices(bitwise_db *db,int start_idx,int end_idx,
+                           int pos_to_replace,char *firstName);
+extern void loadBitSlices(bitwise_db *db,int start_idx,int end_idx,
+                          int pos_to_replace,char *firstName,int prefetch);
+extern int setDBInfo(bitwise_db *db,int rec_segs,int bselms);
+extern void bitSlice(bitwise_db *db);
+extern void allocateRecord(bitwise_db *db);
+extern void encodeDBPiece(bitwise_db *db,char *piece,int idx_num);
+extern void setPieceSize(bitwise_db *db,int idx_num,int piece_size);
+extern void encodeRecord(bitwise_db *db,char *residues,int num_residues);
+extern bitwise_query *createQuery(bitwise_db *db);
+extern void encodeQueryPiece(bitwise_query *query,int seg_num,char *piece,int idx_num);
+extern void createSegments(bitwise_query *query,int secs);
+extern void updateDropsetOr(bitwise_query *query);
+extern void updateDropsetAnd(bitwise_query *query);
+extern int nextDrop(bitwise_query *query,int pos);
+extern int_list *getDrops(bitwise_query *query,int start,int max_drops);
+extern int countSegment(bitwise_query *query,int seg_num);
+extern int countDropset(bitwise_query *query);
+extern int_list *getPieceBits(bitwise_db *db,char *piece);
+extern byte_string *packResidues(char *residues,int num_residues);
+extern char *unpackResidues(char *packed,int packed_len,int num_residues);
+extern void clearMatchInfo(bitwise_query *query);
+extern void clearDatabase(bitwise_db *db);
+extern int residueCode(char residue);
+
+//The q-gram index, in Postings.c
+extern gram_index *createGramIndex(int num_sizes);
+extern void setGramSize(gram_index *index,int idx_num,int gram_size);
+extern void addGramRecord(gram_index *index,char *residues,int num_residues);
+extern void writeGramIndex(gram_index *index,char *file_name);
+extern gram_index *loadGramIndex(char *file_name,int prefetch);
+extern gram_query *createGramQuery(gram_index *index);
+extern void createGramSegments(gram_query *query,int secs);
+extern void encodeGramPiece(gram_query *query,int seg_num,char *piece,int idx_num);
+extern void updateGramsOr(gram_query *query);
+extern void updateGramsAnd(gram_query *query);
+extern int_list *getGramDrops(gram_query *query,int start,int max_drops);
+extern int countGramSegment(gram_query *query,int seg_num);
+extern int countGramDropset(gram_query *query);
+extern int countGramBytes(gram_query *query);
+extern void clearGramQuery(gram_query *query);
+extern void clearGramIndex(gram_index *index);
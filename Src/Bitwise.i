@@ -1,33 +1,92 @@
 %module Bitwise
 %{
-extern void allocateRecord();
-extern void initialize(int word_len,int num_set_bits);
-extern int writeBitSlices(char *file_loc);
-extern void loadBitSlices(int start_idx,int end_idx,int pos_to_replace,char *firstName);
-extern int resetDBInfo();
-extern int setDBInfo(int rec_segs,int bselms);
-extern void encodeDBPiece(char *piece);
-extern void bitSlice();
-extern void encodeQueryPiece(int seg_num,char *piece,int slice_file_pos);
-extern void createSegments(int sections);
-extern void updateDropsetOr();
-extern void updateDropsetAnd();
-extern int nextDrop(int pos);
-extern void clearMatchInfo();
-extern void clearDatabase();
+#include "Bitwise.h"
 %}
-extern void allocateRecord();
-extern void initialize(int word_len,int num_set_bits);
-extern int writeBitSlices(char *file_loc);
-extern void loadBitSlices(int start_idx,int end_idx,int pos_to_replace,char *firstName);
-extern int resetDBInfo();
-extern int setDBInfo(int rec_segs,int bselms);
-extern void encodeDBPiece(char *piece);
-extern void bitSlice();
-extern void encodeQueryPiece(int seg_num,char *piece,int slice_file_pos);
-extern void createSegments(int sections);
-extern void updateDropsetOr();
-extern void updateDropsetAnd();
-extern int nextDrop(int pos);
-extern void clearMatchInfo();
-extern void clearDatabase();
+typedef struct bitwise_db bitwise_db;
+typedef struct bitwise_query bitwise_query;
+typedef struct gram_index gram_index;
+typedef struct gram_query gram_query;
+
+%typemap(python, out) int_list * {
+  int_list *ilist = $1;
+  PyObject *retlist;
+  int i;
+
+  retlist = PyList_New(ilist -> length);
+  for(i=0; i < ilist -> length; i++)
+    PyList_SetItem(retlist, i, PyInt_FromLong(ilist -> elms[i]));
+  free(ilist -> elms);
+  free(ilist);
+  return(retlist);
+}
+
+%typemap(python, out) byte_string * {
+  byte_string *bstring = $1;
+  PyObject *retstring;
+
+  if(bstring -> length < 0) {
+    Py_INCREF(Py_None);
+    retstring = Py_None;
+  }
+  else
+    retstring = PyString_FromStringAndSize(bstring -> bytes, bstring -> length);
+  free(bstring -> bytes);
+  free(bstring);
+  return(retstring);
+}
+
+%typemap(python, in) (char *packed,int packed_len) {
+  if(!PyString_Check($input)) {
+    PyErr_SetString(PyExc_TypeError, "Expected a string of packed residues");
+    return NULL;
+  }
+  $1 = PyString_AsString($input);
+  $2 = (int) PyString_Size($input);
+}
+
+%newobject unpackResidues;
+
+//the longest pieces a q-gram index can hold
+%constant int MAX_GRAM_RESIDUES = MAX_GRAM_RESIDUES;
+
+extern bitwise_db *initialize(int word_len,int num_set_bits,int num_pieces);
+extern void writeBitSlices(bitwise_db *db,int start_idx,int end_idx,
+                           int pos_to_replace,char *firstName);
+extern void loadBitSlices(bitwise_db *db,int start_idx,int end_idx,
+                          int pos_to_replace,char *firstName,int prefetch);
+extern int setDBInfo(bitwise_db *db,int rec_segs,int bselms);
+extern void bitSlice(bitwise_db *db);
+extern void allocateRecord(bitwise_db *db);
+extern void encodeDBPiece(bitwise_db *db,char *piece,int idx_num);
+extern void setPieceSize(bitwise_db *db,int idx_num,int piece_size);
+extern void encodeRecord(bitwise_db *db,char *residues,int num_residues);
+extern bitwise_query *createQuery(bitwise_db *db);
+extern void encodeQueryPiece(bitwise_query *query,int seg_num,char *piece,int idx_num);
+extern void createSegments(bitwise_query *query,int secs);
+extern void updateDropsetOr(bitwise_query *query);
+extern void updateDropsetAnd(bitwise_query *query);
+extern int nextDrop(bitwise_query *query,int pos);
+extern int_list *getDrops(bitwise_query *query,int start,int max_drops);
+extern int countSegment(bitwise_query *query,int seg_num);
+extern int countDropset(bitwise_query *query);
+extern int_list *getPieceBits(bitwise_db *db,char *piece);
+extern byte_string *packResidues(char *residues,int num_residues);
+extern char *unpackResidues(char *packed,int packed_len,int num_residues);
+extern void clearMatchInfo(bitwise_query *query);
+extern void clearDatabase(bitwise_db *db);
+extern gram_index *createGramIndex(int num_sizes);
+extern void setGramSize(gram_index *index,int idx_num,int gram_size);
+extern void addGramRecord(gram_index *index,char *residues,int num_residues);
+extern void writeGramIndex(gram_index *index,char *file_name);
+extern gram_index *loadGramIndex(char *file_name,int prefetch);
+extern gram_query *createGramQuery(gram_index *index);
+extern void createGramSegments(gram_query *query,int secs);
+extern void encodeGramPiece(gram_query *query,int seg_num,char *piece,int idx_num);
+extern void updateGramsOr(gram_query *query);
+extern void updateGramsAnd(gram_query *query);
+extern int_list *getGramDrops(gram_query *query,int start,int max_drops);
+extern int countGramSegment(gram_query *query,int seg_num);
+extern int countGramDropset(gram_query *query);
+extern int countGramBytes(gram_query *query);
+extern void clearGramQuery(gram_query *query);
+extern void clearGramIndex(gram_index *index);
@@ -0,0 +1,835 @@
+/*  Builds and searches an inverted index of the pieces of the records of
+    a database for the Adrasteia program
+    Copyright (C) 2006    Miles Hampson
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+*/
+#include "Bitwise.h"
+//Where possible the index file is memory mapped rather than read into
+//memory, so that it loads lazily and is shared between processes
+#if defined(unix) || defined(__unix__) || defined(__unix) || defined(__APPLE__)
+#define MAP_GRAMS
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#endif
+
+//The number of different pieces of the given number of residues
+#define NUM_GRAMS(gram_size) (1<<((gram_size)*RESIDUE_BITS))
+
+//Set up a new, empty index of pieces of num_sizes sizes and return it
+gram_index *createGramIndex(int num_sizes)
+{
+    int i;
+    gram_index *index;
+    if((index=malloc(sizeof(gram_index)))==NULL ||
+       (index->gram_sizes=malloc(sizeof(int)*num_sizes))==NULL ||
+       (index->offsets=malloc(sizeof(unsigned long long *)*num_sizes))==NULL ||
+       (index->postings=malloc(sizeof(unsigned char *)*num_sizes))==NULL ||
+       (index->lists=malloc(sizeof(gram_list *)*num_sizes))==NULL)
+    {
+        printf("Insufficent memory for creation of gram index\n");
+        exit(1);
+    }
+    index->num_sizes = num_sizes;
+    index->num_records = 0;
+    for(i=0;i<num_sizes;i++)
+    {
+        index->gram_sizes[i] = 0;
+        index->offsets[i] = NULL;
+        index->postings[i] = NULL;
+        index->lists[i] = NULL;
+    }
+    index->data = NULL;
+    index->data_bytes = 0;
+    return index;
+}
+
+//Sets the number of residues in the pieces with the given idx_num,
+//which must be between 1 and MAX_GRAM_RESIDUES
+void setGramSize(gram_index *index,int idx_num,int gram_size)
+{
+    int i;
+    int num_grams = NUM_GRAMS(gram_size);
+    if(gram_size<1 || gram_size>MAX_GRAM_RESIDUES)
+    {
+        printf("Pieces of %i residues cannot be held in a gram index\n",gram_size);
+        exit(1);
+    }
+    if(index->lists[idx_num]!=NULL)free(index->lists[idx_num]);
+    if((index->lists[idx_num]=malloc(sizeof(gram_list)*num_grams))==NULL)
+    {
+        printf("Insufficent memory for creation of gram lists\n");
+        exit(1);
+    }
+    for(i=0;i<num_grams;i++)
+    {
+        index->lists[idx_num][i].bytes = NULL;
+        index->lists[idx_num][i].length = 0;
+        index->lists[idx_num][i].capacity = 0;
+        index->lists[idx_num][i].last_record = -1;
+    }
+    index->gram_sizes[idx_num] = gram_size;
+}
+
+//Appends a number to the postings of a piece, 7 bits at a time
+//starting from the lowest
+static void appendNumber(gram_list *list,unsigned int number)
+{
+    if(list->length+5>list->capacity)
+    {
+        list->capacity = list->capacity*2+16;
+        if((list->bytes=realloc(list->bytes,list->capacity))==NULL)
+        {
+            printf("Insufficent memory for extending gram list\n");
+            exit(1);
+        }
+    }
+    while(number>=0x80)
+    {
+        list->bytes[list->length++] = (number&0x7F)|0x80;
+        number >>= 7;
+    }
+    list->bytes[list->length++] = number;
+}
+
+//Reads a number appended by appendNumber, moving bytes past it
+static unsigned int readNumber(unsigned char **bytes)
+{
+    unsigned char *p = *bytes;
+    unsigned int number = *p&0x7F;
+    int shift = 7;
+    while(*p++&0x80)
+    {
+        number |= (unsigned int)(*p&0x7F)<<shift;
+        shift += 7;
+    }
+    *bytes = p;
+    return number;
+}
+
+//Moves bytes past count numbers without reading them
+static unsigned char *skipNumbers(unsigned char *bytes,unsigned int count)
+{
+    while(count)
+    {
+        if(!(*bytes&0x80))
+            count--;
+        bytes++;
+    }
+    return bytes;
+}
+
+//Reads the gap to the next record in the postings of a piece and the
+//number of positions in it, moving bytes past them
+static int readPosting(unsigned char **bytes,unsigned int *count)
+{
+    unsigned int gap = readNumber(bytes);
+    *count = 1;
+    if(gap&1)
+        *count = readNumber(bytes);
+    return (int)(gap>>1);
+}
+
+//Orders the pieces of a record by their code and then their position
+static int compareOccurrences(const void *a,const void *b)
+{
+    unsigned long long x = *(const unsigned long long *)a;
+    unsigned long long y = *(const unsigned long long *)b;
+    if(x<y)
+        return -1;
+    return x>y;
+}
+
+//Adds the position of every piece of each size in the sequence of a
+//record to the postings of the piece, as the next record of the index.
+//The pieces of each size are sorted by their code so that the
+//positions of each one can be added together
+void addGramRecord(gram_index *index,char *residues,int num_residues)
+{
+    unsigned long long *occurrences;
+    int *codes;
+    int idx_num;
+    int gram_size;
+    int num_occurrences;
+    int code;
+    int mask;
+    int record = index->num_records++;
+    int i;
+    int j;
+    unsigned int last_position;
+    gram_list *list;
+    if((codes=malloc(sizeof(int)*(num_residues+1)))==NULL ||
+       (occurrences=malloc(sizeof(unsigned long long)*(num_residues+1)))==NULL)
+    {
+        printf("Insufficent memory for adding record to gram index\n");
+        exit(1);
+    }
+    for(i=0;i<num_residues;i++)
+        codes[i] = residueCode(residues[i]);
+    for(idx_num=0;idx_num<index->num_sizes;idx_num++)
+    {
+        gram_size = index->gram_sizes[idx_num];
+        if(gram_size<1)
+            continue;
+        mask = NUM_GRAMS(gram_size)-1;
+        code = 0;
+        num_occurrences = 0;
+        for(i=0;i<num_residues;i++)
+        {
+            code = ((code<<RESIDUE_BITS)|codes[i])&mask;
+            if(i>=gram_size-1)
+                occurrences[num_occurrences++] = ((unsigned long long)code<<32)|
+                                                 (i-gram_size+1);
+        }
+        qsort(occurrences,num_occurrences,sizeof(unsigned long long),compareOccurrences);
+        for(i=0;i<num_occurrences;i=j)
+        {
+            code = (int)(occurrences[i]>>32);
+            for(j=i;j<num_occurrences && (int)(occurrences[j]>>32)==code;j++);
+            list = index->lists[idx_num]+code;
+            //most pieces are only once in a record, so the lowest bit of
+            //the gap to the record says whether the count follows
+            if(j-i==1)
+                appendNumber(list,(record-list->last_record)<<1);
+            else
+            {
+                appendNumber(list,((record-list->last_record)<<1)|1);
+                appendNumber(list,j-i);
+            }
+            list->last_record = record;
+            last_position = 0;
+            for(;i<j;i++)
+            {
+                appendNumber(list,(unsigned int)occurrences[i]-last_position);
+                last_position = (unsigned int)occurrences[i];
+            }
+        }
+    }
+    free(codes);
+    free(occurrences);
+}
+
+//Writes the index to a file. The file holds the number of records and
+//piece sizes, then the size of each piece size, then for each piece
+//size the offset of the postings of every piece (and their end), all
+//as 64 bit numbers, followed by the postings of each piece size. The
+//file is written under a temporary name and renamed into place, as other
+//processes may have the old file mapped
+void writeGramIndex(gram_index *index,char *file_name)
+{
+    int idx_num;
+    int i;
+    int num_grams;
+    unsigned long long number;
+    unsigned long long offset;
+    gram_list *lists;
+    char *tmp_name;
+    FILE *fp;
+    if((tmp_name=malloc(strlen(file_name)+5))==NULL)
+    {
+        printf("Insufficent memory for writing a gram index file\n");
+        exit(1);
+    }
+    sprintf(tmp_name,"%s.tmp",file_name);
+    if((fp=fopen(tmp_name, "wb"))==NULL)
+    {
+        printf("Cannot open a gram index file for writing.\n");
+        exit(1);
+    }
+    number = index->num_records;
+    fwrite(&number,sizeof(unsigned long long),1,fp);
+    number = index->num_sizes;
+    fwrite(&number,sizeof(unsigned long long),1,fp);
+    for(idx_num=0;idx_num<index->num_sizes;idx_num++)
+    {
+        number = index->gram_sizes[idx_num];
+        fwrite(&number,sizeof(unsigned long long),1,fp);
+    }
+    for(idx_num=0;idx_num<index->num_sizes;idx_num++)
+    {
+        lists = index->lists[idx_num];
+        num_grams = NUM_GRAMS(index->gram_sizes[idx_num]);
+        offset = 0;
+        for(i=0;i<=num_grams;i++)
+        {
+            fwrite(&offset,sizeof(unsigned long long),1,fp);
+            if(i<num_grams)
+                offset += lists[i].length;
+        }
+    }
+    for(idx_num=0;idx_num<index->num_sizes;idx_num++)
+    {
+        lists = index->lists[idx_num];
+        num_grams = NUM_GRAMS(index->gram_sizes[idx_num]);
+        for(i=0;i<num_grams;i++)
+            if(lists[i].length>0 &&
+               fwrite(lists[i].bytes,1,lists[i].length,fp)!=lists[i].length)
+            {
+                printf("Error writing to a gram index file.\n");
+                exit(1);
+            }
+    }
+    if(ferror(fp))
+    {
+        printf("Error writing to a gram index file.\n");
+        exit(1);
+    }
+    fclose(fp);
+    //rename will not replace an existing file on all platforms
+    remove(file_name);
+    if(rename(tmp_name,file_name)!=0)
+    {
+        printf("Cannot replace a gram index file.\n");
+        exit(1);
+    }
+    free(tmp_name);
+}
+
+//Loads an index written by writeGramIndex, memory mapping the file where
+//this is supported. If prefetch is set the operating system is asked to
+//start reading the mapped file in the background
+gram_index *loadGramIndex(char *file_name,int prefetch)
+{
+    int idx_num;
+    int num_sizes;
+    size_t header;
+    size_t position;
+    unsigned long long *numbers;
+    gram_index *index;
+#ifdef MAP_GRAMS
+    int fd;
+    struct stat file_info;
+#else
+    FILE *fp;
+    long length;
+#endif
+#ifdef MAP_GRAMS
+    if((fd=open(file_name, O_RDONLY))==-1)
+    {
+        printf("Cannot open gram index file for reading.\n");
+        exit(1);
+    }
+    if(fstat(fd,&file_info)==-1 || file_info.st_size<(off_t)(2*sizeof(unsigned long long)))
+    {
+        printf("Premature end of gram index file\n");
+        exit(1);
+    }
+    numbers=mmap(NULL,file_info.st_size,PROT_READ,MAP_SHARED,fd,0);
+    if(numbers==MAP_FAILED)
+    {
+        printf("Cannot map gram index file into memory\n");
+        exit(1);
+    }
+    if(prefetch)
+        madvise(numbers,file_info.st_size,MADV_WILLNEED);
+    close(fd);
+    index = createGramIndex((int)numbers[1]);
+    index->data_bytes = file_info.st_size;
+#else
+    if((fp=fopen(file_name, "rb"))==NULL ||
+       fseek(fp,0,SEEK_END)!=0 || (length=ftell(fp))<0)
+    {
+        printf("Cannot open gram index file for reading.\n");
+        exit(1);
+    }
+    rewind(fp);
+    if((numbers=malloc(length+sizeof(unsigned long long)))==NULL)
+    {
+        printf("Not enough memory for gram index\n");
+        exit(1);
+    }
+    if(length<(long)(2*sizeof(unsigned long long)) || fread(numbers,1,length,fp)!=length)
+    {
+        printf("Premature end of gram index file\n");
+        exit(1);
+    }
+    fclose(fp);
+    index = createGramIndex((int)numbers[1]);
+    index->data_bytes = length;
+#endif
+    index->data = (char *)numbers;
+    index->num_records = (int)numbers[0];
+    num_sizes = index->num_sizes;
+    header = 2+num_sizes;
+    position = header;
+    for(idx_num=0;idx_num<num_sizes;idx_num++)
+    {
+        index->gram_sizes[idx_num] = (int)numbers[2+idx_num];
+        index->offsets[idx_num] = numbers+position;
+        position += NUM_GRAMS(index->gram_sizes[idx_num])+1;
+    }
+    position *= sizeof(unsigned long long);
+    for(idx_num=0;idx_num<num_sizes;idx_num++)
+    {
+        index->postings[idx_num] = (unsigned char *)index->data+position;
+        position += index->offsets[idx_num][NUM_GRAMS(index->gram_sizes[idx_num])];
+    }
+    if(position!=index->data_bytes)
+    {
+        printf("Premature end of gram index file (possibly due to out of date index files)\n");
+        exit(1);
+    }
+    return index;
+}
+
+//Set up a new query against an index and return it
+gram_query *createGramQuery(gram_index *index)
+{
+    gram_query *query;
+    if((query=malloc(sizeof(gram_query)))==NULL)
+    {
+        printf("Insufficent memory for creation of query\n");
+        exit(1);
+    }
+    query->index = index;
+    query->pieces = NULL;
+    query->num_pieces = 0;
+    query->pieces_size = 0;
+    query->seg_lengths = NULL;
+    query->segments = NULL;
+    query->sections = 0;
+    query->dropset = NULL;
+    query->bytes_read = 0;
+    return query;
+}
+
+//Returns a new empty list with room for the given number of records
+static int_list *createList(int size)
+{
+    int_list *list;
+    if((list=malloc(sizeof(int_list)))==NULL ||
+       (list->elms=malloc(sizeof(int)*(size+1)))==NULL)
+    {
+        printf("Insufficent memory for creation of record list\n");
+        exit(1);
+    }
+    list->length = 0;
+    return list;
+}
+
+static void freeList(int_list *list)
+{
+    if(list!=NULL)
+    {
+        free(list->elms);
+        free(list);
+    }
+}
+
+//Frees the segments of the current pattern of a query
+static void clearSegments(gram_query *query)
+{
+    int i;
+    if(query->segments!=NULL)
+    {
+        for(i=0;i<query->sections;i++)
+            freeList(query->segments[i]);
+        free(query->segments);
+        query->segments = NULL;
+    }
+    if(query->seg_lengths!=NULL)free(query->seg_lengths);
+    query->seg_lengths = NULL;
+    query->num_pieces = 0;
+}
+
+//Starts the next pattern of a query, with the given number of segments
+void createGramSegments(gram_query *query,int secs)
+{
+    int i;
+    clearSegments(query);
+    query->sections = secs;
+    if((query->segments=malloc(sizeof(int_list *)*(secs+1)))==NULL ||
+       (query->seg_lengths=malloc(sizeof(int)*(secs+1)))==NULL)
+    {
+        printf("Insufficent memory for creation of section array\n");
+        exit(1);
+    }
+    for(i=0;i<secs;i++)
+    {
+        query->segments[i] = NULL;
+        query->seg_lengths[i] = 0;
+    }
+}
+
+//Adds a piece to the end of a segment of the current pattern. The
+//idx_num is the position of the piece size in the list of sizes
+void encodeGramPiece(gram_query *query,int seg_num,char *piece,int idx_num)
+{
+    int code = 0;
+    int length = strlen(piece);
+    int i;
+    gram_piece *added;
+    if(query->num_pieces>=query->pieces_size)
+    {
+        query->pieces_size = query->pieces_size*2+16;
+        if((query->pieces=realloc(query->pieces,sizeof(gram_piece)*query->pieces_size))==NULL)
+        {
+            printf("Insufficent memory for adding query piece\n");
+            exit(1);
+        }
+    }
+    for(i=0;i<length;i++)
+        code = (code<<RESIDUE_BITS)|residueCode(piece[i]);
+    added = query->pieces+query->num_pieces++;
+    added->seg_num = seg_num;
+    added->idx_num = idx_num;
+    added->code = code;
+    added->offset = query->seg_lengths[seg_num];
+    query->seg_lengths[seg_num] += length;
+}
+
+//Orders the pieces of a segment by the length of their postings
+static int comparePostings(const void *a,const void *b)
+{
+    unsigned long long x = ((const unsigned long long *)a)[0];
+    unsigned long long y = ((const unsigned long long *)b)[0];
+    if(x<y)
+        return -1;
+    return x>y;
+}
+
+//Returns the records that have every piece of a segment at the position
+//it is at in the segment, so that the whole segment is in the record
+//(or rather pieces with the same residue codes). The postings of the
+//piece with the fewest are read first, and each of the others only
+//keeps the places the segment could start that it agrees with
+static int_list *findSegment(gram_query *query,int seg_num)
+{
+    gram_index *index = query->index;
+    //for each piece of the segment the length of its postings and
+    //its position in the pieces of the query
+    unsigned long long *order;
+    int *starts;
+    int *records;
+    int num_starts = 0;
+    int starts_size = 0;
+    int num_order = 0;
+    int kept;
+    int record;
+    int start;
+    int offset;
+    int i;
+    int j;
+    unsigned int count;
+    unsigned int position;
+    unsigned char *bytes;
+    unsigned char *end;
+    gram_piece *piece;
+    int_list *list;
+    if((order=malloc(sizeof(unsigned long long)*2*(query->num_pieces+1)))==NULL)
+    {
+        printf("Insufficent memory for finding segment\n");
+        exit(1);
+    }
+    for(i=0;i<query->num_pieces;i++)
+    {
+        piece = query->pieces+i;
+        if(piece->seg_num!=seg_num)
+            continue;
+        order[2*num_order] = index->offsets[piece->idx_num][piece->code+1]-
+                             index->offsets[piece->idx_num][piece->code];
+        order[2*num_order+1] = i;
+        num_order++;
+    }
+    //a segment without pieces does not rule out any records
+    if(num_order==0)
+    {
+        free(order);
+        list = createList(index->num_records);
+        for(i=0;i<index->num_records;i++)
+            list->elms[i] = i;
+        list->length = index->num_records;
+        return list;
+    }
+    qsort(order,num_order,2*sizeof(unsigned long long),comparePostings);
+    records = NULL;
+    starts = NULL;
+    for(i=0;i<num_order;i++)
+    {
+        piece = query->pieces+order[2*i+1];
+        offset = piece->offset;
+        bytes = index->postings[piece->idx_num]+index->offsets[piece->idx_num][piece->code];
+        end = bytes+order[2*i];
+        query->bytes_read += (int)order[2*i];
+        record = -1;
+        if(i==0)
+        {
+            //every place the first piece is at could start the segment
+            while(bytes<end)
+            {
+                record += readPosting(&bytes,&count);
+                position = 0;
+                while(count--)
+                {
+                    position += readNumber(&bytes);
+                    start = (int)position-offset;
+                    if(start<0)
+                        continue;
+                    if(num_starts>=starts_size)
+                    {
+                        starts_size = starts_size*2+64;
+                        if((records=realloc(records,sizeof(int)*starts_size))==NULL ||
+                           (starts=realloc(starts,sizeof(int)*starts_size))==NULL)
+                        {
+                            printf("Insufficent memory for finding segment\n");
+                            exit(1);
+                        }
+                    }
+                    records[num_starts] = record;
+                    starts[num_starts++] = start;
+                }
+            }
+            continue;
+        }
+        //keep the starts that this piece is also found at, both the starts
+        //and the postings being in order of record and then position
+        kept = 0;
+        j = 0;
+        while(bytes<end && j<num_starts)
+        {
+            record += readPosting(&bytes,&count);
+            while(j<num_starts && records[j]<record)
+                j++;
+            if(j>=num_starts || records[j]>record)
+            {
+                bytes = skipNumbers(bytes,count);
+                continue;
+            }
+            position = 0;
+            while(count--)
+            {
+                position += readNumber(&bytes);
+                start = (int)position-offset;
+                while(j<num_starts && records[j]==record && starts[j]<start)
+                    j++;
+                if(j>=num_starts || records[j]!=record)
+                {
+                    bytes = skipNumbers(bytes,count);
+                    break;
+                }
+                if(starts[j]==start)
+                {
+                    records[kept] = record;
+                    starts[kept++] = start;
+                    j++;
+                }
+            }
+        }
+        num_starts = kept;
+        if(num_starts==0)
+            break;
+    }
+    list = createList(num_starts);
+    for(i=0;i<num_starts;i++)
+        if(list->length==0 || list->elms[list->length-1]!=records[i])
+            list->elms[list->length++] = records[i];
+    if(records!=NULL)free(records);
+    if(starts!=NULL)free(starts);
+    free(order);
+    return list;
+}
+
+//Returns the records in either of two lists of records in order
+static int_list *unionLists(int_list *a,int_list *b)
+{
+    int_list *list = createList(a->length+b->length);
+    int i = 0;
+    int j = 0;
+    while(i<a->length || j<b->length)
+    {
+        if(j>=b->length || (i<a->length && a->elms[i]<b->elms[j]))
+            list->elms[list->length++] = a->elms[i++];
+        else if(i>=a->length || b->elms[j]<a->elms[i])
+            list->elms[list->length++] = b->elms[j++];
+        else
+        {
+            list->elms[list->length++] = a->elms[i++];
+            j++;
+        }
+    }
+    return list;
+}
+
+//Returns the records in both of two lists of records in order
+static int_list *intersectLists(int_list *a,int_list *b)
+{
+    int_list *list = createList(a->length<b->length ? a->length : b->length);
+    int i = 0;
+    int j = 0;
+    while(i<a->length && j<b->length)
+    {
+        if(a->elms[i]<b->elms[j])
+            i++;
+        else if(b->elms[j]<a->elms[i])
+            j++;
+        else
+        {
+            list->elms[list->length++] = a->elms[i++];
+            j++;
+        }
+    }
+    return list;
+}
+
+//Returns the records that have any one of the segments of the current
+//pattern, finding the records of each segment if they are not known yet
+static int_list *findPattern(gram_query *query)
+{
+    int i;
+    int_list *any = createList(0);
+    int_list *next;
+    for(i=0;i<query->sections;i++)
+    {
+        if(query->segments[i]==NULL)
+            query->segments[i] = findSegment(query,i);
+        next = unionLists(any,query->segments[i]);
+        freeList(any);
+        any = next;
+    }
+    return any;
+}
+
+//Creates a set of the records that match when any segment of the
+//current pattern is or'ed with the previous dropset
+void updateGramsOr(gram_query *query)
+{
+    int_list *matches = findPattern(query);
+    int_list *dropset;
+    if(query->dropset==NULL)
+    {
+        query->dropset = matches;
+        return;
+    }
+    dropset = unionLists(query->dropset,matches);
+    freeList(query->dropset);
+    freeList(matches);
+    query->dropset = dropset;
+}
+
+//Creates a set of the records that match when any segment of the
+//current pattern is and'ed with the previous dropset
+void updateGramsAnd(gram_query *query)
+{
+    int_list *matches = findPattern(query);
+    int_list *dropset;
+    if(query->dropset==NULL)
+    {
+        query->dropset = matches;
+        return;
+    }
+    dropset = intersectLists(query->dropset,matches);
+    freeList(query->dropset);
+    freeList(matches);
+    query->dropset = dropset;
+}
+
+//returns a list of up to max_drops records in the dropset, starting from
+//the record given in start (counting from 0), in the same way as getDrops
+int_list *getGramDrops(gram_query *query,int start,int max_drops)
+{
+    int low = 0;
+    int high;
+    int middle;
+    int_list *dropset = query->dropset;
+    int_list *list;
+    if(max_drops<0)
+        max_drops = 0;
+    if(dropset==NULL)
+        return createList(0);
+    //find the first record in the dropset from start on
+    high = dropset->length;
+    while(low<high)
+    {
+        middle = (low+high)/2;
+        if(dropset->elms[middle]<start)
+            low = middle+1;
+        else
+            high = middle;
+    }
+    if(max_drops>dropset->length-low)
+        max_drops = dropset->length-low;
+    list = createList(max_drops);
+    memcpy(list->elms,dropset->elms+low,sizeof(int)*max_drops);
+    list->length = max_drops;
+    return list;
+}
+
+//Returns the number of records that have the given segment of the
+//current pattern, or any one of its segments if seg_num is -1
+int countGramSegment(gram_query *query,int seg_num)
+{
+    int count;
+    int_list *any;
+    if(seg_num>=0)
+    {
+        if(query->segments[seg_num]==NULL)
+            query->segments[seg_num] = findSegment(query,seg_num);
+        return query->segments[seg_num]->length;
+    }
+    any = findPattern(query);
+    count = any->length;
+    freeList(any);
+    return count;
+}
+
+//Returns the number of records in the dropset of a query
+int countGramDropset(gram_query *query)
+{
+    if(query->dropset==NULL)
+        return 0;
+    return query->dropset->length;
+}
+
+//Returns the number of bytes of postings read by a query
+int countGramBytes(gram_query *query)
+{
+    return query->bytes_read;
+}
+
+//Frees all memory used by a query
+void clearGramQuery(gram_query *query)
+{
+    clearSegments(query);
+    freeList(query->dropset);
+    if(query->pieces!=NULL)free(query->pieces);
+    free(query);
+}
+
+//Frees all memory used by an index
+void clearGramIndex(gram_index *index)
+{
+    int i;
+    int j;
+    for(i=0;i<index->num_sizes;i++)
+        if(index->lists[i]!=NULL)
+        {
+            for(j=0;j<NUM_GRAMS(index->gram_sizes[i]);j++)
+                if(index->lists[i][j].bytes!=NULL)free(index->lists[i][j].bytes);
+            free(index->lists[i]);
+        }
+    if(index->data!=NULL)
+#ifdef MAP_GRAMS
+        munmap(index->data,index->data_bytes);
+#else
+        free(index->data);
+#endif
+    free(index->gram_sizes);
+    free(index->offsets);
+    free(index->postings);
+    free(index->lists);
+    free(index);
+}
@@ -16,6 +16,7 @@
     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """ 
 import math
+import os
 import random
 import string
 import time
@@ -65,52 +66,30 @@ def generateRandomSequencesss(runs,length):
     return sequences
     
     
-def generateBackgroundProfile(file_to_parse,test_num):
-    profile=open('BackgroundProfile.txt', 'w')
-    db_file = open(file_to_parse, 'r')    
-    means = []
-    stdevs = []
-    for i in range(1,80):
-        seqs = generateRandomSequences(test_num,i)        
-        cum_align_score = 0
-        cum_square_score = 0
-        trials = 0
-        for j in range(test_num):
-            record = []
-            db_file.seek(0)
-            for line in db_file:           
-                #database body section
-                if line[0] != '>':
-                    record.append(line[:-1])               
-                #database header
-                else:
-                    record = ''.join(record)
-                    segments = [record[k+(i/2):k+i] for k in range(0,len(record),i*2)]
-                    for l in range(len(segments)):
-                        trials += 1
-                        al_score = score(i,seqs[j],segments[l])
-                        cum_align_score += al_score
-                        cum_square_score += pow(al_score,2)                       
-                    record = []
-        mean = float(cum_align_score)/float(trials)
-        means.append(mean)
-        stdevs.append(pow(fabs((float(cum_square_score)/float(trials))-pow(mean,2)),2))
-        print "done %i" % (i)
-    profile.write("means = [",)
-    for i in range(1,80):
-        if i==79:
-            profile.write("%.4f" % (means[i-1]))
-        else:
-            profile.write("%.4f, " % (means[i-1]))
-    profile.write("]\nstdevs = [",) 
-    for i in range(1,80):   
-        if i==79:
-            profile.write("%.4f" % (stdevs[i-1]))
-        else:
-            profile.write("%.4f, " % (stdevs[i-1]))
-    profile.write("]\n")
-    db_file.close()
-    profile.close()
+#------------------------------------------------------------------------------#
+#Creates the background profile of the given database from test_num alignments
+#of random segments of it for each length, split between a number of processes,
+#and writes the means and standard deviations to BackgroundProfile.txt in the
+#same form as the table in Adrasteia. The profile is also kept next to the
+#database, where it is used for the p-values of matches in it
+#------------------------------------------------------------------------------#
+def generateBackgroundProfile(file_to_parse,test_num,processes=1):
+    profile = BackgroundProfile(file_to_parse[0:-6]+".prof")
+    start = time.time()
+    profile.build(file_to_parse,profileFingerprint(file_to_parse),test_num,
+                  processes)
+    print "Profiled %i lengths in %f seconds" % (len(profile.means),
+                                                 time.time()-start)
+    profile_file = open('BackgroundProfile.txt', 'w')
+    values = []
+    for mean in profile.means:
+        values.append("%.4f" % (mean))
+    profile_file.write("means = ["+", ".join(values)+"]\n")
+    values = []
+    for stdev in profile.stdevs:
+        values.append("%.4f" % (stdev))
+    profile_file.write("stdevs = ["+", ".join(values)+"]\n")
+    profile_file.close()
             
     
 
@@ -131,6 +110,8 @@ def timeDirectMatch(runs,min_bound,max_bound,file_to_parse,ed):
         t2 = time.clock()
         elapsedtime = elapsedtime + (t2-t1)
     print '->Matching took an average of %0.3fms' % ((elapsedtime*1000.0)/runs)
+    megabytes = os.path.getsize(file_to_parse)/1048576.0
+    print '->Database was scanned at %0.1fMB/s' % (megabytes*runs/elapsedtime)
     
 #---------------------------------------------------------------------------------#
 #Print the average time, over the given number of runs, taken to find matches that 
@@ -202,3 +183,65 @@ def timeMultiplePreprocessAndMatch(num,runs,min_bound,max_bound,file_to_parse,ed
     print '->Matching took an average of %0.3fms' % ((elapsedtime*1000.0)/runs)
 
 
+
+#---------------------------------------------------------------------------------#
+#Print the average time, over the given number of runs, taken by each engine to
+#find the candidate records for a generated sequence of min < size < max, and
+#the number of candidates found. As the candidates are then verified in the
+#same way the average time taken to match each sequence is also printed, so
+#that an engine finding fewer candidates more slowly can be compared. Sequences
+#that cannot use the index (too short for ed errors) are skipped and counted
+#---------------------------------------------------------------------------------#
+def timeMatchEngines(runs,min_bound,max_bound,file_to_parse,ed):
+    seqs = generateRandomSequences(runs,min_bound,max_bound)
+    for engine in FastaDatabase.ENGINES:
+        print 'TimeMatchEngines - loading database for the %s engine...' % engine
+        m=FastaDatabase(file_to_parse,engine=engine)
+        print 'TimeMatchEngines - measuring filtering times...'
+        elapsedtime = 0
+        matchtime = 0
+        candidates = 0
+        timed = 0
+        for i in xrange(runs):
+            query_pieces = m.splitQuery(seqs[i],ed)
+            if query_pieces is None:
+                continue
+            timed += 1
+            t1 = time.clock()
+            if engine=="numpy":
+                drops = m.numpyDrops([query_pieces],[[-1]])
+            elif engine=="qgram":
+                drops = m.gramDrops([query_pieces],[[-1]])
+            else:
+                query = m.bitwiseQuery([query_pieces],[[-1]])
+                drops = getDrops(query,0,len(m.header_index))
+                clearMatchInfo(query)
+            t2 = time.clock()
+            elapsedtime += (t2-t1)
+            candidates += len(drops)
+            t1 = time.clock()
+            m.match(seqs[i],ed)
+            t2 = time.clock()
+            matchtime += (t2-t1)
+        del m
+        print '->%i of %i sequences were skipped as too short for %i errors' % \
+              (runs-timed,runs,ed)
+        if timed==0:
+            continue
+        print '->Filtering took an average of %0.3fms for %i candidates' % \
+              ((elapsedtime*1000.0)/timed,candidates/timed)
+        print '->Matching took an average of %0.3fms' % ((matchtime*1000.0)/timed)
+
+#---------------------------------------------------------------------------------#
+#Print the time taken to find matches for num generated sequences of
+#min < size < max, searching for all of them together with match_many
+#---------------------------------------------------------------------------------#
+def timeMatchMany(num,min_bound,max_bound,file_to_parse,ed):
+    seqs = generateRandomSequences(num,min_bound,max_bound)
+    m=FastaDatabase(file_to_parse)
+    print 'TimeMatchMany - measuring matching times...'
+    t1 = time.clock()
+    results = m.match_many(seqs,ed)
+    t2 = time.clock()
+    del m
+    print '->Matching %i sequences took %0.3fms' % (num,(t2-t1)*1000.0)
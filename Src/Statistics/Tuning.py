@@ -0,0 +1,184 @@
+""" Tuning of the index parameters for Adrasteia
+    Copyright (C) 2006   Miles Hampson
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import shutil
+import tempfile
+import time
+from random import Random
+
+from Adrasteia import *
+
+#The index configurations tried by default, each as [word width, number
+#of set bits, piece sizes]
+CONFIGURATIONS = [[1024,1,[2,3]],[512,1,[2,3]],[2048,1,[2,3]],
+                  [1024,2,[2,3]],[2048,2,[2,3]],[1024,1,[2,3,4]],
+                  [2048,1,[2,3,4]],[2048,1,[2,3,4,5,6]]]
+#Number of records of the database sampled to try each configuration on
+SAMPLE_RECORDS = 1000
+#Number of queries in a generated workload, with the lengths and
+#numbers of errors they are given
+WORKLOAD_QUERIES = 200
+QUERY_LENGTHS = [8,12,16,24,32,48]
+QUERY_ERRORS = [1,2,3]
+#Seed for the random numbers, so that the same database is always
+#tuned in the same way
+SEED = 2006
+
+#------------------------------------------------------------------------------#
+#Write a sample of the given number of records chosen at random from the
+#database to sample_file_name, copying the lines of each record as they are
+#------------------------------------------------------------------------------#
+def sampleDatabase(db_file_name,sample_file_name,records,generator):
+    sample = []
+    record = None
+    seen = 0
+    for line in open(db_file_name,'r'):
+        if line[0]=='>':
+            #every record seen so far has the same chance of being sampled
+            record = [line]
+            if len(sample)<records:
+                sample.append(record)
+            else:
+                i = generator.randrange(seen+1)
+                if i<records:
+                    sample[i] = record
+            seen += 1
+        elif record is not None:
+            record.append(line)
+    sample_file = open(sample_file_name,'w')
+    for record in sample:
+        sample_file.write(''.join(record))
+    sample_file.close()
+
+#------------------------------------------------------------------------------#
+#Returns a workload of queries as (pattern, number of errors) pairs, each cut
+#from a record of the database at random with up to its number of errors
+#made in it by substituting residues
+#------------------------------------------------------------------------------#
+def generateWorkload(db_file_name,queries,generator,lengths=QUERY_LENGTHS,
+                     errors=QUERY_ERRORS):
+    db_file = open(db_file_name,'r')
+    sequences = [sequence for header,sequence in scanRecords(db_file)]
+    db_file.close()
+    workload = []
+    residues = "ACDEFGHIKLMNPQRSTVWY"
+    while sequences and len(workload)<queries:
+        sequence = generator.choice(sequences)
+        length = generator.choice(lengths)
+        max_errors = generator.choice(errors)
+        if len(sequence)<length:
+            continue
+        start = generator.randrange(len(sequence)-length+1)
+        pattern = list(sequence[start:start+length])
+        for i in xrange(generator.randint(0,max_errors)):
+            pattern[generator.randrange(length)] = generator.choice(residues)
+        workload.append((''.join(pattern),max_errors))
+    return workload
+
+#------------------------------------------------------------------------------#
+#Index the database with the given configuration (replacing any index it has)
+#and run the workload against it. Returns a dictionary of the configuration,
+#the time taken to build the index and its size in bytes, and the totals over
+#the workload of the candidate records, the matching records, and the time
+#taken to find the candidates and to verify them
+#------------------------------------------------------------------------------#
+def measureConfiguration(db_file_name,index_config,workload):
+    t1 = time.time()
+    db = FastaDatabase(db_file_name,index_config=index_config)
+    t2 = time.time()
+    measurement = {'config':db.indexConfig(),'build_time':t2-t1,
+                   'index_bytes':os.path.getsize(db.index_name),
+                   'candidates':0,'hits':0,'filter_time':0.0,'verify_time':0.0}
+    for i in xrange(len(db.PIECE_SIZES)):
+        measurement['index_bytes'] += os.path.getsize(db.slice_file_name+str(i))
+    for pattern,max_errors in workload:
+        t1 = time.time()
+        query_pieces = db.splitQuery(pattern,max_errors)
+        if query_pieces is not None:
+            query = db.bitwiseQuery([query_pieces],[[-1]])
+            measurement['candidates'] += len(getDrops(query,0,len(db.header_index)))
+            clearMatchInfo(query)
+        else:
+            #the whole database is searched for the query
+            measurement['candidates'] += len(db.header_index)
+        t2 = time.time()
+        results = db.match(pattern,max_errors)
+        t3 = time.time()
+        measurement['hits'] += len(results)
+        measurement['filter_time'] += t2-t1
+        #match finds the candidates again before verifying them
+        measurement['verify_time'] += max((t3-t2)-(t2-t1),0.0)
+    del db
+    return measurement
+
+#------------------------------------------------------------------------------#
+#Print a table of measurements of configurations, with the times per query
+#------------------------------------------------------------------------------#
+def printMeasurements(measurements,num_queries):
+    print '%-26s %9s %11s %11s %11s %11s' % ('Configuration','Build(s)',
+            'Index(KB)','Candidates','Filter(ms)','Verify(ms)')
+    for m in measurements:
+        print '%-26s %9.2f %11i %11i %11.3f %11.3f' % (str(m['config']),
+              m['build_time'],m['index_bytes']/1024,m['candidates']/num_queries,
+              m['filter_time']*1000.0/num_queries,
+              m['verify_time']*1000.0/num_queries)
+
+#------------------------------------------------------------------------------#
+#Choose the index configuration for a database. Each configuration is tried on
+#a sample of the records of the database, running a workload of (pattern,
+#number of errors) queries against it, generated from the sample if none is
+#given. The configuration that answers the workload fastest (finding the
+#candidates and verifying them) is chosen, of those with an index no larger
+#than max_index_bytes per byte of the sample if that is given. The database
+#is then indexed with it, so FastaDatabase uses it from then on. Returns the
+#chosen configuration and the measurements of every configuration
+#------------------------------------------------------------------------------#
+def tuneDatabase(db_file_name,configurations=CONFIGURATIONS,workload=None,
+                 records=SAMPLE_RECORDS,queries=WORKLOAD_QUERIES,processes=1,
+                 max_index_bytes=None):
+    generator = Random(SEED)
+    sample_dir = tempfile.mkdtemp()
+    try:
+        sample_file_name = os.path.join(sample_dir,"Sample.fasta")
+        sampleDatabase(db_file_name,sample_file_name,records,generator)
+        sample_bytes = os.path.getsize(sample_file_name)
+        if workload is None:
+            workload = generateWorkload(sample_file_name,queries,generator)
+        print 'TuneDatabase - trying %i configurations on %i records...' % \
+              (len(configurations),records)
+        measurements = []
+        for index_config in configurations:
+            measurements.append(measureConfiguration(sample_file_name,
+                                                     index_config,workload))
+    finally:
+        shutil.rmtree(sample_dir)
+    printMeasurements(measurements,max(len(workload),1))
+    best = None
+    for m in measurements:
+        if max_index_bytes is not None and \
+           m['index_bytes']>max_index_bytes*sample_bytes:
+            continue
+        if best is None or m['filter_time']+m['verify_time']< \
+           best['filter_time']+best['verify_time']:
+            best = m
+    if best is None:
+        error = "Error: No configuration gives an index small enough"
+        raise Exception(error)
+    print '->Indexing the database with %s' % str(best['config'])
+    FastaDatabase(db_file_name,processes=processes,index_config=best['config'])
+    return best['config'],measurements
@@ -4,6 +4,8 @@
    for simple patterns i.e. not involving regular expressions, which are less
    that length SHORT_LONG (typically 24). Simple patterns longer that SHORT_LONG
    are handled by lagrep, while is known as a_monkey in the original code.
+   Both keep the pattern in a 32 bit word, so patterns longer than WORD_PATLEN
+   are handled by magrep, a bit-vector matcher with no limit on their length.
 
    The assumption is that r.e. matching will be done by the re or regexp modules
    and that straight string matching will be done be find/rfind in the string
@@ -17,18 +19,19 @@
 /* First two service functions, the second of which is really only used
    during debugging  */
 
-/* Add a new match to the list, i.e. pair of integers to array;
+/* Add a new match to the list, i.e. pair of integers and its errors to array;
    Because it is common for there to be no matches, allocation
    of the matchlist is delayed until actually needed at the cost
    of an additional NULL test for each addition */
 
-int_pair_list * add_ends(int start, int end, int_pair_list *matches)
+int_pair_list * add_ends(int start, int end, int errors, int_pair_list *matches)
 {
   if(matches == NULL)
     {
     matches = (int_pair_list *) malloc(sizeof(int_pair_list));
     matches -> npairs = 0;
     matches -> maxpairs = INITPAIRS;
+    matches -> witherrors = FALSE;
     matches -> pairs = (int_pair *) malloc(INITPAIRS * sizeof(int_pair));
     }
   else if (++(matches -> npairs) == matches -> maxpairs)
@@ -38,6 +41,7 @@ int_pair_list * add_ends(int start, int end, int_pair_list *matches)
     }
 
   (matches ->pairs[matches -> npairs]).start = start;
+  (matches ->pairs[matches -> npairs]).errors = errors;
 
 #ifdef PYTHON
   (matches ->pairs[matches -> npairs]).end = end + 1;
@@ -70,12 +74,11 @@ void printnstring(register char *string, int start, int end)
 int_pair_list *agrepy(char *pat, int patlen, char *text, int textlen,
 		int gotoends, param_struct *parampt) 
 {
+  if(patlen > WORD_PATLEN)
+    return(exec_magrepy(pat, patlen, text, textlen, gotoends != 0, parampt));
   if(patlen <= SHORT_LONG)
     return(exec_sagrepy(pat, patlen, text, textlen, gotoends != 0, parampt));
-  if(patlen <= MAXPATLEN)
-    return(exec_lagrepy(pat, patlen, text, textlen, gotoends != 0, parampt));
-  fprintf(stderr, "Pattern string must be no longer than %d\n", MAXPATLEN);
-  return((int_pair_list *) NULL);
+  return(exec_lagrepy(pat, patlen, text, textlen, gotoends != 0, parampt));
 }
 
 param_struct *compile(char* Pattern, int patlen, int NErrors)
@@ -92,11 +95,211 @@ param_struct *compile(char* Pattern, int patlen, int NErrors)
     fprintf(stderr, "\tThe max value (8) assumed\n");
     NErrors = 8;
     }
+  if(patlen > WORD_PATLEN)
+    return((param_struct *) magrepy_compile(Pattern, patlen, (signed char) NErrors));
   if(patlen <= SHORT_LONG)
     return((param_struct *) sagrepy_compile(Pattern, patlen, (signed char) NErrors));
   return((param_struct *) lagrepy_compile(Pattern, patlen, (signed char) NErrors));
 }
 
+/* Free the parameters compiled for a pattern */
+void free_compiled(param_struct *parampt)
+{
+  free(parampt);
+}
+
+/* Create an empty set of patterns to search for at once */
+multi_param *multi_compile(void)
+{
+  multi_param *multipt = (multi_param *) malloc(sizeof(multi_param));
+
+  multipt -> npatterns = 0;
+  multipt -> maxpatterns = INITPAIRS;
+  multipt -> patterns = (char **) malloc(INITPAIRS * sizeof(char *));
+  multipt -> patlens = (int *) malloc(INITPAIRS * sizeof(int));
+  multipt -> params = (param_struct **) malloc(INITPAIRS * sizeof(param_struct *));
+  multipt -> always = (int *) malloc(INITPAIRS * sizeof(int));
+  multipt -> nwords = 0;
+  multipt -> Mask = NULL;
+  multipt -> firstbits = multipt -> lastbits = NULL;
+  multipt -> bitpattern = NULL;
+  multipt -> bitsused = MULTI_WORD_BITS;
+  return(multipt);
+}
+
+/* Start a new word of the automaton for the pieces of the patterns */
+static void multi_new_word(multi_param *multipt)
+{
+  int w = multipt -> nwords++, i;
+
+  multipt -> Mask = realloc(multipt -> Mask, multipt -> nwords * sizeof(*multipt -> Mask));
+  multipt -> firstbits = realloc(multipt -> firstbits, multipt -> nwords * sizeof(multi_word));
+  multipt -> lastbits = realloc(multipt -> lastbits, multipt -> nwords * sizeof(multi_word));
+  multipt -> bitpattern = realloc(multipt -> bitpattern,
+				  multipt -> nwords * sizeof(*multipt -> bitpattern));
+  for(i=0; i<MAXSYM; i++)
+    multipt -> Mask[w][i] = 0;
+  multipt -> firstbits[w] = multipt -> lastbits[w] = 0;
+  multipt -> bitsused = 0;
+}
+
+/* Add a pattern with its own number of errors to a set of patterns. As in
+   sagrep the pattern is split into NErrors+1 pieces of length
+   patlen/(NErrors+1), each of which is added to the automaton */
+void multi_add(multi_param *multipt, char *Pattern, int patlen, int NErrors)
+{
+  int n = multipt -> npatterns++, m, len, piece, i, w, bit;
+
+  if(n == multipt -> maxpatterns)
+    {
+    multipt -> maxpatterns = (int) (INCRPAIRS * multipt -> maxpatterns);
+    multipt -> patterns = (char **) realloc(multipt -> patterns, multipt -> maxpatterns * sizeof(char *));
+    multipt -> patlens = (int *) realloc(multipt -> patlens, multipt -> maxpatterns * sizeof(int));
+    multipt -> params = (param_struct **) realloc(multipt -> params, multipt -> maxpatterns * sizeof(param_struct *));
+    multipt -> always = (int *) realloc(multipt -> always, multipt -> maxpatterns * sizeof(int));
+    }
+  multipt -> patterns[n] = (char *) malloc(patlen + 1);
+  memcpy(multipt -> patterns[n], Pattern, patlen);
+  multipt -> patterns[n][patlen] = '\0';
+  multipt -> patlens[n] = patlen;
+  multipt -> params[n] = compile(multipt -> patterns[n], patlen, NErrors);
+  if(NErrors < 1)
+    NErrors = 1;
+  if(NErrors > 8)
+    NErrors = 8;
+  m = patlen / (NErrors + 1);
+  /* lagrep finds its own candidates, so its patterns are left to it
+     rather than second guessing it */
+  multipt -> always[n] = (m < 1 || (patlen > SHORT_LONG && patlen <= WORD_PATLEN));
+  if(multipt -> always[n])
+    return;
+  /* the pieces of long patterns are cut short to fit into a word, as
+     any match still contains the start of one of them exactly */
+  len = m;
+  if(len > MAX_PIECE)
+    len = MAX_PIECE;
+  for(piece=0; piece<=NErrors; piece++)
+    {
+    if(multipt -> bitsused + len > MULTI_WORD_BITS)
+      multi_new_word(multipt);
+    w = multipt -> nwords - 1;
+    bit = multipt -> bitsused;
+    for(i=0; i<len; i++)
+      multipt -> Mask[w][(unsigned char) Pattern[piece * m + i]] |= ((multi_word) 1) << (bit + i);
+    multipt -> firstbits[w] |= ((multi_word) 1) << bit;
+    multipt -> lastbits[w] |= ((multi_word) 1) << (bit + len - 1);
+    multipt -> bitpattern[w][bit + len - 1] = n;
+    multipt -> bitsused += len;
+    }
+}
+
+/* Keep only the matches in the list with the fewest errors, unless the
+   errors of any of them could not be counted */
+static void keep_fewest_errors(int_pair_list *plist)
+{
+  int i, n, fewest = plist -> pairs[0].errors;
+
+  for(i=0; i<= plist -> npairs; i++)
+    {
+    if(plist -> pairs[i].errors < 0)
+      return;
+    if(plist -> pairs[i].errors < fewest)
+      fewest = plist -> pairs[i].errors;
+    }
+  n = 0;
+  for(i=0; i<= plist -> npairs; i++)
+    if(plist -> pairs[i].errors == fewest)
+      plist -> pairs[n++] = plist -> pairs[i];
+  plist -> npairs = n - 1;
+}
+
+/* Search the text for all the patterns in a single pass of the automaton,
+   then match each pattern that may occur with agrepy. Returns the list of
+   matches (or NULL) for each pattern, with the errors in each match if
+   witherrors is set. If fewest is set only the matches of each pattern
+   with the fewest errors are returned */
+multi_match_list *agrepy_multi(multi_param *multipt, char *text, int textlen,
+		int gotoends, int witherrors, int fewest)
+{
+  int npatterns = multipt -> npatterns, nwords = multipt -> nwords;
+  int i, w, bit, remaining = 0;
+  multi_word *R = (multi_word *) malloc((nwords + 1) * sizeof(multi_word));
+  multi_word found;
+  char *hit = (char *) malloc(npatterns + 1);
+  multi_match_list *results = (multi_match_list *) malloc(sizeof(multi_match_list));
+
+  for(i=0; i<npatterns; i++)
+    {
+    hit[i] = multipt -> always[i];
+    if(! hit[i])
+      remaining++;
+    }
+  for(w=0; w<nwords; w++)
+    R[w] = 0;
+  for(i=0; i<textlen && remaining > 0; i++)
+    for(w=0; w<nwords; w++)
+      {
+      /* a carry out of the last bit of one piece into the first bit
+	 of the next is harmless, as the first bits are always set */
+      R[w] = ((R[w] << 1) | multipt -> firstbits[w]) & multipt -> Mask[w][(unsigned char) text[i]];
+      found = R[w] & multipt -> lastbits[w];
+      while(found)
+	{
+	bit = 0;
+	while(! ((found >> bit) & 1))
+	  bit++;
+	found &= found - 1;
+	if(! hit[multipt -> bitpattern[w][bit]])
+	  {
+	  hit[multipt -> bitpattern[w][bit]] = 1;
+	  remaining--;
+	  }
+	}
+      }
+  results -> npatterns = npatterns;
+  results -> matches = (int_pair_list **) malloc((npatterns + 1) * sizeof(int_pair_list *));
+  for(i=0; i<npatterns; i++)
+    {
+    if(hit[i])
+      {
+      results -> matches[i] = agrepy(multipt -> patterns[i], multipt -> patlens[i],
+				     text, textlen, gotoends, multipt -> params[i]);
+      if(results -> matches[i] != NULL)
+	{
+	results -> matches[i] -> witherrors = witherrors != 0;
+	if(fewest)
+	  keep_fewest_errors(results -> matches[i]);
+	}
+      }
+    else
+      results -> matches[i] = NULL;
+    }
+  free(hit);
+  free(R);
+  return(results);
+}
+
+/* Free a set of patterns and everything compiled for them */
+void multi_free(multi_param *multipt)
+{
+  int i;
+
+  for(i=0; i<multipt -> npatterns; i++)
+    {
+    free(multipt -> patterns[i]);
+    free_compiled(multipt -> params[i]);
+    }
+  free(multipt -> patterns);
+  free(multipt -> patlens);
+  free(multipt -> params);
+  free(multipt -> always);
+  free(multipt -> Mask);
+  free(multipt -> firstbits);
+  free(multipt -> lastbits);
+  free(multipt -> bitpattern);
+  free(multipt);
+}
+
 #ifdef STANDALONE
 int main(){
   FILE *infile;
@@ -21,6 +21,9 @@ lagrep does work for smaller pattern, so useful for testing */
 #else
 #define SHORT_LONG  24  
 #endif
+/* The length of pattern above which magrep is used, as sagrep and lagrep
+   keep the pattern in a single 32 bit word */
+#define WORD_PATLEN 32
 
 #ifndef TRUE
 #define FALSE 0
@@ -50,33 +53,94 @@ typedef struct lagrep_struct
   signed char NErrors;
   } lagrep_struct;
 
+#define MULTI_WORD_BITS 64
+typedef unsigned long long multi_word;
+
+/* The bundled parameters for magrep, with the bits of the pattern for
+   each symbol in nblocks words per symbol */
+typedef struct magrep_struct
+  {
+  int nblocks;
+  multi_word *Peq;
+  signed char NErrors;
+  } magrep_struct;
+
 typedef union param_struct
 {
   sagrep_struct sagrep;
   lagrep_struct lagrep;
+  magrep_struct magrep;
 } param_struct;
 
 
+/* A match, with the number of errors (edits) it contains or -1 if they
+   could not be counted */
 typedef struct int_pair
 {
-  int start, end;
+  int start, end, errors;
 } int_pair;
 
+/* witherrors is set when the number of errors of each match is to be
+   returned to python as well as its ends */
 typedef struct int_pair_list
 {
-  int npairs, maxpairs;
+  int npairs, maxpairs, witherrors;
   int_pair *pairs;
 } int_pair_list;
 
-extern int_pair_list * add_ends(int start, int end, int_pair_list *matches);
+/* Several patterns compiled to be searched for in a text at once. The
+   text is first scanned for exact occurrences of the pieces each pattern
+   is split into for sagrep (one of which must occur in any match), by a
+   shift-and automaton for all the pieces packed into 64 bit words, and
+   only the patterns with a piece that occurs are then matched by agrepy.
+   Pieces longer than MAX_PIECE only have their start added */
+#define MAX_PIECE 16
+
+typedef struct multi_param
+{
+  int npatterns, maxpatterns;
+  char **patterns;
+  int *patlens;
+  param_struct **params;
+  /* The number of words used by the automaton and for each of them the
+     mask for each symbol, the first and last bits of each piece and the
+     pattern that each last bit belongs to */
+  int nwords;
+  multi_word (*Mask)[MAXSYM];
+  multi_word *firstbits, *lastbits;
+  int (*bitpattern)[MULTI_WORD_BITS];
+  int bitsused;
+  /* Patterns that cannot be split into pieces are always matched */
+  int *always;
+} multi_param;
+
+/* The matches found for each pattern of a multi_param */
+typedef struct multi_match_list
+{
+  int npatterns;
+  int_pair_list **matches;
+} multi_match_list;
+
+extern int_pair_list * add_ends(int start, int end, int errors, int_pair_list *matches);
 extern void printnstring(char *string, int start, int end);
 extern int_pair_list *agrepy(char *pat, int patlen, char *text, int textlen,
         int gotoends, param_struct *parampt);
 extern param_struct *compile(char* Pattern, int patlen, int NErrors);
+extern void free_compiled(param_struct *parampt);
+extern multi_param *multi_compile(void);
+extern void multi_add(multi_param *multipt, char *Pattern, int patlen, int NErrors);
+extern multi_match_list *agrepy_multi(multi_param *multipt, char *text, int textlen,
+        int gotoends, int witherrors, int fewest);
+extern void multi_free(multi_param *multipt);
 extern param_struct *sagrepy_compile(char* Pattern, int patlen, signed char NErrors);
 extern param_struct *lagrepy_compile(char* Pattern, int patlen, signed char NErrors);
 extern int_pair_list *exec_sagrepy(char *pat, int patlen, char *text, int textlen,
                 boolean gotoends, param_struct *parampt);
+extern int find_start_pos(char *patn, int patend, char *text, int textend, int max_errs,
+                int *firstok, int *nerrors, boolean gotoends);
 extern int_pair_list *exec_lagrepy(char *pat, int patlen, char *text, int textlen,
                 boolean gotoends, param_struct *parampt);
+extern param_struct *magrepy_compile(char* Pattern, int patlen, signed char NErrors);
+extern int_pair_list *exec_magrepy(char *pat, int patlen, char *text, int textlen,
+                boolean gotoends, param_struct *parampt);
 
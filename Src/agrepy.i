@@ -17,9 +17,11 @@
   retlist = PyList_New(plist -> npairs + 1);
   for(i=0; i<= plist -> npairs; i++)
     {
-    temp_tuple =  PyTuple_New(2);
+    temp_tuple =  PyTuple_New(2 + plist -> witherrors);
     PyTuple_SetItem(temp_tuple, 0, PyInt_FromLong(plist -> pairs[i].start));
     PyTuple_SetItem(temp_tuple, 1, PyInt_FromLong(plist -> pairs[i].end));
+    if(plist -> witherrors)
+      PyTuple_SetItem(temp_tuple, 2, PyInt_FromLong(plist -> pairs[i].errors));
     PyList_SetItem(retlist, i, temp_tuple);
     }
   free(plist -> pairs);
@@ -29,5 +31,46 @@
   
 
 
+%typemap(python, out) multi_match_list * {
+  multi_match_list *mlist = $1;
+  int_pair_list *plist;
+  PyObject *retlist, *patlist, *temp_tuple;
+  int i, j;
+
+  retlist = PyList_New(mlist -> npatterns);
+  for(j=0; j < mlist -> npatterns; j++)
+    {
+    plist = mlist -> matches[j];
+    if(plist == NULL)
+      {
+      Py_INCREF(Py_None);
+      PyList_SetItem(retlist, j, Py_None);
+      continue;
+      }
+    patlist = PyList_New(plist -> npairs + 1);
+    for(i=0; i<= plist -> npairs; i++)
+      {
+      temp_tuple =  PyTuple_New(2 + plist -> witherrors);
+      PyTuple_SetItem(temp_tuple, 0, PyInt_FromLong(plist -> pairs[i].start));
+      PyTuple_SetItem(temp_tuple, 1, PyInt_FromLong(plist -> pairs[i].end));
+      if(plist -> witherrors)
+        PyTuple_SetItem(temp_tuple, 2, PyInt_FromLong(plist -> pairs[i].errors));
+      PyList_SetItem(patlist, i, temp_tuple);
+      }
+    PyList_SetItem(retlist, j, patlist);
+    free(plist -> pairs);
+    free(plist);
+    }
+  free(mlist -> matches);
+  free(mlist);
+  return(retlist);
+}
+
+
 param_struct *compile(char* Pattern, int patlen, int NErrors);
+void free_compiled(param_struct *parampt);
 int_pair_list *agrepy(char *pat, int patlen, char *text, int textlen, int gotoends, param_struct *parampt);
+multi_param *multi_compile(void);
+void multi_add(multi_param *multipt, char *Pattern, int patlen, int NErrors);
+multi_match_list *agrepy_multi(multi_param *multipt, char *text, int textlen, int gotoends, int witherrors, int fewest);
+void multi_free(multi_param *multipt);
@@ -26,7 +26,7 @@ char * verify(register int m, register int n, register int D, char *pat, char *t
   register int m1 = m+1;
   char  *textend = text+n;
   char  *textrestart = text+m;  /* If nothing found, return this restart position */
-  int matchend;
+  int matchend, matcherrors;
   char *first_text_pos = NULL;
 
 #ifdef DEBUGDEBUG
@@ -101,8 +101,10 @@ printf("Verifying text positions %d to %d\n", text - textbegin, textend - textbe
       }
     if(last >= m)
       {
-      k = find_start_pos(pat, last - 1, textbegin, text - textbegin + D - d - 1, D, &matchend, gotoends);
-      *matches = add_ends(k , matchend, *matches);
+      k = find_start_pos(pat, last - 1, textbegin, text - textbegin + D - d - 1, D, &matchend, &matcherrors, gotoends);
+      if(matcherrors > D)
+        matcherrors = -1;
+      *matches = add_ends(k , matchend, matcherrors, *matches);
       return(textbegin + matchend + 1);
       }
 
@@ -172,8 +174,10 @@ printf("Verifying text positions %d to %d\n", text - textbegin, textend - textbe
       }
     if(last >= m)
       {
-      k = find_start_pos(pat, last - 1, textbegin, text - textbegin + D - d - 1, D, &matchend, gotoends);
-      *matches = add_ends(k , matchend, *matches);
+      k = find_start_pos(pat, last - 1, textbegin, text - textbegin + D - d - 1, D, &matchend, &matcherrors, gotoends);
+      if(matcherrors > D)
+        matcherrors = -1;
+      *matches = add_ends(k , matchend, matcherrors, *matches);
       return(textbegin + matchend + 1);
       }
     }
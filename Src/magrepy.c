@@ -0,0 +1,160 @@
+/* magrep is agrep for simple, i.e. non-RE patterns longer than the words
+   sagrep works in, with allowed number of errors 1..8
+
+   It uses Myers' bit-vector algorithm (G. Myers, A fast bit-vector
+   algorithm for approximate string matching based on dynamic programming,
+   JACM 46(3), 1999), with the pattern split into blocks of 64 bits, so
+   there is no limit on the length of the pattern. The columns of the
+   edit distance table of the pattern against the text are computed a
+   text character at a time, and wherever the whole pattern matches with
+   at most the allowed errors the start of the match is found by aligning
+   the pattern backwards from its end. Unlike sagrep and lagrep the
+   matches found are exact: each is a best alignment of the whole pattern,
+   with the number of errors it contains */
+
+#include "agrepy.h"
+
+#define BLOCK_BITS MULTI_WORD_BITS
+#define HIGH_BIT (((multi_word) 1) << (BLOCK_BITS - 1))
+
+/* Advance one block of the column to the next text character, given the
+   pattern bits of the character, the change in score carried in from the
+   block above and the positive and negative vertical changes of the
+   block. Returns the change in score at the bottom row of the block,
+   whose bit is given */
+static int advance_block(multi_word Eq, int hin, multi_word *Pv, multi_word *Mv,
+			 multi_word lastbit)
+{
+  multi_word Xv, Xh, Ph, Mh;
+  int hout = 0;
+
+  Xv = Eq | *Mv;
+  if(hin < 0)
+    Eq |= 1;
+  Xh = (((Eq & *Pv) + *Pv) ^ *Pv) | Eq;
+  Ph = *Mv | ~(Xh | *Pv);
+  Mh = *Pv & Xh;
+  if(Ph & lastbit)
+    hout = 1;
+  else if(Mh & lastbit)
+    hout = -1;
+  Ph <<= 1;
+  Mh <<= 1;
+  if(hin < 0)
+    Mh |= 1;
+  else if(hin > 0)
+    Ph |= 1;
+  *Pv = Mh | ~(Xv | Ph);
+  *Mv = Ph & Xv;
+  return(hout);
+}
+
+/* Given that the whole pattern matches with errors errors ending at
+   text[end], find the start of the match by aligning the pattern
+   backwards from there. Of the starts that give the fewest errors the one
+   closest to the end is chosen, giving the most compact match */
+static int find_start(char *pat, int m, char *text, int end, int D, int errors)
+{
+  int *col = (int *) malloc((m + 1) * sizeof(int));
+  int i, j, diag, up, best = end + 1;
+
+  /* col[i] is the cost of the last i pattern characters against the text
+     from the current start to end; with no text it is i deletions */
+  for(i=0; i<=m; i++)
+    col[i] = i;
+  for(j=end; j>=0 && j>=end-m-D; j--)
+    {
+    diag = col[0];
+    col[0] = 0;
+    for(i=1; i<=m; i++)
+      {
+      up = col[i];
+      col[i] = diag + (pat[m-i] != text[j]);
+      if(up + 1 < col[i])
+	col[i] = up + 1;
+      if(col[i-1] + 1 < col[i])
+	col[i] = col[i-1] + 1;
+      diag = up;
+      }
+    if(col[m] <= errors)
+      {
+      best = j;
+      break;
+      }
+    }
+  free(col);
+  return(best);
+}
+
+int_pair_list *exec_magrepy(char *pat, int m, char *text, int textlen,
+		boolean gotoends, param_struct *parampt)
+{
+  int D = parampt -> magrep.NErrors, nblocks = parampt -> magrep.nblocks;
+  multi_word *Peq = parampt -> magrep.Peq;
+  multi_word *Pv = (multi_word *) malloc(nblocks * sizeof(multi_word));
+  multi_word *Mv = (multi_word *) malloc(nblocks * sizeof(multi_word));
+  multi_word lastbit = ((multi_word) 1) << ((m - 1) % BLOCK_BITS);
+  int b, j, hin, score = m, best_end = -1, best_score = D + 1;
+  multi_word *Eq;
+  int_pair_list *matches = NULL;
+
+  for(b=0; b<nblocks; b++)
+    {
+    Pv[b] = ~((multi_word) 0);
+    Mv[b] = 0;
+    }
+  for(j=0; j<=textlen; j++)
+    {
+    if(j < textlen)
+      {
+      /* the top row of the table is 0, as a match can start anywhere */
+      Eq = Peq + ((unsigned char) text[j]) * nblocks;
+      hin = 0;
+      for(b=0; b<nblocks-1; b++)
+	hin = advance_block(Eq[b], hin, &Pv[b], &Mv[b], HIGH_BIT);
+      score += advance_block(Eq[b], hin, &Pv[b], &Mv[b], lastbit);
+      if(score <= D)
+	{
+	/* of a run of ends that match keep the one with the fewest errors */
+	if(score < best_score)
+	  {
+	  best_score = score;
+	  best_end = j;
+	  }
+	continue;
+	}
+      }
+    if(best_end >= 0)
+      {
+      matches = add_ends(find_start(pat, m, text, best_end, D, best_score),
+			 best_end, best_score, matches);
+      best_end = -1;
+      best_score = D + 1;
+      }
+    }
+  free(Pv);
+  free(Mv);
+  if(matches != NULL)
+    matches -> pairs = (int_pair *) realloc(matches -> pairs, (matches -> npairs + 1) * sizeof(int_pair));
+  return(matches);
+}
+
+/* The pattern bits for each symbol are kept in the same block of memory
+   as the parameters, so that they are freed along with them */
+param_struct *magrepy_compile(char* Pattern, int patlen, signed char NErrors)
+{
+  int nblocks = (patlen + BLOCK_BITS - 1) / BLOCK_BITS, i;
+  param_struct *parampt = (param_struct *) malloc(sizeof(param_struct) +
+					MAXSYM * nblocks * sizeof(multi_word));
+  multi_word *Peq = (multi_word *) (parampt + 1);
+
+  parampt -> magrep.NErrors = NErrors;
+  parampt -> magrep.nblocks = nblocks;
+  parampt -> magrep.Peq = Peq;
+  for(i=0; i<MAXSYM * nblocks; i++)
+    Peq[i] = 0;
+  for(i=0; i<patlen; i++)
+    Peq[((unsigned char) Pattern[i]) * nblocks + i / BLOCK_BITS] |=
+      ((multi_word) 1) << (i % BLOCK_BITS);
+  return(parampt);
+}
@@ -170,13 +170,14 @@ int find_start_pos_main(char *patn, int patend, char *text, int textend, int *la
 }
 
 int find_start_pos(char *patn, int patend, char *text, int textend, int max_errs,
-		int *firstok, boolean gotoends)
+		int *firstok, int *nerrors, boolean gotoends)
 {
-  int nerrors = 0, lastpatok = patend, firstpatok = -1, textstart;
+  int errors = 0, lastpatok = patend, firstpatok = -1, textstart;
 
   *firstok = -1;
   textstart = find_start_pos_main(patn, patend, text, textend, &lastpatok, textend,
-				max_errs, &nerrors, firstok, &firstpatok);
+				max_errs, &errors, firstok, &firstpatok);
+  *nerrors = errors;
   if(! gotoends)  /* Assume extent is from first character match to last */
     return(textstart);
 
@@ -204,6 +205,9 @@ int_pair_list *exec_sagrepy(char *pat, int M, char *text, int text_len, boolean
   unsigned int Bit1;
   int match_start = -1, /* start of a match  */
       match_end = -1,
+      match_errors = -1, /* errors in the match found from its start, or -1 if
+			    they could not be counted (e.g. the pattern does not
+			    fit in a word) */
       NErrors = -1,	/* Actual number of errors <= D  */
       furthest = -1,	/* furthest point down a pattern achieved with D errors */
       wind_fwd = -1;	/* Match will stop short if actual number of errors < D, so
@@ -287,13 +291,15 @@ int_pair_list *exec_sagrepy(char *pat, int M, char *text, int text_len, boolean
 	if((k = furthest_zero(R1[D])) > furthest)
 	  furthest = k;
 	NErrors = D - NErrors;
-	match_start = find_start_pos(pat, furthest, text, i-1+NErrors, D, &match_end, gotoends);
+	match_start = find_start_pos(pat, furthest, text, i-1+NErrors, D, &match_end, &match_errors, gotoends);
+	if(match_errors > D || M > 8 * INT_BYTES)
+	  match_errors = -1;
 #ifdef DEBUG
 	printf("Match1 from %d to %d ",match_start, match_end);
 	printnstring(text, match_start, match_end);
 	putc('\n', stdout);
 #endif
-	matches = add_ends(match_start, match_end, matches);
+	matches = add_ends(match_start, match_end, match_errors, matches);
 	currentpos = i;
 	for(k=0; k<=D; k++)
 	    R1[k] = R2[k] = ~0;
@@ -322,13 +328,15 @@ int_pair_list *exec_sagrepy(char *pat, int M, char *text, int text_len, boolean
 	  furthest = k;
 
 	NErrors = D - NErrors;
-	match_start = find_start_pos(pat, furthest, text, i-1+NErrors, D, &match_end, gotoends);
+	match_start = find_start_pos(pat, furthest, text, i-1+NErrors, D, &match_end, &match_errors, gotoends);
+	if(match_errors > D || M > 8 * INT_BYTES)
+	  match_errors = -1;
 #ifdef DEBUG
 	printf("Match2 from %d to %d ",match_start,match_end);
 	printnstring(text, match_start, match_end);
 	putc('\n', stdout);
 #endif
-	matches = add_ends(match_start, match_end, matches);
+	matches = add_ends(match_start, match_end, match_errors, matches);
 	currentpos = i;
 	for(k=0; k<=D; k++)
 	    R1[k] = R2[k] = ~0;